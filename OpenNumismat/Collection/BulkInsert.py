@@ -0,0 +1,141 @@
+from PyQt5 import QtCore
+from PyQt5.QtGui import QImage
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import ImageFields
+from OpenNumismat.Collection.Photos import addPhoto
+from OpenNumismat.Collection.Previews import ImagePool
+from OpenNumismat.Collection.Sorting import nextSortId, SORT_STEP
+
+# Columns filled by inserter itself
+SERVICE_COLUMNS = ('id', 'image', 'sort_id', 'createdat', 'updatedat')
+
+
+class BulkInsertError(Exception):
+    pass
+
+
+class BulkInserter:
+    # Inserts many coins directly to DB bypassing model. Images of coins are
+    # resized and previews are created in worker threads while next coins
+    # are read by importer, and coins are saved in order of adding. Only a
+    # few coins are kept in memory at once. All coins are saved in one
+    # transaction, which is committed by finish() or rolled back by cancel()
+    # when import fails. BulkInsertError is raised when coin can't be saved.
+
+    def __init__(self, model):
+        self.model = model
+        self.db = model.database()
+        self.storage = model.collection.storage
+
+        self.columns = [field.name for field in model.fields
+                        if field.name not in SERVICE_COLUMNS]
+        self.count = 0
+
+        self._sortId = nextSortId(self.db) - SORT_STEP
+        currentTime = QtCore.QDateTime.currentDateTimeUtc()
+        self._time = currentTime.toString("yyyy-MM-ddTHH:mm:ss.zzz")
+
+        self._images = ImagePool(model.previewHeight(),
+                                 model.settings['ImageSideLen'],
+                                 model.IMAGE_FORMAT)
+
+        columns = self.columns + ['image', 'sort_id', 'createdat', 'updatedat']
+        self._insertQuery = QSqlQuery(self.db)
+        self._insertQuery.prepare("INSERT INTO coins (%s) VALUES (%s)" % (
+            ','.join(columns), ','.join('?' * len(columns))))
+        self._previewQuery = QSqlQuery(self.db)
+        self._previewQuery.prepare("INSERT INTO images (image) VALUES (?)")
+
+        self.db.transaction()
+
+    def insertRecord(self, record):
+        # Insert record filled as for appending to model
+        values = {}
+        images = {}
+        for i in range(record.count()):
+            name = record.fieldName(i)
+            if name in ImageFields:
+                image = self.__imageData(record.value(i))
+                if image:
+                    title = None
+                    if record.contains(name + '_title'):
+                        title = record.value(name + '_title')
+                    images[name] = (image, title or None)
+            elif not record.isNull(i):
+                values[name] = record.value(i)
+
+        self.insert(values, images)
+
+    def __imageData(self, image):
+        if isinstance(image, QImage):
+            # Converted by worker
+            if image.isNull():
+                return None
+            return image
+        elif isinstance(image, bytes):
+            return QtCore.QByteArray(image)
+        elif isinstance(image, QtCore.QByteArray):
+            return image
+
+        # Copying record as text (from Excel) store missed images as string
+        return None
+
+    def insert(self, values, images=None):
+        # values - dict with coin fields, images - dict with image (QImage or
+        # encoded data) and title for image fields. Coin is saved when its
+        # images are processed
+        if images is None:
+            images = {}
+
+        self._sortId += SORT_STEP
+
+        self._images.submit((self._sortId, values), images)
+        self.__insertProcessed(self._images.ready())
+
+    def finish(self):
+        try:
+            self.__insertProcessed(self._images.finish())
+        except Exception:
+            self.cancel()
+            raise
+
+        self._images.shutdown()
+        self.db.commit()
+
+        self.model.reloadData()
+
+    def cancel(self):
+        self._images.shutdown()
+        self.db.rollback()
+
+    def __insertProcessed(self, processed):
+        for (sort_id, values), (images, preview) in processed:
+            self.__insertCoin(sort_id, values, images, preview)
+
+    def __insertCoin(self, sort_id, values, images, preview):
+        query = self._insertQuery
+        for name in self.columns:
+            image, title, hash_ = images.get(name, (None, None, None))
+            if image:
+                query.addBindValue(addPhoto(self.db, image, title,
+                                            self.storage, hash_))
+            else:
+                query.addBindValue(values.get(name))
+
+        if preview:
+            self._previewQuery.addBindValue(preview)
+            self._previewQuery.exec_()
+            query.addBindValue(self._previewQuery.lastInsertId())
+        else:
+            query.addBindValue(None)
+
+        query.addBindValue(sort_id)
+        query.addBindValue(self._time)
+        query.addBindValue(self._time)
+        if not query.exec_():
+            # Photos and preview added for the coin are rolled back together
+            # with transaction
+            raise BulkInsertError(query.lastError().text())
+
+        self.count += 1
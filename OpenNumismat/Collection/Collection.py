@@ -1,14 +1,14 @@
-import codecs
-import json
+import hashlib
 import locale
 import os
-import shutil
+from collections import OrderedDict
 
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import *
-from PyQt5.QtGui import QImage, QPainter
-from PyQt5.QtCore import Qt, pyqtSignal, QCryptographicHash
+from PyQt5.QtGui import QImage, QPainter, QPixmap
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtSql import QSqlTableModel, QSqlDatabase, QSqlQuery, QSqlField
+from PyQt5.QtSql import QSqlRecord
 
 from OpenNumismat.Collection.CollectionFields import CollectionFieldsBase
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
@@ -21,21 +21,131 @@ from OpenNumismat.Reference.Reference import Reference
 from OpenNumismat.Reference.Reference import CrossReferenceSection
 from OpenNumismat.Reference.ReferenceDialog import AllReferenceDialog
 from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
-from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.CollectionFields import Statuses, StatusesOrder
 from OpenNumismat.Collection.VersionUpdater import updateCollection
+from OpenNumismat.Collection.SearchIndex import createSearchIndex, SearchWorker
+from OpenNumismat.Collection.SearchIndex import updateSearchIndex
+from OpenNumismat.Collection.Indexes import updateIndexes
+from OpenNumismat.Collection.Photos import addPhoto, copyPhoto, releasePhoto
+from OpenNumismat.Collection.Photos import createPhotosTable, getPhoto
+from OpenNumismat.Collection.Photos import acquirePhoto, photosInfo
+from OpenNumismat.Collection.Photos import PhotoStorage, photosPath
+from OpenNumismat.Collection.Photos import moveToStorage, moveFromStorage
+from OpenNumismat.Collection.Previews import createPreview, PreviewPool
+from OpenNumismat.Collection.Previews import encodeImage
+from OpenNumismat.Collection.Sorting import nextSortId, sortIdNear
+from OpenNumismat.Collection.Sorting import setSortOrder
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
 from OpenNumismat.Tools import Gui
 from OpenNumismat.Settings import Settings, BaseSettings
 from OpenNumismat import version
 from OpenNumismat.Collection.Export import ExportDialog
+from OpenNumismat.Collection.JsonExport import JsonExporter
+from OpenNumismat.Collection.JsonImport import JsonImporter
+from OpenNumismat.Collection.BulkInsert import BulkInsertError
 from OpenNumismat.Tools.Converters import numberWithFraction, htmlToPlainText
+from OpenNumismat.Tools.PixmapCache import PixmapCache
+
+
+class LazyRecord(QSqlRecord):
+    # Record of collection model with images read from database on first
+    # access. Image unchanged after reading is saved by its id, so records
+    # can be compared and updated without loading of all photos.
+
+    def __init__(self, record, model):
+        super().__init__(record)
+
+        self._model = model
+        # Field name -> (table, id) of not loaded image
+        self._pending = {}
+        # Field name -> value for comparing unchanged stored value
+        self._stored = {}
+
+    def _name(self, field):
+        if isinstance(field, int):
+            return self.fieldName(field)
+        return field
+
+    def setPending(self, name, table, img_id, key):
+        super().setNull(name)
+        self._pending[name] = (table, img_id)
+        self._stored[name] = key
+
+    def setStored(self, name, value):
+        super().setValue(name, value)
+        self._stored[name] = value
+
+    def isStored(self, field):
+        return self._name(field) in self._stored
+
+    def storedValue(self, field):
+        # Value for comparing records: unchanged image is represented by
+        # hash of photo instead of its data
+        name = self._name(field)
+        if name in self._stored:
+            return self._stored[name]
+
+        return self.value(field)
+
+    def value(self, field):
+        name = self._name(field)
+        if name in self._pending:
+            table, img_id = self._pending.pop(name)
+            if table == 'images':
+                data = self._model.getPreviewImage(img_id)
+            else:
+                data = self._model.getImage(img_id)
+            super().setValue(name, data)
+
+        return super().value(field)
+
+    def isNull(self, field):
+        if self._name(field) in self._pending:
+            return False
+
+        return super().isNull(field)
+
+    def setValue(self, field, value):
+        name = self._name(field)
+        if name in self._stored:
+            # Setting of the same value (title) keeps it unchanged
+            if name in self._pending or super().value(name) != value:
+                self._pending.pop(name, None)
+                del self._stored[name]
+
+        super().setValue(field, value)
+
+    def setNull(self, field):
+        name = self._name(field)
+        self._pending.pop(name, None)
+        self._stored.pop(name, None)
+
+        super().setNull(field)
+
+    def remove(self, pos):
+        name = self.fieldName(pos)
+        self._pending.pop(name, None)
+        self._stored.pop(name, None)
+
+        super().remove(pos)
+
+
+def isStored(record, name):
+    return isinstance(record, LazyRecord) and record.isStored(name)
 
 
 class CollectionModel(QSqlTableModel):
     rowInserted = pyqtSignal(object)
     modelChanged = pyqtSignal()
+    recordsChanged = pyqtSignal(object, object)
     IMAGE_FORMAT = 'jpg'
     SQLITE_READONLY = '8'
+    # Max count of rows with formatted values stored in display cache
+    DISPLAY_CACHE_ROWS = 2000
+    # Above this count of changed records only reloading is reported
+    MAX_CHANGED_RECORDS = 500
+    # Count of recalculated preview images saved in one transaction
+    PREVIEW_BATCH_SIZE = 500
 
     def __init__(self, collection, parent=None):
         super().__init__(parent, collection.db)
@@ -43,11 +153,37 @@ class CollectionModel(QSqlTableModel):
         self.intFilter = ''
         self.extFilter = ''
         self.searchFilter = ''
-
+        self._orderBy = ''
+        # Column name -> (data revision, column contains text)
+        self._textColumns = {}
+        self._searchWorker = None
+        self._searchGeneration = 0
+        # Temporary table with found ids, search query and revision of
+        # collection for which they were found
+        self._searchTable = None
+        self._searchQuery = ''
+        self._searchRevision = None
+
+        self._displayCache = OrderedDict()
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+        # Changes waiting for submit: records before changing, ids of
+        # changed records and max id before inserting
+        self._oldRecords = []
+        self._changedIds = set()
+        self._insertedAfter = None
+        self._submitting = False
+
+        # Default height of list row
+        self._rowHeight = None
+
+        self.collection = collection
         self.reference = collection.reference
         self.fields = collection.fields
         self.description = collection.description
         self.settings = collection.settings
+        self.imageCache = collection.imageCache
         self.proxy = None
 
         self.rowsInserted.connect(self.rowsInsertedEvent)
@@ -59,6 +195,33 @@ class CollectionModel(QSqlTableModel):
         self.insertedRowIndex = self.index(end, 0)
 
     def data(self, index, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.UserRole):
+            field = self.fields.fields[index.column()]
+            if field.type in Type.ImageTypes:
+                return self._data(index, role)
+
+            row = index.row()
+            key = (index.column(), role)
+            rowCache = self._displayCache.get(row)
+            if rowCache is not None:
+                if key in rowCache:
+                    self.cacheHits += 1
+                    self._displayCache.move_to_end(row)
+                    return rowCache[key]
+            else:
+                rowCache = {}
+                self._displayCache[row] = rowCache
+                if len(self._displayCache) > self.DISPLAY_CACHE_ROWS:
+                    self._displayCache.popitem(last=False)
+
+            self.cacheMisses += 1
+            value = self._data(index, role)
+            rowCache[key] = value
+            return value
+
+        return self._data(index, role)
+
+    def _data(self, index, role=Qt.DisplayRole):
         if role == Qt.DisplayRole:
             # Localize values
             data = super().data(index, role)
@@ -141,6 +304,19 @@ class CollectionModel(QSqlTableModel):
     def dataDisplayRole(self, index):
         return super().data(index, Qt.DisplayRole)
 
+    def clearDisplayCache(self, row=None):
+        if row is None:
+            self._displayCache.clear()
+        else:
+            self._displayCache.pop(row, None)
+
+    def cacheHitRate(self):
+        total = self.cacheHits + self.cacheMisses
+        if total:
+            return self.cacheHits / total
+
+        return 0.
+
     def addCoin(self, record, parent=None):
         record.setNull('id')  # remove ID value from record
         if not record.value('status'):
@@ -166,26 +342,23 @@ class CollectionModel(QSqlTableModel):
         record.setNull('id')  # remove ID value from record
         record.setValue('createdat', record.value('updatedat'))
 
-        query = QSqlQuery("SELECT MAX(sort_id) FROM coins", self.database())
-        query.first()
-        sort_id = query.record().value(0)
-        if not sort_id:
-            sort_id = 0
-        record.setValue('sort_id', sort_id + 1)
+        record.setValue('sort_id', nextSortId(self.database()))
 
         self.database().transaction()
         for field in ImageFields:
-            value = record.value(field)
-            if value:
-                query = QSqlQuery(self.database())
-                query.prepare("INSERT INTO photos (title, image) VALUES (?, ?)")
-                query.addBindValue(record.value(field + '_title'))
-                query.addBindValue(value)
-                query.exec_()
-
-                img_id = query.lastInsertId()
+            img_id = record.value(field + '_id')
+            if (img_id and isStored(record, field) and
+                    isStored(record, field + '_title')):
+                # Copy of stored photo is one more reference to it
+                acquirePhoto(self.database(), img_id)
             else:
-                img_id = None
+                value = record.value(field)
+                if value:
+                    img_id = addPhoto(self.database(), value,
+                                      record.value(field + '_title'),
+                                      self.collection.storage)
+                else:
+                    img_id = None
 
             record.setValue(field, img_id)
             record.remove(record.indexOf(field + '_id'))
@@ -206,40 +379,40 @@ class CollectionModel(QSqlTableModel):
         record.setValue('image', img_id)
         record.remove(record.indexOf('image_id'))
 
+        # Inserted row shifts all following rows
+        self.clearDisplayCache()
+
+        if self._insertedAfter is None:
+            query = QSqlQuery("SELECT MAX(id) FROM coins", self.database())
+            query.first()
+            self._insertedAfter = query.record().value(0) or 0
+
         return super().insertRecord(row, record)
 
     def setRecord(self, row, record):
+        self._oldRecords.append(super().record(row))
+        self._changedIds.add(record.value('id'))
         self._updateRecord(record)
 
         self.database().transaction()
-        # TODO : check that images was realy changed
         for field in ImageFields:
-            img_id = record.value(field + '_id')
-            value = record.value(field)
-            if not value:
-                if img_id:
-                    query = QSqlQuery(self.database())
-                    query.prepare("DELETE FROM photos WHERE id=?")
-                    query.addBindValue(img_id)
-                    query.exec_()
-
-                    img_id = None
+            old_img_id = record.value(field + '_id')
+            if (old_img_id and isStored(record, field) and
+                    isStored(record, field + '_title')):
+                # Photo not loaded from DB is unchanged
+                img_id = old_img_id
             else:
-                if img_id:
-                    query = QSqlQuery(self.database())
-                    query.prepare("UPDATE photos SET title=?, image=? WHERE id=?")
-                    query.addBindValue(record.value(field + '_title'))
-                    query.addBindValue(record.value(field))
-                    query.addBindValue(img_id)
-                    query.exec_()
+                value = record.value(field)
+                if value:
+                    # Unchanged image gets the same id
+                    img_id = addPhoto(self.database(), value,
+                                      record.value(field + '_title'),
+                                      self.collection.storage)
                 else:
-                    query = QSqlQuery(self.database())
-                    query.prepare("INSERT INTO photos (title, image) VALUES (?, ?)")
-                    query.addBindValue(record.value(field + '_title'))
-                    query.addBindValue(record.value(field))
-                    query.exec_()
+                    img_id = None
 
-                    img_id = query.lastInsertId()
+                if old_img_id:
+                    releasePhoto(self.database(), old_img_id)
 
             if img_id:
                 record.setValue(field, img_id)
@@ -249,8 +422,10 @@ class CollectionModel(QSqlTableModel):
             record.remove(record.indexOf(field + '_title'))
 
         img_id = record.value('image_id')
-        value = record.value('image')
-        if not value:
+        if img_id and isStored(record, 'image'):
+            # Preview not recalculated for unchanged photos
+            pass
+        elif not record.value('image'):
             if img_id:
                 query = QSqlQuery(self.database())
                 query.prepare("DELETE FROM images WHERE id=?")
@@ -280,55 +455,56 @@ class CollectionModel(QSqlTableModel):
             record.setNull('image')
         record.remove(record.indexOf('image_id'))
 
+        self.clearDisplayCache(row)
+
         return super().setRecord(row, record)
 
     def record(self, row=-1):
         if row >= 0:
-            record = super().record(row)
+            record = LazyRecord(super().record(row), self)
         else:
-            record = super().record()
+            record = LazyRecord(super().record(), self)
+
+        # Titles of all photos are read by one query, images are read
+        # on first access to record value
+        ids = [record.value(field) for field in ImageFields
+               if record.value(field)]
+        info = photosInfo(self.database(), ids)
 
         for field in ImageFields:
             record.append(QSqlField(field + '_title'))
             record.append(QSqlField(field + '_id'))
 
             img_id = record.value(field)
-            if img_id:
-                data = self.getImage(img_id)
-                record.setValue(field, data)
-                record.setValue(field + '_title', self.getImageTitle(img_id))
+            if img_id in info:
+                title, hash_ = info[img_id]
+                record.setPending(field, 'photos', img_id,
+                                  ('photos', hash_ or img_id))
+                record.setStored(field + '_title', title)
                 record.setValue(field + '_id', img_id)
             else:
-                record.setValue(field, None)
+                record.setStored(field, None)
+                record.setStored(field + '_title', None)
 
         record.append(QSqlField('image_id'))
         img_id = record.value('image')
         if img_id:
-            data = self.getPreviewImage(img_id)
-            record.setValue('image', data)
+            record.setPending('image', 'images', img_id, ('images', img_id))
             record.setValue('image_id', img_id)
         else:
-            record.setValue('image', None)
+            record.setStored('image', None)
 
         return record
 
     def removeRow(self, row):
         record = super().record(row)
+        self._oldRecords.append(record)
 
-        ids = []
         for field in ImageFields:
             value = record.value(field)
             if value:
-                ids.append(value)
-
-        if ids:
-            ids_sql = '(' + ','.join('?' * len(ids)) + ')'
-
-            query = QSqlQuery(self.database())
-            query.prepare("DELETE FROM photos WHERE id IN " + ids_sql)
-            for id_ in ids:
-                query.addBindValue(id_)
-            query.exec_()
+                releasePhoto(self.database(), value)
+                self.imageCache.remove(('photos', value))
 
         value = record.value('image')
         if value:
@@ -337,14 +513,158 @@ class CollectionModel(QSqlTableModel):
             query.addBindValue(value)
             query.exec_()
 
+            self.imageCache.remove(('images', value))
+
+        self.clearDisplayCache()
+
         return super().removeRow(row)
 
+    def recordId(self, row):
+        return super().data(self.index(row, self.fieldIndex('id')))
+
+    def __selectIds(self, ids):
+        # Ids of processed coins for set-based statements
+        db = self.database()
+        QSqlQuery("CREATE TEMP TABLE IF NOT EXISTS selected_ids"
+                  " (id INTEGER PRIMARY KEY)", db)
+        QSqlQuery("DELETE FROM temp.selected_ids", db)
+
+        query = QSqlQuery(db)
+        query.prepare("INSERT OR IGNORE INTO temp.selected_ids (id) VALUES (?)")
+        query.addBindValue(list(ids))
+        return query.execBatch()
+
+    def __commitBulk(self):
+        self.database().commit()
+        self.reloadData()
+
+        return True
+
+    def reloadData(self):
+        # Data was changed directly in DB - changed rows are not tracked
+        self.__clearChanges()
+        self.collection.dataRevision += 1
+        self.recordsChanged.emit(None, None)
+        self.select()
+
+    def bulkValues(self, record, usedFields):
+        # Values of multi edited record that should be saved. Changed images
+        # require recalculating preview of every coin, so None is returned
+        # and records should be saved one by one
+        values = {}
+        for i in range(record.count()):
+            name = record.fieldName(i)
+            if usedFields[i] != Qt.Checked or isStored(record, name):
+                continue
+            if name in ('id', 'updatedat', 'image_id'):
+                continue
+            if name.endswith('_id') and name[:-3] in ImageFields:
+                continue
+
+            if (name == 'image' or name in ImageFields or
+                    (name.endswith('_title') and name[:-6] in ImageFields)):
+                return None
+
+            values[name] = record.value(i)
+
+        return values
+
+    @waitCursorDecorator
+    def updateRecords(self, ids, values):
+        # Set the same values to many coins by one statement
+        if not ids or not values:
+            return True
+
+        db = self.database()
+        db.transaction()
+        if not self.__selectIds(ids):
+            db.rollback()
+            return False
+
+        columns = ["%s=?" % name for name in values]
+        columns.append("updatedat=strftime('%Y-%m-%dT%H:%M:%f', 'now')")
+        query = QSqlQuery(db)
+        query.prepare("UPDATE coins SET " + ','.join(columns) +
+                      " WHERE id IN (SELECT id FROM temp.selected_ids)")
+        for value in values.values():
+            query.addBindValue(value)
+        if not query.exec_():
+            db.rollback()
+            self.__showSaveError(query.lastError())
+            return False
+
+        return self.__commitBulk()
+
+    @waitCursorDecorator
+    def removeRecords(self, ids):
+        # Remove many coins with their photos and previews
+        if not ids:
+            return True
+
+        db = self.database()
+        db.transaction()
+        if not self.__selectIds(ids):
+            db.rollback()
+            return False
+
+        selected = "SELECT id FROM temp.selected_ids"
+        photos = ' UNION ALL '.join(
+            "SELECT %s AS img_id FROM coins WHERE id IN (%s)" % (field, selected)
+            for field in ImageFields)
+
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        query.exec_("SELECT image FROM coins WHERE image IS NOT NULL"
+                    " AND id IN (%s)" % selected)
+        while query.next():
+            self.imageCache.remove(('images', query.record().value(0)))
+
+        queries = [
+            "DROP TABLE IF EXISTS temp.released_photos",
+            # Every photo loses references of all removed coins at once
+            "CREATE TEMP TABLE released_photos AS"
+            " SELECT img_id, COUNT(*) AS refs FROM (%s)"
+            " WHERE img_id IS NOT NULL GROUP BY img_id" % photos,
+            "UPDATE photos SET refs=ifnull(refs,1)-(SELECT refs"
+            " FROM temp.released_photos WHERE img_id=photos.id)"
+            " WHERE id IN (SELECT img_id FROM temp.released_photos)",
+            "DELETE FROM photos WHERE refs<=0"
+            " AND id IN (SELECT img_id FROM temp.released_photos)",
+            "DELETE FROM images WHERE id IN"
+            " (SELECT image FROM coins WHERE id IN (%s))" % selected,
+            "DELETE FROM coins WHERE id IN (%s)" % selected,
+        ]
+        for sql in queries:
+            if not query.exec_(sql):
+                db.rollback()
+                self.__showSaveError(query.lastError())
+                return False
+
+        query.exec_("SELECT img_id FROM temp.released_photos")
+        while query.next():
+            self.imageCache.remove(('photos', query.record().value(0)))
+        query.exec_("DROP TABLE IF EXISTS temp.released_photos")
+
+        return self.__commitBulk()
+
     def _updateRecord(self, record):
         if self.proxy:
             self.proxy.setDynamicSortFilter(False)
 
+        # Drop cached pixmaps of images that will be overwritten
+        for field in ImageFields:
+            img_id = record.value(field + '_id')
+            if img_id and not isStored(record, field):
+                self.imageCache.remove(('photos', img_id))
+        img_id = record.value('image_id')
+        if img_id and not isStored(record, 'image'):
+            self.imageCache.remove(('images', img_id))
+
         for field in self.fields.userFields:
             if field.type == Type.Image:
+                if isStored(record, field.name):
+                    continue
+
                 # Convert image to DB format
                 image = record.value(field.name)
                 if isinstance(image, str):
@@ -352,20 +672,9 @@ class CollectionModel(QSqlTableModel):
                     # as string
                     record.setNull(field.name)
                 elif isinstance(image, QImage):
-                    ba = QtCore.QByteArray()
-                    buffer = QtCore.QBuffer(ba)
-                    buffer.open(QtCore.QIODevice.WriteOnly)
-
                     # Resize big images for storing in DB
-                    sideLen = self.settings['ImageSideLen']
-                    if sideLen > 0:
-                        maxWidth = sideLen
-                        maxHeight = sideLen
-                        if image.width() > maxWidth or image.height() > maxHeight:
-                            image = image.scaled(maxWidth, maxHeight,
-                                    Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
-                    image.save(buffer, self.IMAGE_FORMAT)
+                    ba = encodeImage(image, self.settings['ImageSideLen'],
+                                     self.IMAGE_FORMAT)
                     record.setValue(field.name, ba)
                 elif isinstance(image, bytes):
                     ba = QtCore.QByteArray(image)
@@ -377,48 +686,28 @@ class CollectionModel(QSqlTableModel):
         currentTime = QtCore.QDateTime.currentDateTimeUtc()
         record.setValue('updatedat', currentTime.toString("yyyy-MM-ddTHH:mm:ss.zzz"))
 
+    def previewHeight(self):
+        # Get height of list view for resizing images
+        if self._rowHeight is None:
+            tmp = QTableView()
+            self._rowHeight = tmp.verticalHeader().defaultSectionSize()
+
+        height_multiplex = self.settings['image_height']
+        return int(self._rowHeight * height_multiplex - 1)
+
     def _recalculateImage(self, record):
         # Creating preview image for list
+        if (isStored(record, 'image') and isStored(record, 'obverseimg') and
+                isStored(record, 'reverseimg')):
+            return
+
         if record.isNull('obverseimg') and record.isNull('reverseimg'):
             record.setNull('image')
         else:
-            # Get height of list view for resizing images
-            tmp = QTableView()
-            height_multiplex = self.settings['image_height']
-            height = int(tmp.verticalHeader().defaultSectionSize() * height_multiplex - 1)
-
-            obverseImage = QImage()
-            reverseImage = QImage()
-
-            if not record.isNull('obverseimg'):
-                obverseImage.loadFromData(record.value('obverseimg'))
-                obverseImage = obverseImage.scaledToHeight(height,
-                                                    Qt.SmoothTransformation)
-            if not record.isNull('reverseimg') and reverseImage.isNull():
-                reverseImage.loadFromData(record.value('reverseimg'))
-                reverseImage = reverseImage.scaledToHeight(height,
-                                                    Qt.SmoothTransformation)
-
-            image = QImage(obverseImage.width() + reverseImage.width(),
-                                 height, QImage.Format_RGB32)
-            image.fill(Qt.white)
-
-            paint = QPainter(image)
-            if not record.isNull('obverseimg'):
-                paint.drawImage(QtCore.QRectF(0, 0, obverseImage.width(), height), obverseImage,
-                                QtCore.QRectF(0, 0, obverseImage.width(), height))
-            if not record.isNull('reverseimg'):
-                paint.drawImage(QtCore.QRectF(obverseImage.width(), 0, reverseImage.width(), height), reverseImage,
-                                QtCore.QRectF(0, 0, reverseImage.width(), height))
-            paint.end()
-
-            ba = QtCore.QByteArray()
-            buffer = QtCore.QBuffer(ba)
-            buffer.open(QtCore.QIODevice.WriteOnly)
-
-            # Store as PNG for better view
-            image.save(buffer, 'png')
-            record.setValue('image', ba)
+            image = createPreview(record.value('obverseimg'),
+                                  record.value('reverseimg'),
+                                  self.previewHeight())
+            record.setValue('image', image)
 
     def moveRows(self, row1, row2):
         if self.proxy:
@@ -427,24 +716,15 @@ class CollectionModel(QSqlTableModel):
             sort_column_id = self.fields.sort_id.id
             self.sort(sort_column_id, Qt.AscendingOrder)
 
-        row_rang = []
         if row2 == -1:
-            row_rang = range(row1 + 1, self.rowCount())
-        elif row1 > row2:
-            row_rang = range(row1 - 1, row2 - 1, -1)
-        elif row1 < row2:
-            row_rang = range(row1 + 1, row2 + 1)
+            row2 = self.rowCount() - 1
 
-        if row_rang:
+        if row1 != row2:
+            # Only moved coin gets new position
             record = super().record(row1)
-            old_sort_id = record.value('sort_id')
-            for row in row_rang:
-                record1 = super().record(row)
-                sort_id = record1.value('sort_id')
-                record1.setValue('sort_id', old_sort_id)
-                super().setRecord(row, record1)
-                old_sort_id = sort_id
-            record.setValue('sort_id', old_sort_id)
+            sort_id = sortIdNear(self.database(), self.recordId(row2),
+                                 record.value('id'), row1 > row2)
+            record.setValue('sort_id', sort_id)
             super().setRecord(row1, record)
 
         self.submitAll()
@@ -454,18 +734,23 @@ class CollectionModel(QSqlTableModel):
 
     @waitCursorDecorator
     def setRowsPos(self, indexes):
-        sorted_ids = sorted([index.data(Qt.UserRole) for index in indexes])
-        for index, sort_id in zip(indexes, sorted_ids):
-            record = super().record(index.row())
-            record.setValue('sort_id', sort_id)
-            super().setRecord(index.row(), record)
+        db = self.database()
+        db.transaction()
+        ids = [self.recordId(index.row()) for index in indexes]
+        if not setSortOrder(db, ids):
+            db.rollback()
+            self.__showSaveError(db.lastError())
+            return False
 
-        self.submitAll()
+        return self.__commitBulk()
 
     def recalculateAllImages(self, parent=None):
-        while self.canFetchMore():
-            self.fetchMore()
-        rowCount = self.rowCount()
+        db = self.database()
+        storage = self.collection.storage
+
+        query = QSqlQuery("SELECT COUNT(*) FROM coins WHERE image IS NOT NULL", db)
+        query.first()
+        rowCount = query.record().value(0)
 
         if not parent:
             parent = self.parent()
@@ -473,53 +758,153 @@ class CollectionModel(QSqlTableModel):
         progressDlg = Gui.ProgressDialog(self.tr("Updating records"),
                                          self.tr("Cancel"), rowCount, parent)
 
-        self.database().transaction()
-
-        for row in range(rowCount):
-            progressDlg.step()
+        # Images are read here, previews are created by worker threads and
+        # written back by batches
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        query.exec_("SELECT coins.image, obverse.image, obverse.hash,\
+                reverse.image, reverse.hash FROM coins\
+            LEFT JOIN photos AS obverse ON obverse.id=coins.obverseimg\
+            LEFT JOIN photos AS reverse ON reverse.id=coins.reverseimg\
+            WHERE coins.image IS NOT NULL")
+
+        pool = PreviewPool(self.previewHeight())
+        batch = []
+        while query.next():
             if progressDlg.wasCanceled():
                 break
 
-            record = self.record(row)
-            self._recalculateImage(record)
-            img_id = record.value('image_id')
-            value = record.value('image')
-            if value and img_id:
-                query = QSqlQuery(self.database())
-                query.prepare("UPDATE images SET image=? WHERE id=?")
-                query.addBindValue(record.value('image'))
-                query.addBindValue(img_id)
-                query.exec_()
+            record = query.record()
+            images = []
+            for i in (1, 3):
+                if record.isNull(i) and storage and not record.isNull(i + 1):
+                    images.append(storage.read(record.value(i + 1)))
+                elif record.isNull(i):
+                    images.append(None)
+                else:
+                    images.append(record.value(i))
+            pool.submit(record.value(0), *images)
+
+            for img_id, image in pool.ready():
+                progressDlg.step()
+                if image:
+                    batch.append((img_id, image))
+            if len(batch) >= self.PREVIEW_BATCH_SIZE:
+                self.__savePreviews(batch)
+                batch = []
+
+        if progressDlg.wasCanceled():
+            pool.shutdown()
+        else:
+            for img_id, image in pool.finish():
+                progressDlg.step()
+                if image:
+                    batch.append((img_id, image))
+            pool.shutdown()
 
         progressDlg.setLabelText(self.tr("Saving..."))
 
-        self.database().commit()
+        self.__savePreviews(batch)
+
+        self.imageCache.clear()
 
         progressDlg.reset()
 
+    def __savePreviews(self, previews):
+        if not previews:
+            return
+
+        db = self.database()
+        db.transaction()
+
+        query = QSqlQuery(db)
+        query.prepare("UPDATE images SET image=? WHERE id=?")
+        query.addBindValue([image for _img_id, image in previews])
+        query.addBindValue([img_id for img_id, _image in previews])
+        query.execBatch()
+
+        db.commit()
+
     def submitAll(self):
+        self.clearDisplayCache()
+
+        # Changes are reported from select() called by successful submitting
+        self._submitting = True
         ret = super().submitAll()
+        if self._submitting:
+            self._submitting = False
+            self.__clearChanges()
+
         if not ret:
-            if self.lastError().nativeErrorCode() == self.SQLITE_READONLY:
-                message = self.tr("file is readonly")
-            else:
-                message = self.lastError().databaseText()
-            QMessageBox.critical(
-                self.parent(), self.tr("Saving"),
-                self.tr("Can't save data: %s") % message)
+            self.__showSaveError(self.lastError())
 
         if self.proxy:
             self.proxy.setDynamicSortFilter(True)
 
         return ret
 
+    def __showSaveError(self, error):
+        if error.nativeErrorCode() == self.SQLITE_READONLY:
+            message = self.tr("file is readonly")
+        else:
+            message = error.databaseText()
+        QMessageBox.critical(
+            self.parent(), self.tr("Saving"),
+            self.tr("Can't save data: %s") % message)
+
     def select(self):
+        if self._submitting:
+            self._submitting = False
+            self.__emitChanges()
+
+        self.clearDisplayCache()
+        self.__refreshSearch()
+
         ret = super().select()
 
         self.modelChanged.emit()
 
         return ret
 
+    def __clearChanges(self):
+        self._oldRecords = []
+        self._changedIds = set()
+        self._insertedAfter = None
+
+    def __emitChanges(self):
+        oldRecords = self._oldRecords
+        ids = [str(int(id_)) for id_ in self._changedIds if id_]
+        insertedAfter = self._insertedAfter
+        self.__clearChanges()
+
+        if not oldRecords and insertedAfter is None:
+            return
+
+        self.collection.dataRevision += 1
+
+        if len(oldRecords) > self.MAX_CHANGED_RECORDS:
+            self.recordsChanged.emit(None, None)
+            return
+
+        # Saved records are read back to get values as they stored in DB
+        conditions = []
+        if ids:
+            conditions.append("id IN (%s)" % ','.join(ids))
+        if insertedAfter is not None:
+            conditions.append("id > %d" % insertedAfter)
+
+        newRecords = []
+        if conditions:
+            sql = "SELECT * FROM coins WHERE " + ' OR '.join(conditions)
+            query = QSqlQuery(sql, self.database())
+            while query.next():
+                if len(newRecords) >= self.MAX_CHANGED_RECORDS:
+                    self.recordsChanged.emit(None, None)
+                    return
+                newRecords.append(query.record())
+
+        self.recordsChanged.emit(oldRecords, newRecords)
+
     def columnType(self, column):
         if isinstance(column, QtCore.QModelIndex):
             column = column.column()
@@ -533,12 +918,7 @@ class CollectionModel(QSqlTableModel):
         return self.fields.fields[column].name
 
     def getImage(self, img_id):
-        query = QSqlQuery(self.database())
-        query.prepare("SELECT image FROM photos WHERE id=?")
-        query.addBindValue(img_id)
-        query.exec_()
-        if query.first():
-            return query.record().value(0)
+        return getPhoto(self.database(), img_id, self.collection.storage)
 
     def getPreviewImage(self, img_id):
         query = QSqlQuery(self.database())
@@ -548,6 +928,42 @@ class CollectionModel(QSqlTableModel):
         if query.first():
             return query.record().value(0)
 
+    def getPixmap(self, index, size=None):
+        # Returns image from cache. Image is decreased to size if it bigger
+        if self.columnType(index) == Type.PreviewImage:
+            table = 'images'
+        else:
+            table = 'photos'
+        img_id = super().data(index, Qt.DisplayRole)
+        if not img_id:
+            return None
+
+        key = (table, img_id)
+        if size:
+            size_key = (size.width(), size.height())
+        else:
+            size_key = None
+
+        pixmap = self.imageCache.find(key, size_key)
+        if pixmap is None:
+            if table == 'images':
+                data = self.getPreviewImage(img_id)
+            else:
+                data = self.getImage(img_id)
+
+            image = QImage()
+            if data:
+                image.loadFromData(data)
+            if size and (image.width() > size.width() or
+                         image.height() > size.height()):
+                image = image.scaled(size, Qt.KeepAspectRatio,
+                                     Qt.SmoothTransformation)
+
+            pixmap = QPixmap.fromImage(image)
+            self.imageCache.insert(key, pixmap, size_key)
+
+        return pixmap
+
     def getImageTitle(self, img_id):
         query = QSqlQuery(self.database())
         query.prepare("SELECT title FROM photos WHERE id=?")
@@ -557,8 +973,10 @@ class CollectionModel(QSqlTableModel):
             return query.record().value(0)
 
     def clearFilters(self):
+        self.cancelSearch()
         self.intFilter = ''
         self.searchFilter = ''
+        self.__dropSearchTable()
         self.__applyFilter()
 
     def setFilter(self, filter_):
@@ -570,9 +988,90 @@ class CollectionModel(QSqlTableModel):
         self.__applyFilter()
 
     def setSearchFilter(self, filter_):
+        self.cancelSearch()
         self.searchFilter = filter_
+        self.__dropSearchTable()
+        self.__applyFilter()
+
+    def search(self, filter_):
+        if not filter_:
+            self.setSearchFilter('')
+            return
+
+        # Previous query is superseded - its result will be dropped
+        self.cancelSearch()
+
+        worker = SearchWorker(self.database().databaseName(), filter_,
+                              self._searchGeneration)
+        worker.done.connect(self._searchFound)
+        self._searchWorker = worker
+        worker.submit(self)
+
+    def cancelSearch(self):
+        self._searchGeneration += 1
+        if self._searchWorker:
+            self._searchWorker.cancel()
+            self._searchWorker = None
+
+    def _searchFound(self, generation, ids):
+        if generation != self._searchGeneration:
+            return
+
+        filter_ = self._searchWorker.filter
+        self._searchWorker = None
+
+        self.__dropSearchTable()
+        resultFilter = None
+        if ids is not None:
+            resultFilter = self.__searchResultFilter(ids)
+
+        if resultFilter is None:
+            # Database is locked or search failed - filter in main connection
+            self.searchFilter = filter_
+        else:
+            self.searchFilter = resultFilter
+            self._searchQuery = filter_
+            self._searchRevision = self.collection.dataRevision
         self.__applyFilter()
 
+    def __searchResultFilter(self, ids):
+        # Keep found ids in temporary table to keep filter string short.
+        # Table name depends on found ids, so filter string (used as key by
+        # statistics caches) is changed with search result
+        digest = hashlib.md5(','.join(map(str, ids)).encode()).hexdigest()
+        table = 'search_%d_%s' % (id(self), digest[:16])
+        db = self.database()
+
+        # Table isn't created inside transaction opened by other code (bulk
+        # import) - it could be rolled back or committed there
+        if not db.transaction():
+            return None
+
+        QSqlQuery("CREATE TEMP TABLE %s (id INTEGER PRIMARY KEY)" % table, db)
+        if ids:
+            query = QSqlQuery(db)
+            query.prepare("INSERT INTO temp.%s (id) VALUES (?)" % table)
+            query.addBindValue(ids)
+            query.execBatch()
+        db.commit()
+
+        self._searchTable = table
+        return "id IN (SELECT id FROM temp.%s)" % table
+
+    def __dropSearchTable(self):
+        if self._searchTable:
+            QSqlQuery("DROP TABLE IF EXISTS temp.%s" % self._searchTable,
+                      self.database())
+            self._searchTable = None
+            self._searchQuery = ''
+            self._searchRevision = None
+
+    def __refreshSearch(self):
+        # Found ids are stale after changing of coins - search again
+        if (self._searchTable and not self._searchWorker and
+                self._searchRevision != self.collection.dataRevision):
+            self.search(self._searchQuery)
+
     def __applyFilter(self):
         filters = []
         if self.intFilter:
@@ -592,6 +1091,68 @@ class CollectionModel(QSqlTableModel):
 
         super().setFilter(combinedFilter)
 
+    def sortExpression(self, column):
+        field = self.fields.fields[column]
+        if field.type == Type.Status:
+            cases = ["WHEN '%s' THEN %d" % (status, order)
+                     for status, order in StatusesOrder.items() if status]
+            return "CASE %s %s ELSE 0 END" % (field.name, ' '.join(cases))
+        elif field.type in (Type.String, Type.ShortString, Type.Text):
+            # SQLite collations can't be registered through QtSql, so strings
+            # are compared by QCollator in proxy model
+            return None
+        elif field.type in (Type.Number, Type.BigInt, Type.Money,
+                            Type.Value, Type.Denomination):
+            # Numeric column can hold text (year as "1890-1900"), SQLite
+            # places it after all numbers unlike QCollator in proxy model
+            if self.__hasTextValues(field.name):
+                return None
+            # Empty strings are ordered together with NULL
+            return "NULLIF(%s, '')" % field.name
+
+        return field.name
+
+    def __hasTextValues(self, name):
+        revision = self.collection.dataRevision
+        cached = self._textColumns.get(name)
+        if cached and cached[0] == revision:
+            return cached[1]
+
+        query = QSqlQuery(self.database())
+        query.exec_("SELECT 1 FROM coins WHERE typeof(%s)='text' AND %s<>''"
+                    " LIMIT 1" % (name, name))
+        result = query.first()
+        self._textColumns[name] = (revision, result)
+
+        return result
+
+    def setSortOrder(self, column, order=Qt.AscendingOrder):
+        if column >= 0:
+            expression = self.sortExpression(column)
+            if not expression:
+                return False
+
+            if order == Qt.DescendingOrder:
+                orderBy = "ORDER BY %s DESC" % expression
+            else:
+                orderBy = "ORDER BY %s ASC" % expression
+            if column != self.fields.sort_id.id:
+                orderBy += ", sort_id ASC"
+        else:
+            orderBy = ''
+
+        if orderBy != self._orderBy:
+            self._orderBy = orderBy
+            self.select()
+
+        return True
+
+    def orderByClause(self):
+        if self._orderBy:
+            return self._orderBy
+
+        return super().orderByClause()
+
     def isExist(self, record):
         fields = ('title', 'value', 'unit', 'country', 'period', 'ruler',
                   'year', 'mint', 'mintmark', 'type', 'series', 'subjectshort',
@@ -617,7 +1178,7 @@ class CollectionModel(QSqlTableModel):
 
 class CollectionSettings(BaseSettings):
     Default = {
-            'Version': 8,
+            'Version': 12,
             'Type': version.AppName,
             'Password': cryptPassword(),
             'ImageSideLen': 1024,
@@ -640,6 +1201,8 @@ class CollectionSettings(BaseSettings):
             'default_status': 'demo',
             'colnect_category': 'coins',
             'colnect_country': 0,
+            'auto_indexes': True,
+            'external_images': False,
     }
 
     def __init__(self, db):
@@ -659,7 +1222,8 @@ class CollectionSettings(BaseSettings):
                 elif title in ('image_height',):
                     value = float(record.value('value'))
                 elif title in ('free_numeric', 'convert_fraction',
-                               'images_at_bottom', 'enable_bc', 'rich_text'):
+                               'images_at_bottom', 'enable_bc', 'rich_text',
+                               'auto_indexes', 'external_images'):
                     value = record.value('value').lower() in ('true', '1')
                 elif '_status_used' in title:
                     value = record.value('value').lower() in ('true', '1')
@@ -707,18 +1271,32 @@ class CollectionSettings(BaseSettings):
 
 
 class Collection(QtCore.QObject):
+    # Emitted after saving collection settings
+    settingsChanged = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.db = QSqlDatabase.addDatabase('QSQLITE')
         self._pages = None
         self.fileName = None
+        # External storage of photos or None when photos stored in database
+        self.storage = None
+        # Incremented after each saving of coins
+        self.dataRevision = 0
+
+        cache_size = Settings()['image_cache_size']
+        self.imageCache = PixmapCache(cache_size * 1024 * 1024)
 
     def isOpen(self):
         return self.db.isValid() and self.fileName
 
     def open(self, fileName):
         self.fileName = None
+        self.storage = None
+        self.imageCache.clear()
+        # File could be changed outside since it was opened last time
+        self.dataRevision += 1
 
         file = QtCore.QFileInfo(fileName)
         if file.isFile():
@@ -754,6 +1332,9 @@ class Collection(QtCore.QObject):
                             "Please update OpenNumismat") % fileName)
             return False
 
+        if self.settings['external_images']:
+            self.storage = PhotoStorage(photosPath(fileName))
+
         if self.settings['Password'] != cryptPassword():
             dialog = PasswordDialog(
                 self.settings['Password'], self.getCollectionName(),
@@ -774,12 +1355,18 @@ class Collection(QtCore.QObject):
 
         self.description = CollectionDescription(self)
 
+        updateSearchIndex(self.db)
+        if self.settings['auto_indexes']:
+            updateIndexes(self.db, self.fields)
+
         self.__speedup()
 
         return True
 
     def create(self, fileName):
         self.fileName = None
+        self.storage = None
+        self.imageCache.clear()
 
         if QtCore.QFileInfo(fileName).exists():
             QMessageBox.critical(self.parent(),
@@ -805,6 +1392,9 @@ class Collection(QtCore.QObject):
 
         self.description = CollectionDescription(self)
 
+        if self.settings['auto_indexes']:
+            updateIndexes(self.db, self.fields)
+
         self.__speedup()
 
         self.fileName = fileName
@@ -835,12 +1425,13 @@ class Collection(QtCore.QObject):
         sql = "CREATE TABLE coins (" + ", ".join(sqlFields) + ")"
         QSqlQuery(sql, self.db)
 
-        sql = "CREATE TABLE photos (id INTEGER PRIMARY KEY, title TEXT, image BLOB)"
-        QSqlQuery(sql, self.db)
+        createPhotosTable(self.db)
 
         sql = "CREATE TABLE images (id INTEGER PRIMARY KEY, image BLOB)"
         QSqlQuery(sql, self.db)
 
+        createSearchIndex(self.db)
+
     def isReferenceAttached(self):
         return ('sections' in self.db.tables())
 
@@ -871,6 +1462,8 @@ class Collection(QtCore.QObject):
         model = CollectionModel(self)
         model.title = self.getCollectionName()
         model.setEditStrategy(QSqlTableModel.OnManualSubmit)
+        # Formatting of values depends on settings
+        self.settingsChanged.connect(model.clearDisplayCache)
         model.setTable('coins')
         model.select()
         for field in self.fields:
@@ -1102,6 +1695,16 @@ class Collection(QtCore.QObject):
                                                                 backupFileName)
             return False
 
+        if self.storage:
+            try:
+                self.storage.copyTo(photosPath(backupFileName))
+            except OSError:
+                QMessageBox.critical(self.parent(),
+                            self.tr("Backup collection"),
+                            self.tr("Can't make a collection backup at %s") %
+                                                photosPath(backupFileName))
+                return False
+
         return True
 
     def isNeedBackup(self):
@@ -1131,6 +1734,55 @@ class Collection(QtCore.QObject):
     def vacuum(self):
         QSqlQuery("VACUUM", self.db)
 
+        if self.storage:
+            self.storage.cleanup(self.db)
+
+    def setExternalImages(self, enabled):
+        if enabled == bool(self.storage):
+            return True
+
+        query = QSqlQuery("SELECT count(*) FROM photos", self.db)
+        query.first()
+        count = query.record().value(0)
+
+        progressDlg = Gui.ProgressDialog(self.tr("Moving images"),
+                                self.tr("Cancel"), count, self.parent())
+
+        storage = PhotoStorage(photosPath(self.fileName))
+
+        self.db.transaction()
+        try:
+            if enabled:
+                result = moveToStorage(self.db, storage, progressDlg)
+            else:
+                result = moveFromStorage(self.db, self.storage, progressDlg)
+        except OSError as error:
+            QMessageBox.critical(self.parent(), self.tr("Moving images"),
+                                 str(error))
+            result = False
+
+        if not result:
+            self.db.rollback()
+            progressDlg.reset()
+            return False
+
+        self.settings['external_images'] = enabled
+        self.settings.save()
+
+        self.db.commit()
+
+        progressDlg.setLabelText(self.tr("Vacuum..."))
+        if enabled:
+            self.storage = storage
+        else:
+            self.storage.remove()
+            self.storage = None
+        self.vacuum()
+
+        progressDlg.reset()
+
+        return True
+
     @staticmethod
     def fileNameToCollectionName(fileName):
         file = QtCore.QFileInfo(fileName)
@@ -1378,80 +2030,50 @@ WHERE coins.id in (select t3.id from coins t3 join (select id, image from photos
     def exportToJson(self):
         file = self.getFileName()
         json_file_name = '.json'.join(file.rsplit('.db', 1))
+        filters = (self.tr("JSON (*.json)"),
+                   self.tr("JSON lines (*.ndjson)"),
+                   self.tr("Zip archive (*.zip)"))
         json_file_name, _selectedFilter = QFileDialog.getSaveFileName(
-            self.parent(), self.tr("Save as"), json_file_name, "*.json")
+            self.parent(), self.tr("Save as"), json_file_name,
+            ';;'.join(filters))
         if json_file_name:
-            json_file = codecs.open(json_file_name, "w", "utf-8")
-
-            image_path = '_images'.join(json_file_name.rsplit('.json', 1))
-            shutil.rmtree(image_path, ignore_errors=True)
-            os.makedirs(image_path)
-        
             model = self.model()
-    
-            sort_column_id = model.fields.sort_id.id
-            model.sort(sort_column_id, Qt.AscendingOrder)
-        
-            while model.canFetchMore():
-                model.fetchMore()
-            count = model.rowCount()
+            exporter = JsonExporter(self, json_file_name)
+            count = exporter.count(model.filter())
 
             desc = self.getDescription()
             data = {'title': desc.title, 'description': desc.description,
                     'author': desc.author, 'type': "OpenNumismat", 'count': count}
-            json_file.write('{"description": ')
-            json.dump(data, json_file, indent=2, sort_keys=True, ensure_ascii=False)
-            json_file.write(',\n"coins": [\n')
-            
-            img_file_dict = {}
-            
+
             progressDlg = Gui.ProgressDialog(self.tr("Exporting records"),
                                             self.tr("Cancel"), count, self.parent())
 
-            fields = CollectionFieldsBase()
-            for i in range(count):
-                progressDlg.step()
-                if progressDlg.wasCanceled():
-                    break
-                
-                data = {}
-                coin = model.record(i)
-                for field in fields:
-                    val = coin.value(field.name)
-                    if val is None or val == '':
-                        continue
-        
-                    if field.name in ('id', 'createdat', 'updatedat', 'sort_id') or field.type == Type.PreviewImage:
-                        continue
-                    if field.name in ('saledate', 'paydate', 'issuedate') and val == '2000-01-01':
-                        continue
-        
-                    if field.type == Type.Image:
-                        hash_ = QCryptographicHash.hash(val, QCryptographicHash.Sha1)
-                        if hash_ in img_file_dict:
-                            img_file_title = img_file_dict[hash_]
-                        else:
-                            img_file_title = "%d_%s.jpg" % (i + 1, field.name)
-                            img_file_name = os.path.join(image_path, img_file_title)
-                            img_file = open(img_file_name, 'wb')
-                            img_file.write(val)
-                            img_file.close()
-                            
-                            img_file_dict[hash_] = img_file_title
-
-                        data[field.name] = img_file_title
-                    else:
-                        data[field.name] = val
-        
-                json.dump(data, json_file, indent=2, sort_keys=True, ensure_ascii=False)
-                if i < count - 1:
-                    json_file.write(',\n')
-            
-            json_file.write(']\n}')
-            json_file.close()
+            try:
+                exporter.export(data, model.filter(), progressDlg)
+            except OSError as e:
+                QMessageBox.critical(self.parent(), self.tr("Export"),
+                                     self.tr("Can't write file:\n%s") % e)
 
             progressDlg.reset()
 
+    def importFromJson(self, fileName):
+        importer = JsonImporter(fileName)
+        progressDlg = None
+        try:
+            importer.open()
+
+            progressDlg = Gui.ProgressDialog(self.tr("Importing records"),
+                                            self.tr("Cancel"), importer.count(),
+                                            self.parent())
+            importer.importData(self.model(), progressDlg)
+        except (OSError, ValueError, BulkInsertError) as error:
+            QMessageBox.critical(self.parent(), self.tr("Importing"),
+                                 self.tr("Can't import file:\n%s") % error)
+        finally:
+            importer.close()
+            if progressDlg:
+                progressDlg.reset()
+
     def merge(self, fileName):
         query = QSqlQuery(self.db)
         query.prepare("ATTACH ? AS src")
@@ -1484,6 +2106,13 @@ WHERE coins.id in (select t3.id from coins t3 join (select id, image from photos
                     self.tr("Collection %s in old format.\n(Try to open it before merging.)") % fileName)
             return
 
+        sql = "SELECT value FROM src.settings WHERE title='external_images'"
+        query = QSqlQuery(sql, self.db)
+        if query.first() and query.record().value(0).lower() in ('true', '1'):
+            srcStorage = PhotoStorage(photosPath(fileName))
+        else:
+            srcStorage = None
+
         sql = "SELECT value FROM src.settings WHERE title='Password'"
         query = QSqlQuery(sql, self.db)
         query.first()
@@ -1567,26 +2196,12 @@ WHERE coins.id in (select t3.id from coins t3 join (select id, image from photos
                         elif field in ImageFields:
                             img_id = sel_query.record().value(field)
                             old_img_id = sel_query.record().value('coins_%s' % field)
-                            if img_id and old_img_id:
-                                sql = "UPDATE photos SET title=(SELECT title FROM src.photos WHERE id=?), image=(SELECT image FROM src.photos WHERE id=?) WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.addBindValue(img_id)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                                img_id = old_img_id
-                            elif img_id:
-                                sql = "INSERT INTO photos (title, image) SELECT title, image FROM src.photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(img_id)
-                                img_query.exec_()
-                                img_id = img_query.lastInsertId()
-                            elif old_img_id:
-                                sql = "DELETE FROM photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-                                img_id = None
+                            if img_id:
+                                img_id = copyPhoto(self.db, img_id, 'src',
+                                                   srcStorage, self.storage)
+                            if old_img_id:
+                                releasePhoto(self.db, old_img_id)
+                                self.imageCache.remove(('photos', old_img_id))
 
                             up_query.addBindValue(img_id)
                         elif field == 'sort_id':
@@ -1621,22 +2236,13 @@ WHERE coins.id in (select t3.id from coins t3 join (select id, image from photos
                         elif field in ImageFields:
                             old_img_id = sel_query.record().value(field)
                             if old_img_id:
-                                sql = "INSERT INTO photos (title, image) SELECT title, image FROM src.photos WHERE id=?"
-                                img_query = QSqlQuery(sql, self.db)
-                                img_query.addBindValue(old_img_id)
-                                img_query.exec_()
-
-                                img_id = img_query.lastInsertId()
+                                img_id = copyPhoto(self.db, old_img_id, 'src',
+                                                   srcStorage, self.storage)
                             else:
                                 img_id = None
                             ins_query.addBindValue(img_id)
                         elif field == 'sort_id':
-                            sort_query = QSqlQuery("SELECT MAX(sort_id) FROM coins", self.db)
-                            sort_query.first()
-                            sort_id = sort_query.record().value(0)
-                            if not sort_id:
-                                sort_id = 0
-                            ins_query.addBindValue(sort_id + 1)
+                            ins_query.addBindValue(nextSortId(self.db))
                         else:
                             ins_query.addBindValue(sel_query.record().value(field))
 
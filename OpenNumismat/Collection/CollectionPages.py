@@ -2,6 +2,7 @@ from PyQt5 import QtCore
 from PyQt5.QtSql import QSqlQuery
 
 from OpenNumismat.Collection.CollectionFields import CollectionFields
+from OpenNumismat.Collection.Indexes import refreshIndexes
 from OpenNumismat.Collection.ListPageParam import ListPageParam
 from OpenNumismat.Collection.TreeParam import TreeParam
 from OpenNumismat.Collection.StatisticsParam import StatisticsParam
@@ -102,6 +103,8 @@ class CollectionPages(QtCore.QObject):
         query.addBindValue(page.id)
         query.exec_()
 
+        refreshIndexes(self.db, self.fields)
+
     def savePositions(self, pages):
         for position, page in enumerate(pages):
             query = QSqlQuery(self.db)
@@ -1,4 +1,9 @@
-from PyQt5.QtCore import Qt
+import hashlib
+from collections import OrderedDict
+from functools import cmp_to_key
+
+from PyQt5.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex
+from PyQt5.QtCore import QCollator
 from PyQt5.QtGui import QIcon
 from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtWidgets import *
@@ -9,35 +14,213 @@ from OpenNumismat.Tools.Gui import statusIcon
 from OpenNumismat.Tools.Converters import numberWithFraction
 
 
-class CustomSortListWidgetItem(QListWidgetItem):
+class DistinctValuesCache:
+    # Max count of stored value lists
+    CACHE_SIZE = 32
+
+    def __init__(self, model):
+        self.model = model
+        self.db = model.database()
+
+        self._items = OrderedDict()
+        self._revision = model.collection.dataRevision
+
+    def clear(self):
+        self._items.clear()
+
+    def values(self, columnName, filtersSql, sortKey):
+        # Distinct values of column with count of rows for each of them
+        # ordered by sortKey
+        sql = "SELECT %s, COUNT(*) FROM coins" % columnName
+        if filtersSql:
+            sql += " WHERE " + filtersSql
+        sql += " GROUP BY " + columnName
+
+        return self.__rows((columnName, filtersSql, 'values'), sql,
+                           lambda row: sortKey(row[0]))
+
+    def blanks(self, columnName, filtersSql):
+        # Count of rows with blank and not blank values of column
+        sql = "SELECT SUM(ifnull(%s,'')=''), SUM(ifnull(%s,'')<>'')"\
+              " FROM coins" % (columnName, columnName)
+        if filtersSql:
+            sql += " WHERE " + filtersSql
+
+        rows = self.__rows((columnName, filtersSql, 'blanks'), sql)
+        if rows:
+            blankCount, dataCount = rows[0]
+            return (blankCount or 0, dataCount or 0)
+
+        return (0, 0)
+
+    def __rows(self, key, sql, sortKey=None):
+        # Any saved change makes all stored lists outdated
+        if self._revision != self.model.collection.dataRevision:
+            self.clear()
+            self._revision = self.model.collection.dataRevision
+
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+
+        query = QSqlQuery(sql, self.db)
+        rows = []
+        while query.next():
+            record = query.record()
+            rows.append(tuple(None if record.isNull(i) else record.value(i)
+                              for i in range(record.count())))
+
+        if sortKey:
+            rows.sort(key=sortKey)
+
+        if query.isActive():
+            self._items[key] = rows
+            if len(self._items) > self.CACHE_SIZE:
+                self._items.popitem(last=False)
+
+        return rows
+
+
+class FilterItem:
+    __slots__ = ('type', 'value', 'label', 'count', 'checked')
+
+    def __init__(self, type_, value, label, count=None, checked=True):
+        self.type = type_
+        self.value = value
+        self.label = label
+        self.count = count
+        self.checked = checked
+
+
+# Check list of filter menu. Items are shown by view in batches when scrolling
+# and icons are requested only for visible items, so menu opens immediately
+# for columns with a lot of different values.
+class FilterValuesModel(QAbstractListModel):
+    checkedChanged = pyqtSignal(int)
 
-    def __lt__(self, other):
-        left = self.data(Qt.UserRole + 1)
-        right = other.data(Qt.UserRole + 1)
+    BATCH_SIZE = 500
 
-        if isinstance(left, str):
-            right = str(right)
-        elif isinstance(right, str):
-            left = str(left)
+    def __init__(self, selectAllItem, items, iconFunc, parent=None):
+        super().__init__(parent)
 
-        return left < right
+        self._items = [selectAllItem] + items
+        self._iconFunc = iconFunc
+        self._icons = {}
+        self._checkedCount = sum(1 for item in items if item.checked)
+
+        self._visible = list(range(len(self._items)))
+        self._fetched = min(len(self._visible), self.BATCH_SIZE)
+
+    def items(self):
+        return self._items[1:]
+
+    def count(self):
+        return len(self._items) - 1
+
+    def checkedCount(self):
+        return self._checkedCount
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._fetched
+
+    def canFetchMore(self, parent):
+        if parent.isValid():
+            return False
+        return self._fetched < len(self._visible)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+
+        count = min(len(self._visible) - self._fetched, self.BATCH_SIZE)
+        self.beginInsertRows(QModelIndex(), self._fetched,
+                             self._fetched + count - 1)
+        self._fetched += count
+        self.endInsertRows()
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        pos = self._visible[index.row()]
+        item = self._items[pos]
+        if role == Qt.DisplayRole:
+            if item.count is None:
+                return item.label
+            return "%s (%d)" % (item.label, item.count)
+        elif role == Qt.DecorationRole:
+            if (item.type != FilterMenuButton.DefaultType or
+                    not self._iconFunc):
+                return None
+            if pos not in self._icons:
+                self._icons[pos] = self._iconFunc(item.value)
+            return self._icons[pos]
+        elif role == Qt.CheckStateRole:
+            if item.type == FilterMenuButton.SelectAllType:
+                if self._checkedCount == 0:
+                    return Qt.Unchecked
+                elif self._checkedCount == self.count():
+                    return Qt.Checked
+                else:
+                    return Qt.PartiallyChecked
+            return Qt.Checked if item.checked else Qt.Unchecked
+        elif role == Qt.UserRole:
+            return item.value
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+
+        checked = (value == Qt.Checked)
+        item = self._items[self._visible[index.row()]]
+        if item.type == FilterMenuButton.SelectAllType:
+            for item in self.items():
+                item.checked = checked
+            self._checkedCount = self.count() if checked else 0
+
+            if self._fetched:
+                self.dataChanged.emit(self.index(0),
+                                      self.index(self._fetched - 1),
+                                      [Qt.CheckStateRole])
+        else:
+            if item.checked == checked:
+                return True
 
+            item.checked = checked
+            self._checkedCount += 1 if checked else -1
 
-class StatusSortListWidgetItem(QListWidgetItem):
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            # Update state of "Select all" item
+            self.dataChanged.emit(self.index(0), self.index(0),
+                                  [Qt.CheckStateRole])
 
-    def __lt__(self, other):
-        left = self.data(Qt.UserRole)
-        right = other.data(Qt.UserRole)
-        return StatusesOrder[left] < StatusesOrder[right]
+        self.checkedChanged.emit(self._checkedCount)
+
+        return True
+
+    def setSearchText(self, text):
+        self.beginResetModel()
+        # "Select all" item stays visible
+        self._visible = [0] + [i for i in range(1, len(self._items))
+                               if self._items[i].label.find(text) >= 0]
+        self._fetched = min(len(self._visible), self.BATCH_SIZE)
+        self.endResetModel()
 
 
 class FilterMenuButton(QPushButton):
-    DefaultType = QListWidgetItem.UserType
-    SelectAllType = QListWidgetItem.UserType + 1
-    BlanksType = QListWidgetItem.UserType + 2
-    DataType = QListWidgetItem.UserType + 3
+    DefaultType = 0
+    SelectAllType = 1
+    BlanksType = 2
+    DataType = 3
 
-    def __init__(self, columnParam, listParam, model, parent):
+    def __init__(self, columnParam, listParam, model, cache, parent):
         super().__init__(parent)
 
         self.db = model.database()
@@ -48,6 +231,11 @@ class FilterMenuButton(QPushButton):
         self.filters = listParam.filters
         self.listParam = listParam
         self.settings = model.settings
+        self.cache = cache
+
+        collator = QCollator()
+        collator.setNumericMode(True)
+        self.collatorKey = cmp_to_key(collator.compare)
 
         menu = QMenu()
 
@@ -62,10 +250,8 @@ class FilterMenuButton(QPushButton):
         menu.aboutToShow.connect(self.prepareMenu)
 
     def prepareMenu(self):
-        self.listWidget = QListWidget(self)
-
         filters = self.filters.copy()
-        appliedValues = []
+        appliedValues = set()
         columnFilters = None
         revert = False
         if self.fieldid in filters.keys():
@@ -73,212 +259,86 @@ class FilterMenuButton(QPushButton):
             for filter_ in columnFilters.filters():
                 if filter_.isRevert():
                     revert = True
-                appliedValues.append(filter_.value)
+                appliedValues.add(filter_.value)
 
-        hasBlanks = False
-        columnType = self.model.columnType(self.fieldid)
-        if self.model.columnName(self.fieldid) == 'year':
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
-
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
-                    data = None
-                else:
-                    orig_data = query.record().value(0)
-                    data = str(orig_data)
-                    label = data
-                    try:
-                        year = int(orig_data)
-                        if year < 0:
-                            label = "%d BC" % -year
-                    except ValueError:
-                        pass
+        filtersSql = self.filtersToSql(filters.values(), self.db)
 
-                if not data:
-                    hasBlanks = True
-                    continue
-
-                item = CustomSortListWidgetItem()
-                item.setData(Qt.DisplayRole, label)
-                item.setData(Qt.UserRole, data)
-                item.setData(Qt.UserRole + 1, orig_data)
-                if data in appliedValues:
-                    if revert:
-                        item.setCheckState(Qt.Checked)
-                    else:
-                        item.setCheckState(Qt.Unchecked)
-                else:
-                    if revert:
-                        item.setCheckState(Qt.Unchecked)
-                    else:
-                        item.setCheckState(Qt.Checked)
-                self.listWidget.addItem(item)
-
-            self.listWidget.sortItems()
-        elif columnType == Type.Text or columnType in Type.ImageTypes:
-            dataFilter = BlankFilter(self.columnName).toSql()
-            blanksFilter = DataFilter(self.columnName).toSql()
-
-            filtersSql = self.filtersToSql(filters.values())
-            sql = "SELECT 1 FROM coins WHERE " + filtersSql
-            if filtersSql:
-                sql += ' AND '
-
-            # Get blank row count
-            blank_sql = sql + blanksFilter + " LIMIT 1"
-            query = QSqlQuery(blank_sql, self.db)
-            if query.first():
-                hasBlanks = True
-
-            # Get not blank row count
-            not_blank_sql = sql + dataFilter + " LIMIT 1"
-            query = QSqlQuery(not_blank_sql, self.db)
-            if query.first():
+        items = []
+        blanksCount = 0
+        iconFunc = None
+        columnType = self.model.columnType(self.fieldid)
+        if columnType == Type.Text or columnType in Type.ImageTypes:
+            blanksCount, dataCount = self.cache.blanks(self.columnName,
+                                                       filtersSql)
+            if dataCount:
                 if columnType in Type.ImageTypes:
                     label = self.tr("(Images)")
                 elif columnType == Type.Text:
                     label = self.tr("(Text)")
                 else:
                     label = self.tr("(Data)")
-                item = QListWidgetItem(label,
-                                       type=FilterMenuButton.DataType)
-                item.setData(Qt.UserRole, label)
-                item.setCheckState(Qt.Checked)
-                if columnFilters and columnFilters.hasData():
-                    item.setCheckState(Qt.Unchecked)
-                self.listWidget.addItem(item)
-        elif columnType == Type.Status:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s ORDER BY %s ASC" % (
-                self.columnName, filtersSql, self.columnName)
-            query = QSqlQuery(sql, self.db)
-
-            while query.next():
-                value = query.record().value(0)
-                label = Statuses[value]
-
-                item = StatusSortListWidgetItem(label)
-                item.setData(Qt.UserRole, value)
-
-                icon = statusIcon(value)
-                item.setIcon(icon)
-
-                if value in appliedValues:
-                    if revert:
-                        item.setCheckState(Qt.Checked)
-                    else:
-                        item.setCheckState(Qt.Unchecked)
-                else:
-                    if revert:
-                        item.setCheckState(Qt.Unchecked)
-                    else:
-                        item.setCheckState(Qt.Checked)
-                self.listWidget.addItem(item)
-
-            self.listWidget.sortItems()
-        elif columnType == Type.Denomination:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
-
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
-                    data = None
+                checked = not (columnFilters and columnFilters.hasData())
+                items.append(FilterItem(FilterMenuButton.DataType, label,
+                                        label, dataCount, checked))
+        else:
+            isYear = (self.model.columnName(self.fieldid) == 'year')
+            if columnType == Type.Status:
+                iconFunc = statusIcon
+            elif not isYear and columnType != Type.Denomination:
+                iconFunc = lambda value: self.reference.getIcon(
+                                                    self.columnName, value)
+
+            rows = self.cache.values(self.columnName, filtersSql,
+                                     self.sortKey)
+            for orig_data, count in rows:
+                if columnType == Type.Status or orig_data is None:
+                    data = orig_data
                 else:
-                    orig_data = query.record().value(0)
                     data = str(orig_data)
-                    label, _ = numberWithFraction(data, self.settings['convert_fraction'])
 
                 if not data:
-                    hasBlanks = True
+                    blanksCount += count
                     continue
 
-                item = CustomSortListWidgetItem()
-                item.setData(Qt.DisplayRole, label)
-                item.setData(Qt.UserRole, data)
-                item.setData(Qt.UserRole + 1, orig_data)
-                if data in appliedValues:
-                    if revert:
-                        item.setCheckState(Qt.Checked)
-                    else:
-                        item.setCheckState(Qt.Unchecked)
+                if isYear:
+                    label = data
+                    try:
+                        year = int(orig_data)
+                        if year < 0:
+                            label = "%d BC" % -year
+                    except ValueError:
+                        pass
+                elif columnType == Type.Status:
+                    label = Statuses[data]
+                elif columnType == Type.Denomination:
+                    label, _ = numberWithFraction(
+                                    data, self.settings['convert_fraction'])
                 else:
-                    if revert:
-                        item.setCheckState(Qt.Unchecked)
-                    else:
-                        item.setCheckState(Qt.Checked)
-                self.listWidget.addItem(item)
+                    label = data
 
-            self.listWidget.sortItems()
-        else:
-            filtersSql = self.filtersToSql(filters.values())
-            if filtersSql:
-                filtersSql = 'WHERE ' + filtersSql
-            sql = "SELECT DISTINCT %s FROM coins %s" % (self.columnName, filtersSql)
-            query = QSqlQuery(sql, self.db)
-
-            while query.next():
-                icon = None
-                if query.record().isNull(0):
-                    data = None
-                else:
-                    orig_data = query.record().value(0)
-                    data = str(orig_data)
-                    icon = self.reference.getIcon(self.columnName, data)
+                checked = ((data in appliedValues) == revert)
+                items.append(FilterItem(FilterMenuButton.DefaultType, data,
+                                        label, count, checked))
 
-                if not data:
-                    hasBlanks = True
-                    continue
-
-                item = QListWidgetItem()
-                item.setData(Qt.DisplayRole, orig_data)
-                item.setData(Qt.UserRole, data)
-                if icon:
-                    item.setIcon(icon)
-                if data in appliedValues:
-                    if revert:
-                        item.setCheckState(Qt.Checked)
-                    else:
-                        item.setCheckState(Qt.Unchecked)
-                else:
-                    if revert:
-                        item.setCheckState(Qt.Unchecked)
-                    else:
-                        item.setCheckState(Qt.Checked)
-                self.listWidget.addItem(item)
-
-            self.listWidget.sortItems()
-
-        item = QListWidgetItem(self.tr("(Select all)"),
-                               type=FilterMenuButton.SelectAllType)
-        item.setData(Qt.UserRole, self.tr("(Select all)"))
-        item.setCheckState(Qt.Checked)
-        self.listWidget.insertItem(0, item)
-
-        if hasBlanks:
-            item = QListWidgetItem(self.tr("(Blanks)"),
-                                   type=FilterMenuButton.BlanksType)
-            item.setData(Qt.UserRole, self.tr("(Blanks)"))
-            item.setCheckState(Qt.Checked)
+        if blanksCount:
+            label = self.tr("(Blanks)")
             if revert:
-                if columnFilters and not columnFilters.hasBlank():
-                    item.setCheckState(Qt.Unchecked)
+                checked = not (columnFilters and not columnFilters.hasBlank())
             else:
-                if columnFilters and columnFilters.hasBlank():
-                    item.setCheckState(Qt.Unchecked)
-            self.listWidget.addItem(item)
+                checked = not (columnFilters and columnFilters.hasBlank())
+            items.append(FilterItem(FilterMenuButton.BlanksType, label,
+                                    label, blanksCount, checked))
+
+        label = self.tr("(Select all)")
+        selectAllItem = FilterItem(FilterMenuButton.SelectAllType, label,
+                                   label)
+        self.valuesModel = FilterValuesModel(selectAllItem, items, iconFunc,
+                                             self)
+        self.valuesModel.checkedChanged.connect(self.checkedChanged)
 
-        self.listWidget.itemChanged.connect(self.itemChanged)
+        self.listView = QListView(self)
+        self.listView.setUniformItemSizes(True)
+        self.listView.setModel(self.valuesModel)
 
         self.searchBox = QLineEdit(self)
         self.searchBox.setPlaceholderText(self.tr("Filter"))
@@ -292,7 +352,7 @@ class FilterMenuButton(QPushButton):
 
         layout = QVBoxLayout()
         layout.addWidget(self.searchBox)
-        layout.addWidget(self.listWidget)
+        layout.addWidget(self.listView)
         layout.addWidget(self.buttonBox)
 
         widget = QWidget(self)
@@ -303,75 +363,54 @@ class FilterMenuButton(QPushButton):
         self.menu().clear()
         self.menu().addAction(widgetAction)
 
-        # Fill items
-        if self.listWidget.count() > 1:
-            self.itemChanged(self.listWidget.item(1))
+        if self.valuesModel.count():
+            self.checkedChanged(self.valuesModel.checkedCount())
 
-    def itemChanged(self, item):
-        self.listWidget.itemChanged.disconnect(self.itemChanged)
+    def sortKey(self, value):
+        if value is None:
+            return (0,)
 
-        if item.type() == FilterMenuButton.SelectAllType:
-            for i in range(1, self.listWidget.count()):
-                self.listWidget.item(i).setCheckState(item.checkState())
-
-            # Disable applying filter when nothing to show
-            button = self.buttonBox.button(QDialogButtonBox.Ok)
-            button.setDisabled(item.checkState() == Qt.Unchecked)
+        columnType = self.model.columnType(self.fieldid)
+        if columnType == Type.Status:
+            return (1, StatusesOrder.get(value, 0))
+        elif not isinstance(value, str):
+            return (1, value)
+        elif (self.model.columnName(self.fieldid) == 'year' or
+                columnType == Type.Denomination):
+            return (2, value)
         else:
-            checkedCount = 0
-            for i in range(1, self.listWidget.count()):
-                item = self.listWidget.item(i)
-                if item.checkState() == Qt.Checked:
-                    checkedCount = checkedCount + 1
-
-            if checkedCount == 0:
-                state = Qt.Unchecked
-            elif checkedCount == self.listWidget.count() - 1:
-                state = Qt.Checked
-            else:
-                state = Qt.PartiallyChecked
-            self.listWidget.item(0).setCheckState(state)
-
-            # Disable applying filter when nothing to show
-            button = self.buttonBox.button(QDialogButtonBox.Ok)
-            button.setDisabled(checkedCount == 0)
+            return (2, self.collatorKey(value))
 
-        self.listWidget.itemChanged.connect(self.itemChanged)
+    def checkedChanged(self, checkedCount):
+        # Disable applying filter when nothing to show
+        button = self.buttonBox.button(QDialogButtonBox.Ok)
+        button.setDisabled(checkedCount == 0)
 
     def apply(self):
         filters = ColumnFilters(self.columnName)
-        unchecked = 0
-        checked = 0
-        for i in range(1, self.listWidget.count()):
-            item = self.listWidget.item(i)
-            if item.checkState() == Qt.Unchecked:
-                unchecked = unchecked + 1
-            else:
-                checked = checked + 1
+        checked = self.valuesModel.checkedCount()
+        unchecked = self.valuesModel.count() - checked
 
-        for i in range(1, self.listWidget.count()):
-            item = self.listWidget.item(i)
+        for item in self.valuesModel.items():
             if unchecked > checked:
-                if item.checkState() == Qt.Checked:
-                    if item.type() == FilterMenuButton.BlanksType:
+                if item.checked:
+                    if item.type == FilterMenuButton.BlanksType:
                         filter_ = BlankFilter(self.columnName)
-                    elif item.type() == FilterMenuButton.DataType:
+                    elif item.type == FilterMenuButton.DataType:
                         filter_ = DataFilter(self.columnName)
                     else:
-                        value = item.data(Qt.UserRole)
-                        filter_ = ValueFilter(self.columnName, value)
+                        filter_ = ValueFilter(self.columnName, item.value)
 
                     filter_.revert = True
                     filters.addFilter(filter_)
             else:
-                if item.checkState() == Qt.Unchecked:
-                    if item.type() == FilterMenuButton.BlanksType:
+                if not item.checked:
+                    if item.type == FilterMenuButton.BlanksType:
                         filter_ = BlankFilter(self.columnName)
-                    elif item.type() == FilterMenuButton.DataType:
+                    elif item.type == FilterMenuButton.DataType:
                         filter_ = DataFilter(self.columnName)
                     else:
-                        value = item.data(Qt.UserRole)
-                        filter_ = ValueFilter(self.columnName, value)
+                        filter_ = ValueFilter(self.columnName, item.value)
 
                     filters.addFilter(filter_)
 
@@ -388,8 +427,9 @@ class FilterMenuButton(QPushButton):
             if self.fieldid in self.filters.keys():
                 self.filters.pop(self.fieldid)
 
-        filtersSql = self.filtersToSql(self.filters.values())
+        filtersSql = self.filtersToSql(self.filters.values(), self.db)
         self.model.setFilter(filtersSql)
+        ColumnFilters.dropUnusedTables(self.model)
 
         self.listParam.save_filters()
 
@@ -397,18 +437,13 @@ class FilterMenuButton(QPushButton):
         self.setIcon(QIcon())
 
     def applySearch(self, text):
-        for i in range(self.listWidget.count()):
-            item = self.listWidget.item(i)
-            if item.text().find(text) >= 0:
-                item.setHidden(False)
-            else:
-                item.setHidden(True)
+        self.valuesModel.setSearchText(text)
 
     @staticmethod
-    def filtersToSql(filters):
+    def filtersToSql(filters, db=None):
         sqlFilters = []
         for columnFilters in filters:
-            sqlFilters.append(columnFilters.toSql())
+            sqlFilters.append(columnFilters.toSql(db))
 
         return ' AND '.join(sqlFilters)
 
@@ -450,10 +485,10 @@ class DataFilter(BaseFilter):
     def toSql(self):
         if self.revert:
             # Filter out blank values
-            return "ifnull(%s,'')<>''" % self.name
+            return "(%s IS NOT NULL AND %s<>'')" % (self.name, self.name)
         else:
             # Filter out not null and not empty values
-            return "ifnull(%s,'')=''" % self.name
+            return "(%s IS NULL OR %s='')" % (self.name, self.name)
 
     def isData(self):
         return True
@@ -463,16 +498,19 @@ class BlankFilter(BaseFilter):
     def toSql(self):
         if self.revert:
             # Filter out not null and not empty values
-            return "ifnull(%s,'')=''" % self.name
+            return "(%s IS NULL OR %s='')" % (self.name, self.name)
         else:
             # Filter out blank values
-            return "ifnull(%s,'')<>''" % self.name
+            return "(%s IS NOT NULL AND %s<>'')" % (self.name, self.name)
 
     def isBlank(self):
         return True
 
 
 class ColumnFilters:
+    # Longer lists of values are passed to SQL through temporary table
+    MAX_INLINE_VALUES = 50
+
     def __init__(self, name):
         self.name = name
         self._filters = []
@@ -500,15 +538,17 @@ class ColumnFilters:
     def hasRevert(self):
         return self._revert
 
-    def toSql(self):
-        values = []
-        for filter_ in self._valueFilters():
-            sql = "'%s'" % filter_.value.replace("'", "''")
-            values.append(sql)
+    def toSql(self, db=None):
+        values = [filter_.value for filter_ in self._valueFilters()]
 
         combinedFilters = ''
         if values:
-            sqlValueFilters = ','.join(values)
+            sqlValueFilters = None
+            if db and len(values) > self.MAX_INLINE_VALUES:
+                sqlValueFilters = self._valuesTable(db, values)
+            if not sqlValueFilters:
+                sqlValueFilters = ','.join(
+                    ["'%s'" % value.replace("'", "''") for value in values])
             if self.hasRevert():
                 combinedFilters = "%s IN (%s)" % (self.name, sqlValueFilters)
             else:
@@ -532,6 +572,52 @@ class ColumnFilters:
             combinedFilters = combinedFilters + (' OR %s IS NULL' % self.name)
         return '(' + combinedFilters + ')'
 
+    @staticmethod
+    def _valuesTable(db, values):
+        # Table name depends on values, so the same list is stored once and
+        # changed list gives changed filter string
+        digest = hashlib.md5('\0'.join(values).encode('utf-8')).hexdigest()
+        table = 'filter_%s' % digest[:16]
+
+        query = QSqlQuery(db)
+        query.prepare("SELECT 1 FROM sqlite_temp_master WHERE name=?")
+        query.addBindValue(table)
+        query.exec_()
+        if not query.first():
+            # Table isn't created inside transaction opened by other code
+            # (bulk import) - values are inlined then
+            if not db.transaction():
+                return None
+
+            QSqlQuery("CREATE TEMP TABLE %s (value TEXT)" % table, db)
+            query = QSqlQuery(db)
+            query.prepare("INSERT INTO temp.%s (value) VALUES (?)" % table)
+            query.addBindValue(values)
+            query.execBatch()
+            db.commit()
+
+        return "SELECT value FROM temp.%s" % table
+
+    @staticmethod
+    def dropUnusedTables(model):
+        # Drop tables with values that aren't used by filter of any model.
+        # Table with the same values is created again when it is needed
+        models = model.collection.findChildren(type(model))
+        filters = [m.filter() for m in models]
+        filters.append(model.filter())
+
+        db = model.database()
+        query = QSqlQuery(db)
+        query.exec_("SELECT name FROM sqlite_temp_master"
+                    " WHERE type='table' AND name LIKE 'filter^_%' ESCAPE '^'")
+        tables = []
+        while query.next():
+            tables.append(query.record().value(0))
+
+        for table in tables:
+            if not any(('temp.%s' % table) in filter_ for filter_ in filters):
+                QSqlQuery("DROP TABLE temp.%s" % table, db)
+
     def _valueFilters(self):
         for filter_ in self._filters:
             if isinstance(filter_, ValueFilter):
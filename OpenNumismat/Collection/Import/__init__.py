@@ -3,6 +3,8 @@ from PyQt5.QtCore import Qt, QStandardPaths
 from PyQt5.QtGui import QCursor
 from PyQt5.QtWidgets import *
 
+from OpenNumismat.Collection.BulkInsert import BulkInserter, BulkInsertError
+
 
 class _InvalidDatabaseError(Exception):
     pass
@@ -50,14 +52,22 @@ class _Import(QtCore.QObject):
                 self.progressDlg.setMaximum(len(rows))
                 self.progressDlg.setLabelText(QApplication.translate('_Import', "Importing from %s") % src)
 
-                for progress, row in enumerate(rows):
-                    self.progressDlg.setValue(progress)
-                    if self.progressDlg.wasCanceled():
-                        break
+                inserter = BulkInserter(model)
+                try:
+                    for progress, row in enumerate(rows):
+                        self.progressDlg.setValue(progress)
+                        if self.progressDlg.wasCanceled():
+                            break
+
+                        record = model.record()
+                        self._setRecord(record, row)
+                        inserter.insertRecord(record)
+                except Exception:
+                    # Collection is left unchanged when import fails
+                    inserter.cancel()
+                    raise
 
-                    record = model.record()
-                    self._setRecord(record, row)
-                    model.appendRecord(record)
+                inserter.finish()
 
                 self.progressDlg.reset()
             else:
@@ -71,6 +81,8 @@ class _Import(QtCore.QObject):
             self.__invalidDbMessage(src, error.__str__())
         except _DatabaseServerError as error:
             self.__serverErrorMessage(error.__str__())
+        except BulkInsertError as error:
+            self.__saveErrorMessage(error.__str__())
 
         return False
 
@@ -103,6 +115,9 @@ class _Import(QtCore.QObject):
     def __serverErrorMessage(self, text=''):
         self.__errorMessage(QApplication.translate('_Import', "DB server connection problem. Check additional software."), text)
 
+    def __saveErrorMessage(self, text=''):
+        self.__errorMessage(QApplication.translate('_Import', "Can't save imported coins. Collection is not changed."), text)
+
 
 class _Import2(QtCore.QObject):
 
@@ -140,14 +155,22 @@ class _Import2(QtCore.QObject):
                 progressDlg.setMaximum(rows_count)
                 progressDlg.setLabelText(QApplication.translate('_Import2', "Importing from %s") % src)
 
-                for row in range(rows_count):
-                    progressDlg.setValue(row)
-                    if progressDlg.wasCanceled():
-                        break
+                inserter = BulkInserter(model)
+                try:
+                    for row in range(rows_count):
+                        progressDlg.setValue(row)
+                        if progressDlg.wasCanceled():
+                            break
 
-                    record = model.record()
-                    self._setRecord(record, row)
-                    model.appendRecord(record)
+                        record = model.record()
+                        self._setRecord(record, row)
+                        inserter.insertRecord(record)
+                except Exception:
+                    # Collection is left unchanged when import fails
+                    inserter.cancel()
+                    raise
+
+                inserter.finish()
 
                 progressDlg.reset()
             else:
@@ -159,6 +182,8 @@ class _Import2(QtCore.QObject):
             self.__invalidDbMessage(src, error.__str__())
         except _DatabaseServerError as error:
             self.__serverErrorMessage(error.__str__())
+        except BulkInsertError as error:
+            self.__saveErrorMessage(error.__str__())
 
     def _connect(self, src):
         raise NotImplementedError
@@ -190,6 +215,9 @@ class _Import2(QtCore.QObject):
     def __serverErrorMessage(self, text=''):
         self.__errorMessage(QApplication.translate('_Import', "DB server connection problem. Check additional software."), text)
 
+    def __saveErrorMessage(self, text=''):
+        self.__errorMessage(QApplication.translate('_Import', "Can't save imported coins. Collection is not changed."), text)
+
 
 from OpenNumismat.Collection.Import.CoinManage import ImportCoinManage
 from OpenNumismat.Collection.Import.CoinManagePredefined import ImportCoinManagePredefined
@@ -0,0 +1,153 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+
+INDEX_PREFIX = 'auto_idx_'
+
+# Columns used by collection itself: sorting, backup and merge checks
+SERVICE_COLUMNS = ('sort_id', 'updatedat', 'createdat')
+
+# Tree levels used by a page without saved tree parameters
+DEFAULT_TREE = ('type', 'country', 'period', 'value', 'unit', 'series',
+                'year')
+
+
+def _indexedName(fields, fieldId):
+    if fieldId is None:
+        return None
+
+    try:
+        field = fields.field(int(fieldId))
+    except (IndexError, KeyError, ValueError):
+        return None
+
+    if field.type == Type.Text or field.type in Type.ImageTypes:
+        return None
+
+    return field.name
+
+
+def _tableRows(db, table, sql):
+    if table not in db.tables():
+        return []
+
+    rows = []
+    query = QSqlQuery(sql, db)
+    while query.next():
+        record = query.record()
+        rows.append([None if record.isNull(i) else record.value(i)
+                     for i in range(record.count())])
+
+    return rows
+
+
+def usedIndexes(db, fields):
+    # Columns sets for indexes that needed by saved pages parameters.
+    # Every tree gets one composite index: its levels are queried with
+    # equality on previous levels and grouping by the next one
+    indexes = set((name,) for name in SERVICE_COLUMNS)
+
+    trees = {}
+    for pageId, fieldId in _tableRows(
+            db, 'treeparam',
+            "SELECT pageid, fieldid FROM treeparam"
+            " ORDER BY pageid, position, id"):
+        names = trees.setdefault(pageId, [])
+        name = _indexedName(fields, fieldId)
+        if name:
+            names.append(name)
+
+    for pageId, in _tableRows(db, 'pages', "SELECT id FROM pages"):
+        if pageId not in trees:
+            trees[pageId] = list(DEFAULT_TREE)
+
+    for names in trees.values():
+        columns = []
+        for name in names:
+            if name not in columns:
+                columns.append(name)
+        if columns:
+            indexes.add(tuple(columns))
+
+    for fieldId, in _tableRows(
+            db, 'filters', "SELECT DISTINCT fieldid FROM filters"):
+        name = _indexedName(fields, fieldId)
+        if name:
+            indexes.add((name,))
+
+    for fieldId, in _tableRows(
+            db, 'lists', "SELECT DISTINCT fieldid FROM lists WHERE enabled"):
+        name = _indexedName(fields, fieldId)
+        if name:
+            indexes.add((name,))
+
+    # Single column index is not needed when it is a prefix of composite one
+    for columns in list(indexes):
+        if len(columns) == 1 and any(len(other) > 1 and other[0] == columns[0]
+                                     for other in indexes):
+            indexes.discard(columns)
+
+    return indexes
+
+
+def indexName(columns):
+    return INDEX_PREFIX + '_'.join(columns)
+
+
+def existingIndexes(db):
+    names = []
+    query = QSqlQuery(db)
+    query.prepare("SELECT name FROM sqlite_master"
+                  " WHERE type='index' AND tbl_name='coins' AND name LIKE ?")
+    query.addBindValue(INDEX_PREFIX + '%')
+    query.exec_()
+    while query.next():
+        names.append(query.record().value(0))
+
+    return names
+
+
+def dropIndexes(db):
+    for name in existingIndexes(db):
+        QSqlQuery("DROP INDEX IF EXISTS %s" % name, db)
+
+
+def updateIndexes(db, fields):
+    indexes = {indexName(columns): columns
+               for columns in usedIndexes(db, fields)}
+    existing = existingIndexes(db)
+    changed = False
+
+    for name in existing:
+        if name not in indexes:
+            QSqlQuery("DROP INDEX IF EXISTS %s" % name, db)
+            changed = True
+
+    for name, columns in indexes.items():
+        if name not in existing:
+            sql = "CREATE INDEX IF NOT EXISTS %s ON coins (%s)" % (
+                name, ','.join(columns))
+            QSqlQuery(sql, db)
+            changed = True
+
+    if changed:
+        # Update statistics used by query planner for choosing index
+        QSqlQuery("ANALYZE coins", db)
+
+
+def isAutoIndexesEnabled(db):
+    # Read from settings table, so page parameters don't need collection
+    query = QSqlQuery(db)
+    query.prepare("SELECT value FROM settings WHERE title=?")
+    query.addBindValue('auto_indexes')
+    query.exec_()
+    if query.first():
+        return str(query.record().value(0)).lower() in ('true', '1')
+
+    return True
+
+
+def refreshIndexes(db, fields):
+    # Called after saving of page parameters used by updateIndexes
+    if isAutoIndexesEnabled(db):
+        updateIndexes(db, fields)
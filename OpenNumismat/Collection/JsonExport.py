@@ -0,0 +1,283 @@
+import codecs
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QThread
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import CollectionFieldsBase
+from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Collection.CollectionFields import ImageFields
+from OpenNumismat.Collection.Photos import getPhoto
+
+# Fields that are not exported
+SKIPPED_FIELDS = ('id', 'createdat', 'updatedat', 'sort_id')
+# Default date values that are not exported
+SKIPPED_DATES = ('saledate', 'paydate', 'issuedate')
+
+
+class ImageWriter:
+    # Writes exported images in worker threads. Count of images waiting for
+    # writing is limited, so memory usage doesn't depend on collection size
+
+    def __init__(self, workers=None):
+        if not workers:
+            workers = max(QThread.idealThreadCount(), 1)
+        self.maxPending = workers * 4
+        self._executor = ThreadPoolExecutor(workers)
+        self._pending = deque()
+
+    def _write(self, fileName, data, source):
+        raise NotImplementedError
+
+    def write(self, fileName, data=None, source=None):
+        # Image is taken from data or copied from source file
+        while len(self._pending) >= self.maxPending:
+            self._pending.popleft().result()
+
+        future = self._executor.submit(self._write, fileName, data, source)
+        self._pending.append(future)
+
+    def finish(self):
+        while self._pending:
+            self._pending.popleft().result()
+
+        self._executor.shutdown()
+
+    def cancel(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+        self._executor.shutdown()
+
+
+class DirectoryImageWriter(ImageWriter):
+
+    def __init__(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        super().__init__()
+
+        self.path = path
+
+    def _write(self, fileName, data, source):
+        fileName = os.path.join(self.path, fileName)
+        if source:
+            shutil.copyfile(source, fileName)
+        else:
+            with open(fileName, 'wb') as file:
+                file.write(data)
+
+
+class ZipImageWriter(ImageWriter):
+    # Zip archive can't be written in parallel, so only one worker is used
+
+    def __init__(self, archive, path):
+        super().__init__(1)
+
+        self.archive = archive
+        self.path = path
+
+    def _write(self, fileName, data, source):
+        # Images are already compressed
+        arcname = '/'.join((self.path, fileName))
+        if source:
+            self.archive.write(source, arcname, zipfile.ZIP_STORED)
+        else:
+            self.archive.writestr(arcname, bytes(data), zipfile.ZIP_STORED)
+
+
+class JsonWriter:
+
+    def __init__(self, file):
+        self.file = file
+        self._first = True
+
+    def begin(self, description):
+        self.file.write('{"description": ')
+        json.dump(description, self.file, indent=2, sort_keys=True,
+                  ensure_ascii=False)
+        self.file.write(',\n"coins": [\n')
+
+    def write(self, data):
+        if not self._first:
+            self.file.write(',\n')
+        self._first = False
+
+        json.dump(data, self.file, indent=2, sort_keys=True,
+                  ensure_ascii=False)
+
+    def end(self):
+        self.file.write(']\n}')
+
+
+class NdjsonWriter(JsonWriter):
+    # Every line is a complete JSON object - description first and then
+    # coins, so file can be read line by line
+
+    def begin(self, description):
+        self.write({'description': description})
+
+    def write(self, data):
+        json.dump(data, self.file, sort_keys=True, ensure_ascii=False)
+        self.file.write('\n')
+
+    def end(self):
+        pass
+
+
+class JsonExporter:
+
+    def __init__(self, collection, fileName):
+        self.collection = collection
+        self.db = collection.db
+        self.storage = collection.storage
+        self.fileName = fileName
+
+        ext = os.path.splitext(fileName)[1].lower()
+        self.isZip = (ext == '.zip')
+        self.isNdjson = (ext == '.ndjson')
+
+    def count(self, filter_=''):
+        sql = "SELECT COUNT(*) FROM coins"
+        if filter_:
+            sql += " WHERE " + filter_
+        query = QSqlQuery(sql, self.db)
+        query.first()
+        return query.record().value(0)
+
+    def __query(self, fields, filter_):
+        # Photos are joined for getting hashes of images - equal images are
+        # written once without reading them
+        columns = ['coins.%s' % field.name for field in fields]
+        joins = []
+        for i, field in enumerate(ImageFields):
+            columns.append("p%d.hash AS %s_hash" % (i, field))
+            columns.append("p%d.title AS %s_title" % (i, field))
+            columns.append("p%d.image IS NULL AS %s_external" % (i, field))
+            joins.append("LEFT JOIN photos AS p%d ON p%d.id=coins.%s" %
+                         (i, i, field))
+
+        source = "coins"
+        if filter_:
+            source = "(SELECT * FROM coins WHERE %s) AS coins" % filter_
+
+        sql = "SELECT %s FROM %s %s ORDER BY coins.sort_id" % (
+            ','.join(columns), source, ' '.join(joins))
+
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec_(sql)
+        return query
+
+    def export(self, description, filter_='', progressDlg=None):
+        if self.isZip:
+            base = os.path.splitext(os.path.basename(self.fileName))[0]
+            archive = zipfile.ZipFile(self.fileName, 'w',
+                                      zipfile.ZIP_DEFLATED, allowZip64=True)
+            imageWriter = ZipImageWriter(archive, base + '_images')
+            # Coins are written to temporary file while images are added
+            # to archive
+            tmpFile = tempfile.TemporaryFile()
+            file = codecs.getwriter('utf-8')(tmpFile)
+        else:
+            archive = None
+            base, _ext = os.path.splitext(self.fileName)
+            imageWriter = DirectoryImageWriter(base + '_images')
+            file = codecs.open(self.fileName, 'w', 'utf-8')
+
+        if self.isNdjson:
+            writer = NdjsonWriter(file)
+        else:
+            writer = JsonWriter(file)
+
+        try:
+            self.__export(writer, imageWriter, description, filter_,
+                          progressDlg)
+            imageWriter.finish()
+
+            if archive:
+                tmpFile.seek(0)
+                with archive.open(base + '.json', 'w') as dst:
+                    shutil.copyfileobj(tmpFile, dst)
+        finally:
+            imageWriter.cancel()
+            file.close()
+            if archive:
+                archive.close()
+
+    def __export(self, writer, imageWriter, description, filter_,
+                 progressDlg):
+        fields = [field for field in CollectionFieldsBase()
+                  if field.name not in SKIPPED_FIELDS and
+                  field.type != Type.PreviewImage]
+
+        writer.begin(description)
+
+        img_file_dict = {}
+        query = self.__query(fields, filter_)
+        i = 0
+        while query.next():
+            if progressDlg:
+                progressDlg.step()
+                if progressDlg.wasCanceled():
+                    break
+
+            record = query.record()
+            data = {}
+            for field in fields:
+                if record.isNull(field.name):
+                    continue
+                val = record.value(field.name)
+                if val == '':
+                    continue
+                if field.name in SKIPPED_DATES and val == '2000-01-01':
+                    continue
+
+                if field.type == Type.Image:
+                    hash_ = record.value(field.name + '_hash')
+                    if not hash_:
+                        hash_ = val
+                    if hash_ in img_file_dict:
+                        img_file_title = img_file_dict[hash_]
+                    else:
+                        img_file_title = "%d_%s.jpg" % (i + 1, field.name)
+                        if not self.__writeImage(imageWriter, img_file_title,
+                                                 val, record, field.name):
+                            continue
+
+                        img_file_dict[hash_] = img_file_title
+
+                    data[field.name] = img_file_title
+                    title = record.value(field.name + '_title')
+                    if title:
+                        data[field.name + '_title'] = title
+                else:
+                    data[field.name] = val
+
+            writer.write(data)
+            i += 1
+
+        writer.end()
+
+    def __writeImage(self, imageWriter, fileName, img_id, record, field):
+        if self.storage and record.value(field + '_external'):
+            # File from external storage is copied by worker
+            source = self.storage.fileName(record.value(field + '_hash'))
+            if not os.path.isfile(source):
+                return False
+            imageWriter.write(fileName, source=source)
+        else:
+            image = getPhoto(self.db, img_id)
+            if not image:
+                return False
+            imageWriter.write(fileName, image)
+
+        return True
@@ -0,0 +1,214 @@
+import io
+import json
+import os
+import zipfile
+
+from OpenNumismat.Collection.BulkInsert import BulkInserter
+from OpenNumismat.Collection.CollectionFields import ImageFields
+
+
+class JsonStream:
+    # Incremental parser of JSON file: values of top level object are read
+    # one by one and items of coins list are returned without reading
+    # the whole list
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def __fill(self):
+        chunk = self.file.read(self.CHUNK_SIZE)
+        if not chunk:
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def __skip(self):
+        # Returns next not space char or empty string at end of file
+        while True:
+            while (self.pos < len(self.buffer) and
+                   self.buffer[self.pos].isspace()):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.__fill():
+                return ''
+
+    def __expect(self, chars):
+        char = self.__skip()
+        if not char or char not in chars:
+            raise ValueError("Expected '%s' at %d" % (chars, self.pos))
+
+        self.pos += 1
+        return char
+
+    def __value(self):
+        self.__skip()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Number can be continued in the next chunk
+                if end < len(self.buffer) or not self.__fill():
+                    self.pos = end
+                    return value
+            except ValueError:
+                if not self.__fill():
+                    raise
+
+    def events(self):
+        # Pairs of key and value of top level object. Every item of coins
+        # list is returned as separate 'coin' pair
+        self.__expect('{')
+        if self.__skip() == '}':
+            return
+
+        while True:
+            key = self.__value()
+            self.__expect(':')
+            if key == 'coins':
+                self.__expect('[')
+                if self.__skip() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield 'coin', self.__value()
+                        if self.__expect(',]') == ']':
+                            break
+            else:
+                yield key, self.__value()
+
+            if self.__expect(',}') == '}':
+                break
+
+
+class NdjsonStream:
+    # Description and every coin are stored in separate lines
+
+    def __init__(self, file):
+        self.file = file
+
+    def events(self):
+        for line in self.file:
+            if not line.strip():
+                continue
+
+            data = json.loads(line)
+            if 'description' in data:
+                yield 'description', data['description']
+            else:
+                yield 'coin', data
+
+
+class JsonImporter:
+    # Imports files created by JSON export: plain or NDJSON file with
+    # images in directory next to it or zip archive
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.description = {}
+
+        self._archive = None
+        self._file = None
+        self._events = None
+        self._pending = []
+
+    def open(self):
+        ext = os.path.splitext(self.fileName)[1].lower()
+        if ext == '.zip':
+            try:
+                self._archive = zipfile.ZipFile(self.fileName)
+            except zipfile.BadZipFile as error:
+                raise ValueError(str(error))
+
+            names = [name for name in self._archive.namelist()
+                     if '/' not in name and
+                     os.path.splitext(name)[1].lower() in ('.json', '.ndjson')]
+            if not names:
+                raise ValueError("JSON file not found in archive")
+
+            name = names[0]
+            self._imagePath = os.path.splitext(name)[0] + '_images'
+            self._file = io.TextIOWrapper(self._archive.open(name), 'utf-8')
+            ext = os.path.splitext(name)[1].lower()
+        else:
+            self._imagePath = os.path.splitext(self.fileName)[0] + '_images'
+            self._file = open(self.fileName, 'r', encoding='utf-8')
+
+        if ext == '.ndjson':
+            self._events = NdjsonStream(self._file).events()
+        else:
+            self._events = JsonStream(self._file).events()
+
+        # Description is written before coins
+        for key, value in self._events:
+            if key == 'description':
+                self.description = value
+                break
+            elif key == 'coin':
+                self._pending.append(value)
+                break
+
+        return self.description
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._archive:
+            self._archive.close()
+            self._archive = None
+
+    def count(self):
+        return self.description.get('count', 0)
+
+    def coins(self):
+        while self._pending:
+            yield self._pending.pop(0)
+
+        for key, value in self._events:
+            if key == 'coin':
+                yield value
+            elif key == 'description':
+                self.description = value
+
+    def readImage(self, fileName):
+        try:
+            if self._archive:
+                return self._archive.read('/'.join((self._imagePath, fileName)))
+            else:
+                with open(os.path.join(self._imagePath, fileName), 'rb') as file:
+                    return file.read()
+        except (KeyError, OSError):
+            return None
+
+    def importData(self, model, progressDlg=None):
+        inserter = BulkInserter(model)
+        try:
+            for coin in self.coins():
+                if progressDlg:
+                    progressDlg.step()
+                    if progressDlg.wasCanceled():
+                        break
+
+                images = {}
+                for field in ImageFields:
+                    fileName = coin.pop(field, None)
+                    title = coin.pop(field + '_title', None)
+                    if fileName:
+                        images[field] = (self.readImage(fileName), title)
+
+                inserter.insert(coin, images)
+        except Exception:
+            # Collection is left unchanged when file can't be read
+            inserter.cancel()
+            raise
+
+        inserter.finish()
+
+        return inserter.count
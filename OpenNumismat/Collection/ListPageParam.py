@@ -2,6 +2,7 @@ from PyQt5 import QtCore
 from PyQt5.QtSql import QSqlQuery, QSqlRecord
 
 from OpenNumismat.Collection.HeaderFilterMenu import ColumnFilters, ValueFilter, DataFilter, BlankFilter
+from OpenNumismat.Collection.Indexes import refreshIndexes
 
 
 class ColumnListParam:
@@ -136,6 +137,8 @@ class ListPageParam(QtCore.QObject):
 
             self.__lists_changed = False
 
+            refreshIndexes(self.db, self.fields)
+
     def save_filters(self):
         self.db.transaction()
 
@@ -169,6 +172,8 @@ class ListPageParam(QtCore.QObject):
 
         self.db.commit()
 
+        refreshIndexes(self.db, self.fields)
+
     def remove(self):
         self.__remove_lists()
         self.__remove_filters()
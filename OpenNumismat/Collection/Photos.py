@@ -0,0 +1,261 @@
+import os
+import shutil
+
+from PyQt5.QtCore import QCryptographicHash, QFile, QIODevice
+from PyQt5.QtSql import QSqlQuery
+
+# Photos are stored once per content and title. Every coin field refers to
+# photo by id and refs column counts such references, so stored photo is
+# never changed - new photo is added and old one is released instead.
+# With external storage image column is empty and image is kept in file
+# named by its hash in directory next to collection file.
+
+
+def photosPath(fileName):
+    return os.path.splitext(fileName)[0] + '_photos'
+
+
+class PhotoStorage:
+
+    def __init__(self, path):
+        self.path = path
+
+    def fileName(self, hash_):
+        return os.path.join(self.path, hash_[:2], hash_)
+
+    def write(self, hash_, image):
+        fileName = self.fileName(hash_)
+        if os.path.isfile(fileName):
+            return
+
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        # Renaming complete file - other process never read a part of it
+        tmpFileName = fileName + '.tmp'
+        with open(tmpFileName, 'wb') as file:
+            file.write(image)
+        os.replace(tmpFileName, fileName)
+
+    def read(self, hash_):
+        # File is read directly into QByteArray without intermediate copies
+        file = QFile(self.fileName(hash_))
+        if not file.open(QIODevice.ReadOnly):
+            return None
+
+        data = file.readAll()
+        file.close()
+
+        return data
+
+    def hashes(self):
+        if not os.path.isdir(self.path):
+            return
+
+        for dirName in os.listdir(self.path):
+            dirPath = os.path.join(self.path, dirName)
+            if os.path.isdir(dirPath):
+                for fileName in os.listdir(dirPath):
+                    yield fileName
+
+    def cleanup(self, db):
+        # Files are removed here but not on releasing a photo, so rolled
+        # back transaction never loses an image
+        used = set()
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        query.exec_("SELECT DISTINCT hash FROM photos WHERE image IS NULL")
+        while query.next():
+            used.add(query.record().value(0))
+
+        for hash_ in list(self.hashes()):
+            if hash_ not in used:
+                os.remove(os.path.join(self.path, hash_[:2], hash_))
+
+    def copyTo(self, path):
+        # Files are never changed, so hard link is enough
+        storage = PhotoStorage(path)
+        for hash_ in self.hashes():
+            if hash_.endswith('.tmp'):
+                continue
+
+            fileName = storage.fileName(hash_)
+            if os.path.isfile(fileName):
+                continue
+
+            os.makedirs(os.path.dirname(fileName), exist_ok=True)
+            try:
+                os.link(self.fileName(hash_), fileName)
+            except OSError:
+                shutil.copyfile(self.fileName(hash_), fileName)
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def imageHash(image):
+    hash_ = QCryptographicHash.hash(image, QCryptographicHash.Sha1)
+    return bytes(hash_.toHex()).decode()
+
+
+def createPhotosTable(db):
+    sql = "CREATE TABLE photos (id INTEGER PRIMARY KEY, title TEXT,\
+            image BLOB, hash TEXT, refs INTEGER)"
+    QSqlQuery(sql, db)
+
+    createPhotosIndex(db)
+
+
+def createPhotosIndex(db):
+    sql = "CREATE UNIQUE INDEX IF NOT EXISTS photos_hash\
+            ON photos (hash, ifnull(title,''))"
+    QSqlQuery(sql, db)
+
+
+def findPhoto(db, hash_, title):
+    query = QSqlQuery(db)
+    query.prepare("SELECT id FROM photos"
+                  " WHERE hash=? AND ifnull(title,'')=ifnull(?,'')")
+    query.addBindValue(hash_)
+    query.addBindValue(title)
+    query.exec_()
+    if query.first():
+        return query.record().value(0)
+
+    return None
+
+
+def addPhoto(db, image, title=None, storage=None, hash_=None):
+    # Hash can be calculated before in worker thread
+    if not hash_:
+        hash_ = imageHash(image)
+
+    img_id = findPhoto(db, hash_, title)
+    if img_id:
+        acquirePhoto(db, img_id)
+        return img_id
+
+    if storage:
+        storage.write(hash_, image)
+        image = None
+
+    query = QSqlQuery(db)
+    query.prepare("INSERT INTO photos (title, image, hash, refs)"
+                  " VALUES (?, ?, ?, 1)")
+    query.addBindValue(title)
+    query.addBindValue(image)
+    query.addBindValue(hash_)
+    query.exec_()
+
+    return query.lastInsertId()
+
+
+def acquirePhoto(db, img_id):
+    query = QSqlQuery(db)
+    query.prepare("UPDATE photos SET refs=ifnull(refs,1)+1 WHERE id=?")
+    query.addBindValue(img_id)
+    query.exec_()
+
+
+def photosInfo(db, ids):
+    # Titles and hashes of photos without reading images
+    info = {}
+    if not ids:
+        return info
+
+    query = QSqlQuery(db)
+    query.prepare("SELECT id, title, hash FROM photos WHERE id IN (%s)" %
+                  ','.join('?' * len(ids)))
+    for img_id in ids:
+        query.addBindValue(img_id)
+    query.exec_()
+    while query.next():
+        record = query.record()
+        title = None if record.isNull('title') else record.value('title')
+        hash_ = None if record.isNull('hash') else record.value('hash')
+        info[record.value('id')] = (title, hash_)
+
+    return info
+
+
+def getPhoto(db, img_id, storage=None, schema='main'):
+    query = QSqlQuery(db)
+    query.prepare("SELECT image, hash FROM %s.photos WHERE id=?" % schema)
+    query.addBindValue(img_id)
+    query.exec_()
+    if query.first():
+        record = query.record()
+        if record.isNull('image') and storage and not record.isNull('hash'):
+            return storage.read(record.value('hash'))
+
+        return record.value('image')
+
+    return None
+
+
+def copyPhoto(db, img_id, schema, srcStorage=None, storage=None):
+    # Add photo from attached database
+    query = QSqlQuery(db)
+    query.prepare("SELECT title FROM %s.photos WHERE id=?" % schema)
+    query.addBindValue(img_id)
+    query.exec_()
+    if not query.first():
+        return None
+
+    record = query.record()
+    title = None if record.isNull('title') else record.value('title')
+    image = getPhoto(db, img_id, srcStorage, schema)
+    if not image:
+        return None
+
+    return addPhoto(db, image, title, storage)
+
+
+def moveToStorage(db, storage, progressDlg):
+    query = QSqlQuery(db)
+    query.setForwardOnly(True)
+    query.exec_("SELECT id, image, hash FROM photos WHERE image IS NOT NULL")
+    while query.next():
+        progressDlg.step()
+        if progressDlg.wasCanceled():
+            return False
+
+        record = query.record()
+        storage.write(record.value('hash'), record.value('image'))
+
+    QSqlQuery("UPDATE photos SET image=NULL", db)
+
+    return True
+
+
+def moveFromStorage(db, storage, progressDlg):
+    query = QSqlQuery(db)
+    query.setForwardOnly(True)
+    query.exec_("SELECT id, hash FROM photos WHERE image IS NULL")
+    while query.next():
+        progressDlg.step()
+        if progressDlg.wasCanceled():
+            return False
+
+        record = query.record()
+        image = storage.read(record.value('hash'))
+        if image is None:
+            continue
+
+        update_query = QSqlQuery(db)
+        update_query.prepare("UPDATE photos SET image=? WHERE id=?")
+        update_query.addBindValue(image)
+        update_query.addBindValue(record.value('id'))
+        update_query.exec_()
+
+    return True
+
+
+def releasePhoto(db, img_id):
+    query = QSqlQuery(db)
+    query.prepare("UPDATE photos SET refs=ifnull(refs,1)-1 WHERE id=?")
+    query.addBindValue(img_id)
+    query.exec_()
+
+    query = QSqlQuery(db)
+    query.prepare("DELETE FROM photos WHERE id=? AND refs<=0")
+    query.addBindValue(img_id)
+    query.exec_()
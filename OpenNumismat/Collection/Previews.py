@@ -0,0 +1,136 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import Qt, QThread
+from PyQt5.QtGui import QImage, QPainter
+
+from OpenNumismat.Collection.Photos import imageHash
+
+
+def encodeImage(image, sideLen, format_):
+    # Resize big image and convert it to format stored in DB. Can be called
+    # from worker threads as createPreview
+    if sideLen > 0:
+        if image.width() > sideLen or image.height() > sideLen:
+            image = image.scaled(sideLen, sideLen,
+                                 Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    ba = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(ba)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+
+    image.save(buffer, format_)
+
+    return ba
+
+
+def createPreview(obverse, reverse, height):
+    # Creating preview image for list. QImage and QPainter drawing on
+    # QImage are thread-safe, so it can be called from worker threads
+    if not obverse and not reverse:
+        return None
+
+    obverseImage = QImage()
+    reverseImage = QImage()
+
+    if obverse:
+        obverseImage.loadFromData(obverse)
+        obverseImage = obverseImage.scaledToHeight(height,
+                                                   Qt.SmoothTransformation)
+    if reverse:
+        reverseImage.loadFromData(reverse)
+        reverseImage = reverseImage.scaledToHeight(height,
+                                                   Qt.SmoothTransformation)
+
+    image = QImage(obverseImage.width() + reverseImage.width(),
+                   height, QImage.Format_RGB32)
+    image.fill(Qt.white)
+
+    paint = QPainter(image)
+    if obverse:
+        paint.drawImage(QtCore.QRectF(0, 0, obverseImage.width(), height), obverseImage,
+                        QtCore.QRectF(0, 0, obverseImage.width(), height))
+    if reverse:
+        paint.drawImage(QtCore.QRectF(obverseImage.width(), 0, reverseImage.width(), height), reverseImage,
+                        QtCore.QRectF(0, 0, reverseImage.width(), height))
+    paint.end()
+
+    ba = QtCore.QByteArray()
+    buffer = QtCore.QBuffer(ba)
+    buffer.open(QtCore.QIODevice.WriteOnly)
+
+    # Store as PNG for better view
+    image.save(buffer, 'png')
+
+    return ba
+
+
+def processImages(images, sideLen, format_, height):
+    # Convert images of coin to DB format, calculate their hashes and create
+    # preview for coin. images - dict with image (QImage or encoded data)
+    # and title for image fields
+    result = {}
+    for field, (image, title) in images.items():
+        if isinstance(image, QImage):
+            image = encodeImage(image, sideLen, format_)
+        hash_ = imageHash(image) if image else None
+        result[field] = (image, title, hash_)
+
+    obverse = result.get('obverseimg', (None,))[0]
+    reverse = result.get('reverseimg', (None,))[0]
+    preview = createPreview(obverse, reverse, height)
+
+    return result, preview
+
+
+class PreviewPool:
+    # Creates previews in worker threads. Results are returned in order of
+    # submitting and count of images kept in memory is limited
+
+    def __init__(self, height):
+        self.height = height
+
+        workers = max(QThread.idealThreadCount(), 1)
+        self.maxPending = workers * 4
+        self._executor = ThreadPoolExecutor(workers)
+        self._pending = deque()
+
+    def submit(self, key, obverse, reverse):
+        future = self._executor.submit(createPreview, obverse, reverse,
+                                       self.height)
+        self._pending.append((key, future))
+
+    def ready(self):
+        # Waits for the oldest item only when queue is full
+        while self._pending and (len(self._pending) >= self.maxPending or
+                                 self._pending[0][1].done()):
+            key, future = self._pending.popleft()
+            yield key, future.result()
+
+    def finish(self):
+        while self._pending:
+            key, future = self._pending.popleft()
+            yield key, future.result()
+
+    def shutdown(self):
+        for _key, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+        self._executor.shutdown()
+
+
+class ImagePool(PreviewPool):
+    # Converts images of coins and creates previews in worker threads
+
+    def __init__(self, height, sideLen, format_):
+        super().__init__(height)
+
+        self.sideLen = sideLen
+        self.format = format_
+
+    def submit(self, key, images):
+        future = self._executor.submit(processImages, images, self.sideLen,
+                                       self.format, self.height)
+        self._pending.append((key, future))
@@ -0,0 +1,159 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionFields import CollectionFieldsBase
+from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Tools.DatabaseWorker import DatabaseWorker
+
+SEARCH_TABLE = 'coins_search'
+# Trigram index finds substrings of at least 3 chars. Shorter text is
+# searched by LIKE
+MIN_INDEXED_LENGTH = 3
+
+
+def searchFields():
+    fields = CollectionFieldsBase()
+    skipped = (fields.id, fields.createdat, fields.updatedat, fields.sort_id)
+
+    names = []
+    for field in fields:
+        if field in skipped or field.type in Type.ImageTypes:
+            continue
+        names.append(field.name)
+
+    return names
+
+
+def isSearchIndexAvailable(db):
+    # Index with word tokenizer can't find text inside words, so it isn't
+    # used for searching
+    query = QSqlQuery(db)
+    query.prepare("SELECT sql FROM sqlite_master WHERE name=?")
+    query.addBindValue(SEARCH_TABLE)
+    query.exec_()
+    if query.first():
+        return 'trigram' in query.record().value(0)
+
+    return False
+
+
+def updateSearchIndex(db):
+    # Index created with word tokenizer is replaced by trigram one
+    if SEARCH_TABLE in db.tables() and not isSearchIndexAvailable(db):
+        createSearchIndex(db)
+
+
+def dropSearchIndex(db):
+    for action in ('insert', 'delete', 'update'):
+        QSqlQuery("DROP TRIGGER IF EXISTS %s_%s" % (SEARCH_TABLE, action), db)
+    QSqlQuery("DROP TABLE IF EXISTS %s" % SEARCH_TABLE, db)
+
+
+def createSearchIndex(db):
+    dropSearchIndex(db)
+
+    fields = searchFields()
+    sql_fields = ','.join(fields)
+    new_fields = ','.join(['new.%s' % f for f in fields])
+    old_fields = ','.join(['old.%s' % f for f in fields])
+
+    # External content table - text is stored only in coins table.
+    # Trigram tokenizer allows searching substrings as LIKE does
+    sql = "CREATE VIRTUAL TABLE %s USING fts5(%s,\
+            content='coins', content_rowid='id',\
+            tokenize='trigram')" % (SEARCH_TABLE, sql_fields)
+    query = QSqlQuery(db)
+    if not query.exec_(sql):
+        # FTS5 or trigram tokenizer (SQLite 3.34) not supported - LIKE search
+        # will be used
+        print(query.lastError().text())
+        return False
+
+    sql = "CREATE TRIGGER %s_insert AFTER INSERT ON coins BEGIN\
+            INSERT INTO %s (rowid, %s) VALUES (new.id, %s);\
+        END" % (SEARCH_TABLE, SEARCH_TABLE, sql_fields, new_fields)
+    QSqlQuery(sql, db)
+
+    sql = "CREATE TRIGGER %s_delete AFTER DELETE ON coins BEGIN\
+            INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s);\
+        END" % (SEARCH_TABLE, SEARCH_TABLE, SEARCH_TABLE, sql_fields,
+                old_fields)
+    QSqlQuery(sql, db)
+
+    # Changing of not indexed columns (sort_id, images) doesn't touch index
+    sql = "CREATE TRIGGER %s_update AFTER UPDATE OF %s ON coins BEGIN\
+            INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s);\
+            INSERT INTO %s (rowid, %s) VALUES (new.id, %s);\
+        END" % (SEARCH_TABLE, sql_fields, SEARCH_TABLE, SEARCH_TABLE,
+                sql_fields, old_fields, SEARCH_TABLE, sql_fields, new_fields)
+    QSqlQuery(sql, db)
+
+    sql = "INSERT INTO %s (%s) VALUES ('rebuild')" % (SEARCH_TABLE,
+                                                      SEARCH_TABLE)
+    QSqlQuery(sql, db)
+
+    return True
+
+
+def searchFilter(db, text, columns):
+    if (len(text.strip()) >= MIN_INDEXED_LENGTH and
+            isSearchIndexAvailable(db)):
+        indexed = searchFields()
+        indexedColumns = [column for column in columns if column in indexed]
+        otherColumns = [column for column in columns if column not in indexed]
+
+        if indexedColumns:
+            # Whole text is matched as substring like in LIKE filter
+            match = '{%s} : "%s"' % (' '.join(indexedColumns),
+                                     text.replace('"', '""'))
+            sql = "id IN (SELECT rowid FROM %s WHERE %s MATCH '%s')" % (
+                SEARCH_TABLE, SEARCH_TABLE, match.replace("'", "''"))
+            if otherColumns:
+                sql = "(%s OR %s)" % (sql, likeFilter(text, otherColumns))
+            return sql
+
+    return likeFilter(text, columns)
+
+
+def likeFilter(text, columns):
+    val = "'%%%s%%'" % text.replace("'", "''")
+    values = []
+    val_lower = val.lower()
+    values.append(val_lower)
+    val_upper = val.upper()
+    if val_lower != val_upper:
+        values.append(val_upper)
+        values.append(val.title())
+    if val not in values:
+        values.append(val)
+
+    sql = []
+    for column in columns:
+        for val in values:
+            sql.append("%s LIKE %s" % (column, val))
+
+    return '(' + ' OR '.join(sql) + ')'
+
+
+# Selects ids of coins matched to quick search filter
+class SearchWorker(DatabaseWorker):
+
+    def __init__(self, fileName, filter_, generation):
+        super().__init__(fileName, generation)
+
+        self.filter = filter_
+
+    def process(self, db):
+        ids = []
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        if not query.exec_("SELECT id FROM coins WHERE " + self.filter):
+            return None
+
+        while query.next():
+            if self.isCancelled():
+                break
+            ids.append(query.value(0))
+
+        query.clear()
+
+        return ids
@@ -0,0 +1,109 @@
+from PyQt5.QtSql import QSqlQuery
+
+# Coins positions are kept with gaps between sort_id values, so moved coin
+# gets a value between its new neighbours and other coins are not changed.
+# All coins are renumbered only when there is no gap left.
+SORT_STEP = 1024
+
+
+def _value(query):
+    if query.first() and not query.record().isNull(0):
+        return query.record().value(0)
+
+    return None
+
+
+def nextSortId(db):
+    query = QSqlQuery("SELECT MAX(sort_id) FROM coins", db)
+    sort_id = _value(query)
+    if sort_id is None:
+        return SORT_STEP
+
+    return sort_id + SORT_STEP
+
+
+def renumberSortIds(db):
+    # Restore gaps keeping current order of coins
+    QSqlQuery("DROP TABLE IF EXISTS temp.sort_order", db)
+    QSqlQuery("CREATE TEMP TABLE sort_order"
+              " (pos INTEGER PRIMARY KEY, id INTEGER UNIQUE)", db)
+    QSqlQuery("INSERT INTO temp.sort_order (id)"
+              " SELECT id FROM coins ORDER BY sort_id, id", db)
+    QSqlQuery("UPDATE coins SET sort_id=%d*(SELECT pos FROM temp.sort_order"
+              " WHERE sort_order.id=coins.id)" % SORT_STEP, db)
+    QSqlQuery("DROP TABLE temp.sort_order", db)
+
+
+def _sortIdNear(db, coin_id, moved_id, before):
+    query = QSqlQuery(db)
+    query.prepare("SELECT sort_id FROM coins WHERE id=?")
+    query.addBindValue(coin_id)
+    query.exec_()
+    sort_id = _value(query)
+    if sort_id is None:
+        return None
+
+    if before:
+        sql = "SELECT MAX(sort_id) FROM coins WHERE sort_id<? AND id<>?"
+    else:
+        sql = "SELECT MIN(sort_id) FROM coins WHERE sort_id>? AND id<>?"
+    query = QSqlQuery(db)
+    query.prepare(sql)
+    query.addBindValue(sort_id)
+    query.addBindValue(moved_id)
+    query.exec_()
+    neighbour = _value(query)
+
+    if neighbour is None:
+        if before:
+            return sort_id - SORT_STEP
+        else:
+            return sort_id + SORT_STEP
+
+    if abs(neighbour - sort_id) < 2:
+        return None
+
+    return (neighbour + sort_id) // 2
+
+
+def sortIdNear(db, coin_id, moved_id, before):
+    # Position for moved coin just before or after other coin
+    sort_id = _sortIdNear(db, coin_id, moved_id, before)
+    if sort_id is None:
+        # No gap left
+        renumberSortIds(db)
+        sort_id = _sortIdNear(db, coin_id, moved_id, before)
+
+    return sort_id
+
+
+def setSortOrder(db, ids):
+    # Coins get their sort_id values in a new order, so coins not in the list
+    # keep their positions
+    QSqlQuery("DROP TABLE IF EXISTS temp.new_order", db)
+    QSqlQuery("CREATE TEMP TABLE new_order"
+              " (pos INTEGER PRIMARY KEY, id INTEGER UNIQUE)", db)
+    QSqlQuery("DROP TABLE IF EXISTS temp.old_keys", db)
+    QSqlQuery("CREATE TEMP TABLE old_keys"
+              " (pos INTEGER PRIMARY KEY, sort_id INTEGER)", db)
+
+    query = QSqlQuery(db)
+    query.prepare("INSERT OR IGNORE INTO temp.new_order (id) VALUES (?)")
+    query.addBindValue(list(ids))
+    if not query.execBatch():
+        return False
+
+    QSqlQuery("INSERT INTO temp.old_keys (sort_id) SELECT sort_id FROM coins"
+              " WHERE id IN (SELECT id FROM temp.new_order)"
+              " ORDER BY sort_id, id", db)
+    query = QSqlQuery(db)
+    ret = query.exec_("UPDATE coins SET sort_id=(SELECT old_keys.sort_id"
+                      " FROM temp.new_order JOIN temp.old_keys"
+                      " ON old_keys.pos=new_order.pos"
+                      " WHERE new_order.id=coins.id)"
+                      " WHERE id IN (SELECT id FROM temp.new_order)")
+
+    QSqlQuery("DROP TABLE temp.new_order", db)
+    QSqlQuery("DROP TABLE temp.old_keys", db)
+
+    return ret
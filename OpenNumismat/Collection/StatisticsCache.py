@@ -0,0 +1,271 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QDate, QObject, pyqtSignal
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Tools.DatabaseWorker import DatabaseWorker
+
+
+def sqliteOrder(value):
+    # Sort key same as SQLite ordering of values with different types
+    if value is None:
+        return (0, 0)
+    elif isinstance(value, (int, float)):
+        return (1, value)
+    else:
+        return (2, str(value))
+
+
+# Approximate count of coins grouped by one query of worker
+AGGREGATE_PART = 20000
+
+
+def aggregate(db, groups, aggregates, conditions, source, worker=None):
+    sql = "SELECT %s, %s, COUNT(*) FROM %s" % (
+        ','.join(groups), ','.join(aggregates), source)
+    conditions = ['(%s)' % c for c in conditions]
+
+    ranges = [None]
+    if worker:
+        # Grouping is done before fetching the first row, so worker groups
+        # table by parts of ids and cancelled worker stops after current part
+        query = QSqlQuery(db)
+        if not query.exec_("SELECT MIN(id), MAX(id), COUNT(*) FROM %s" %
+                           source):
+            return None
+        query.next()
+        if query.isNull(0):
+            return {}
+        first, last = int(query.value(0)), int(query.value(1))
+        parts = (int(query.value(2)) - 1) // AGGREGATE_PART + 1
+        step = (last - first) // parts + 1
+        ranges = [(start, start + step - 1)
+                  for start in range(first, last + 1, step)]
+
+    data = {}
+    groups_count = len(groups)
+    for range_ in ranges:
+        if worker and worker.isCancelled():
+            return None
+
+        where = list(conditions)
+        if range_:
+            where.append("id BETWEEN %d AND %d" % range_)
+        part_sql = sql
+        if where:
+            part_sql += " WHERE " + ' AND '.join(where)
+        part_sql += " GROUP BY " + ','.join(groups)
+
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        if not query.exec_(part_sql):
+            return None
+
+        while query.next():
+            if worker and worker.isCancelled():
+                return None
+
+            record = query.record()
+            values = [None if record.isNull(i) else record.value(i)
+                      for i in range(record.count())]
+            group = tuple(values[:groups_count])
+            values = values[groups_count:]
+
+            current = data.get(group)
+            if current is None:
+                data[group] = values
+            else:
+                # Aggregates are additive, so parts are summed
+                for i, value in enumerate(values):
+                    if value is not None:
+                        current[i] = (current[i] or 0) + value
+
+    return data
+
+
+class AggregateWorker(DatabaseWorker):
+
+    def __init__(self, fileName, key, revision, generation):
+        super().__init__(fileName, generation)
+
+        self.key = key
+        self.revision = revision
+
+    def process(self, db):
+        groups, aggregates, conditions = self.key
+        return aggregate(db, groups, aggregates, conditions, 'coins',
+                         worker=self)
+
+
+# Grouped aggregates of coins used by statistics charts. Every aggregate is
+# calculated by database once and then kept up to date with changes saved by
+# model, so charts doesn't need scanning whole coins table after editing.
+# Aggregate expressions must be additive (count, sum).
+class StatisticsCache(QObject):
+    computed = pyqtSignal()
+
+    # Max count of stored aggregates
+    CACHE_SIZE = 16
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+
+        self.model = model
+        self.db = model.database()
+
+        self._items = OrderedDict()
+        self._revision = model.collection.dataRevision
+        self._date = None
+
+        self._worker = None
+        self._generation = 0
+
+        model.recordsChanged.connect(self.recordsChanged)
+
+    def clear(self):
+        self._items.clear()
+
+    def __key(self, groups, aggregates, conditions):
+        # Aggregates depended on current date, so they are reloaded every day
+        today = QDate.currentDate().toString(Qt.ISODate)
+        if (self._revision != self.model.collection.dataRevision or
+                self._date != today):
+            self.clear()
+            self._revision = self.model.collection.dataRevision
+            self._date = today
+
+        conditions = list(conditions)
+        filter_ = self.model.filter()
+        if filter_:
+            conditions.append(filter_)
+
+        return (tuple(groups), tuple(aggregates), tuple(conditions))
+
+    def __store(self, key, data):
+        self._items[key] = data
+        if len(self._items) > self.CACHE_SIZE:
+            self._items.popitem(last=False)
+
+    def cachedRows(self, groups, aggregates, conditions=()):
+        key = self.__key(groups, aggregates, conditions)
+        if key not in self._items:
+            return None
+
+        return self.__rows(key)
+
+    def compute(self, groups, aggregates, conditions=()):
+        # Previous request is superseded - its result will be dropped
+        self.cancel()
+
+        key = self.__key(groups, aggregates, conditions)
+        worker = AggregateWorker(self.db.databaseName(), key, self._revision,
+                                 self._generation)
+        worker.done.connect(self._computed)
+        self._worker = worker
+        worker.submit(self)
+
+    def cancel(self):
+        self._generation += 1
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+    def _computed(self, generation, data):
+        if generation != self._generation:
+            return
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.revision == self._revision:
+            if data is None:
+                # Filter uses temporary tables or database is locked
+                data = self.__aggregate(*worker.key, 'coins')
+            self.__store(worker.key, data)
+
+        self.computed.emit()
+
+    def __rows(self, key):
+        self._items.move_to_end(key)
+        data = self._items[key]
+
+        rows = []
+        for group in sorted(data, key=lambda g: tuple(map(sqliteOrder, g))):
+            # Last value is hidden rows count
+            rows.append(group + tuple(data[group][:-1]))
+
+        return rows
+
+    def recordsChanged(self, oldRecords, newRecords):
+        if (oldRecords is None or
+                self._revision + 1 != self.model.collection.dataRevision):
+            self.clear()
+        else:
+            ids = [str(record.value('id')) for record in newRecords]
+            oldSource = self.__oldCoinsTable(oldRecords)
+            for key, data in self._items.items():
+                groups, aggregates, conditions = key
+
+                if oldSource:
+                    delta = self.__aggregate(groups, aggregates, conditions,
+                                             oldSource)
+                    self.__apply(data, delta, -1)
+
+                if ids:
+                    id_condition = "id IN (%s)" % ','.join(ids)
+                    delta = self.__aggregate(groups, aggregates,
+                                             conditions + (id_condition,),
+                                             'coins')
+                    self.__apply(data, delta, 1)
+
+            QSqlQuery("DROP TABLE IF EXISTS temp.old_coins", self.db)
+
+        self._revision = self.model.collection.dataRevision
+
+    def __oldCoinsTable(self, records):
+        # Values of records before changing are checked as rows of coins
+        # table. Columns of table created by SELECT keep types of coins
+        # columns, so values are compared with filters as in coins
+        if not records:
+            return None
+
+        QSqlQuery("DROP TABLE IF EXISTS temp.old_coins", self.db)
+        QSqlQuery("CREATE TEMP TABLE old_coins AS"
+                  " SELECT * FROM coins WHERE 0", self.db)
+
+        coins = self.db.record('coins')
+        names = [records[0].fieldName(i) for i in range(records[0].count())]
+        names = [name for name in names if coins.contains(name)]
+
+        query = QSqlQuery(self.db)
+        query.prepare("INSERT INTO temp.old_coins (%s) VALUES (%s)" % (
+            ','.join(names), ','.join('?' * len(names))))
+        for record in records:
+            for name in names:
+                query.addBindValue(record.value(name))
+            query.exec_()
+
+        return "temp.old_coins AS coins"
+
+    def __aggregate(self, groups, aggregates, conditions, source):
+        data = aggregate(self.db, groups, aggregates, conditions, source)
+        if data is None:
+            return {}
+
+        return data
+
+    @staticmethod
+    def __apply(data, delta, sign):
+        for group, values in delta.items():
+            current = data.get(group)
+            if current is None:
+                if sign > 0:
+                    data[group] = values
+                continue
+
+            for i, value in enumerate(values):
+                if value is not None:
+                    current[i] = (current[i] or 0) + sign * value
+
+            if current[-1] <= 0:
+                del data[group]
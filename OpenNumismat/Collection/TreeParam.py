@@ -1,6 +1,8 @@
 from PyQt5 import QtCore
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery
 
+from OpenNumismat.Collection.Indexes import refreshIndexes
+
 
 class TreeParam(QtCore.QObject):
     def __init__(self, page):
@@ -91,6 +93,8 @@ class TreeParam(QtCore.QObject):
 
         self.db.commit()
 
+        refreshIndexes(self.db, self.fields)
+
     def remove(self):
         query = QSqlQuery(self.db)
         query.prepare("DELETE FROM treeparam WHERE pageid=?")
@@ -4,6 +4,11 @@ from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtCore import QSettings
 
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+from OpenNumismat.Collection.SearchIndex import createSearchIndex
+from OpenNumismat.Collection.Indexes import updateIndexes
+from OpenNumismat.Collection.Photos import imageHash, createPhotosIndex
+from OpenNumismat.Collection.Sorting import renumberSortIds
+from OpenNumismat.Collection.CollectionFields import ImageFields
 from OpenNumismat.Tools import Gui
 
 
@@ -43,6 +48,18 @@ class Updater(QtCore.QObject):
             if self.currentVersion < 8:
                 updater = UpdaterTo8(self.collection)
                 updater.update()
+            if self.currentVersion < 9:
+                updater = UpdaterTo9(self.collection)
+                updater.update()
+            if self.currentVersion < 10:
+                updater = UpdaterTo10(self.collection)
+                updater.update()
+            if self.currentVersion < 11:
+                updater = UpdaterTo11(self.collection)
+                updater.update()
+            if self.currentVersion < 12:
+                updater = UpdaterTo12(self.collection)
+                updater.update()
 
             self.__finalize()
 
@@ -553,6 +570,184 @@ class UpdaterTo8(_Updater):
         self._finish()
 
 
+class UpdaterTo9(_Updater):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.progressDlg.setMinimumDuration(0)
+
+    def getTotalCount(self):
+        return 2
+
+    def update(self):
+        self._begin()
+
+        self.db.transaction()
+
+        self._updateRecord()
+
+        self.progressDlg.setLabelText(self.tr("Creating search index..."))
+
+        createSearchIndex(self.db)
+
+        self.collection.settings['Version'] = 9
+        self.collection.settings.save()
+
+        self.db.commit()
+
+        self._finish()
+
+
+class UpdaterTo10(_Updater):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.progressDlg.setMinimumDuration(0)
+
+    def getTotalCount(self):
+        return 2
+
+    def update(self):
+        self._begin()
+
+        self.db.transaction()
+
+        self._updateRecord()
+
+        self.progressDlg.setLabelText(self.tr("Creating indexes..."))
+
+        updateIndexes(self.db, self.collection.fields)
+
+        self.collection.settings['Version'] = 10
+        self.collection.settings.save()
+
+        self.db.commit()
+
+        self._finish()
+
+
+class UpdaterTo11(_Updater):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.progressDlg.setMinimumDuration(0)
+
+    def getTotalCount(self):
+        query = QSqlQuery("SELECT count(*) FROM photos", self.db)
+        query.first()
+        return query.record().value(0) + 1
+
+    def update(self):
+        self._begin()
+
+        self.db.transaction()
+
+        sql = "ALTER TABLE photos ADD COLUMN hash TEXT"
+        QSqlQuery(sql, self.db)
+        sql = "ALTER TABLE photos ADD COLUMN refs INTEGER"
+        QSqlQuery(sql, self.db)
+
+        sql = "CREATE TEMP TABLE photos_map (old INTEGER PRIMARY KEY, new INTEGER)"
+        QSqlQuery(sql, self.db)
+
+        # Keep first of equal photos and map others to it
+        stored = {}
+        query = QSqlQuery(self.db)
+        query.setForwardOnly(True)
+        query.exec_("SELECT id, title, image FROM photos ORDER BY id")
+        while query.next():
+            self._updateRecord()
+
+            record = query.record()
+            img_id = record.value('id')
+            title = None if record.isNull('title') else record.value('title')
+            hash_ = imageHash(record.value('image'))
+
+            key = (hash_, title or '')
+            if key in stored:
+                map_query = QSqlQuery(self.db)
+                map_query.prepare("INSERT INTO temp.photos_map (old, new) VALUES (?, ?)")
+                map_query.addBindValue(img_id)
+                map_query.addBindValue(stored[key])
+                map_query.exec_()
+            else:
+                stored[key] = img_id
+
+                hash_query = QSqlQuery(self.db)
+                hash_query.prepare("UPDATE photos SET hash=? WHERE id=?")
+                hash_query.addBindValue(hash_)
+                hash_query.addBindValue(img_id)
+                hash_query.exec_()
+
+        self._updateRecord()
+
+        self.progressDlg.setLabelText(self.tr("Removing duplicate images..."))
+
+        for field in ImageFields:
+            sql = "UPDATE coins SET %s=(SELECT new FROM temp.photos_map WHERE old=coins.%s)\
+                    WHERE %s IN (SELECT old FROM temp.photos_map)" % (field, field, field)
+            QSqlQuery(sql, self.db)
+
+        sql = "DELETE FROM photos WHERE id IN (SELECT old FROM temp.photos_map)"
+        QSqlQuery(sql, self.db)
+        sql = "DROP TABLE temp.photos_map"
+        QSqlQuery(sql, self.db)
+
+        sql = "CREATE TEMP TABLE photos_refs (id INTEGER PRIMARY KEY, refs INTEGER)"
+        QSqlQuery(sql, self.db)
+        ids = ' UNION ALL '.join(['SELECT %s AS id FROM coins' % field
+                                  for field in ImageFields])
+        sql = "INSERT INTO temp.photos_refs (id, refs)\
+                SELECT id, count(*) FROM (%s) WHERE id IS NOT NULL GROUP BY id" % ids
+        QSqlQuery(sql, self.db)
+        sql = "UPDATE photos SET refs=(SELECT refs FROM temp.photos_refs WHERE photos_refs.id=photos.id)"
+        QSqlQuery(sql, self.db)
+        sql = "DROP TABLE temp.photos_refs"
+        QSqlQuery(sql, self.db)
+
+        # Photos not used by any coin
+        sql = "DELETE FROM photos WHERE refs IS NULL"
+        QSqlQuery(sql, self.db)
+
+        createPhotosIndex(self.db)
+
+        self.collection.settings['Version'] = 11
+        self.collection.settings.save()
+
+        self.db.commit()
+
+        self._finish()
+
+
+class UpdaterTo12(_Updater):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.progressDlg.setMinimumDuration(0)
+
+    def getTotalCount(self):
+        return 2
+
+    def update(self):
+        self._begin()
+
+        self.db.transaction()
+
+        self._updateRecord()
+
+        # Make gaps between positions of coins
+        renumberSortIds(self.db)
+
+        self._updateRecord()
+
+        self.collection.settings['Version'] = 12
+        self.collection.settings.save()
+
+        self.db.commit()
+
+        self._finish()
+
+
 def updateCollection(collection):
     updater = Updater(collection, collection.parent())
     if updater.check():
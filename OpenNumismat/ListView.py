@@ -4,9 +4,9 @@ import os.path
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import Qt, pyqtSignal, QSortFilterProxyModel
-from PyQt5.QtCore import QCollator, QLocale
+from PyQt5.QtCore import QCollator, QCollatorSortKey, QLocale
 from PyQt5.QtCore import QAbstractProxyModel, QModelIndex, QItemSelectionModel
-from PyQt5.QtCore import QRectF, QRect
+from PyQt5.QtCore import QRectF, QRect, QSize
 from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
@@ -17,7 +17,7 @@ from OpenNumismat.EditCoinDialog.EditCoinDialog import EditCoinDialog
 from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
 from OpenNumismat.Collection.CollectionFields import StatusesOrder
 from OpenNumismat.SelectColumnsDialog import SelectColumnsDialog
-from OpenNumismat.Collection.HeaderFilterMenu import FilterMenuButton
+from OpenNumismat.Collection.HeaderFilterMenu import FilterMenuButton, DistinctValuesCache
 from OpenNumismat.Tools import Gui, TemporaryDir
 from OpenNumismat.Reports.Report import Report
 from OpenNumismat.Reports.Preview import PreviewDialog
@@ -25,6 +25,7 @@ from OpenNumismat.Settings import Settings
 from OpenNumismat.Reports.ExportList import ExportToExcel, ExportToHtml, ExportToCsv, ExportToCsvUtf8
 from OpenNumismat.Tools.Gui import getSaveFileName
 from OpenNumismat.Collection.HeaderFilterMenu import ColumnFilters, ValueFilter, DataFilter, BlankFilter
+from OpenNumismat.Collection.SearchIndex import searchFilter
 
 
 def textToClipboard(text):
@@ -327,23 +328,29 @@ class BaseTableView(QTableView):
         for index in indexes:
             record = self.model().record(index.row())
             for i in range(multiRecord.count()):
-                value = record.value(i)
-                if multiRecord.value(i) != value or not value:
+                # Images are compared without loading
+                value = record.storedValue(i)
+                if multiRecord.storedValue(i) != value or not value:
                     multiRecord.setNull(i)
                     usedFields[i] = Qt.Unchecked
 
         dialog = EditCoinDialog(self.model(), multiRecord, self, usedFields)
         result = dialog.exec_()
         if result == QDialog.Accepted:
+            multiRecord = dialog.record
+            usedFields = dialog.getUsedFields()
+
+            values = self.model().bulkValues(multiRecord, usedFields)
+            if values is not None:
+                ids = [self.model().recordId(index.row()) for index in indexes]
+                self.model().updateRecords(ids, values)
+                return
+
             progressDlg = Gui.ProgressDialog(
                 QApplication.translate('BaseTableView', "Updating records"),
                 QApplication.translate('BaseTableView', "Cancel"),
                 len(indexes), self)
 
-            # Fill records by used fields in multi record
-            multiRecord = dialog.record
-            usedFields = dialog.getUsedFields()
-
             # Sort and reverse indexes for updating records that out
             # filtered after updating
             rindexes = sorted(indexes, key=operator.methodcaller('row'),
@@ -353,9 +360,12 @@ class BaseTableView(QTableView):
                 if progressDlg.wasCanceled():
                     break
 
+                # Fill record by used fields in multi record
                 record = self.model().record(index.row())
                 for i in range(multiRecord.count()):
-                    if usedFields[i] == Qt.Checked:
+                    # Unchanged common value is already in every record
+                    if (usedFields[i] == Qt.Checked and
+                            not multiRecord.isStored(i)):
                         record.setValue(i, multiRecord.value(i))
                 self.model().setRecord(index.row(), record)
 
@@ -494,24 +504,9 @@ class BaseTableView(QTableView):
             QMessageBox.Yes | QMessageBox.Cancel,
             QMessageBox.Cancel)
         if result == QMessageBox.Yes:
-            progressDlg = Gui.ProgressDialog(
-                QApplication.translate('BaseTableView', "Deleting records"),
-                QApplication.translate('BaseTableView', "Cancel"),
-                len(indexes), self)
-
             model = self.model()
-            for index in indexes:
-                progressDlg.step()
-                if progressDlg.wasCanceled():
-                    break
-
-                model.removeRow(index.row())
-
-            progressDlg.setLabelText(
-                QApplication.translate('BaseTableView', "Saving..."))
-            model.submitAll()
-
-            progressDlg.reset()
+            ids = [model.recordId(index.row()) for index in indexes]
+            model.removeRecords(ids)
 
     def _clone(self, index=None):
         if not index:
@@ -526,14 +521,11 @@ class ImageDelegate(QStyledItemDelegate):
         QStyledItemDelegate.__init__(self, parent)
 
     def paint(self, painter, option, index):
-        data = index.data()
-        if data and not data.isNull():
-            image = QImage()
-            image.loadFromData(data)
-            rect = option.rect
-            scaledImage = image.scaled(rect.width(), rect.height(),
-                                Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            pixmap = QPixmap.fromImage(scaledImage)
+        model = index.model().model
+        orig_index = index.model().mapToSource(index)
+        rect = option.rect
+        pixmap = model.getPixmap(orig_index, rect.size())
+        if pixmap and not pixmap.isNull():
             # Set rect at center of item
             rect.translate((rect.width() - pixmap.width()) // 2,
                            (rect.height() - pixmap.height()) // 2)
@@ -556,23 +548,59 @@ class SortFilterProxyModel(QSortFilterProxyModel):
         self.collator = QCollator(QLocale(locale))
         self.collator.setNumericMode(True)
 
-    def lessThan(self, left, right):
-        if left.column() == self.status_id:
-            leftData = self.model.dataDisplayRole(left)
-            rightData = self.model.dataDisplayRole(right)
-            return StatusesOrder[leftData] < StatusesOrder[rightData]
+        # Sort keys by column and source row
+        self._sortKeys = {}
+        model.modelReset.connect(self.clearSortKeys)
+        model.layoutChanged.connect(self.clearSortKeys)
+        model.rowsInserted.connect(self.clearSortKeys)
+        model.rowsRemoved.connect(self.clearSortKeys)
+        model.dataChanged.connect(self.dataChangedEvent)
+
+    def clearSortKeys(self, *_args):
+        self._sortKeys = {}
+
+    def dataChangedEvent(self, topLeft, bottomRight, _roles=None):
+        for keys in self._sortKeys.values():
+            for row in range(topLeft.row(), bottomRight.row() + 1):
+                keys.pop(row, None)
+
+    def sortKey(self, index):
+        keys = self._sortKeys.setdefault(index.column(), {})
+        row = index.row()
+        if row not in keys:
+            data = self.model.dataDisplayRole(index)
+            if index.column() == self.status_id:
+                keys[row] = StatusesOrder.get(data, 0)
+            elif isinstance(data, str):
+                keys[row] = self.collator.sortKey(data)
+            else:
+                keys[row] = data
+
+        return keys[row]
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= 0 and self.model.sortExpression(column):
+            # Rows are ordered by database
+            super().sort(-1, order)
+            self.model.setSortOrder(column, order)
         else:
-            leftData = self.model.dataDisplayRole(left)
-            rightData = self.model.dataDisplayRole(right)
+            super().sort(column, order)
 
-            if isinstance(leftData, str):
-                rightData = str(rightData)
-                return self.collator.compare(leftData, rightData) < 0
-            elif isinstance(rightData, str):
-                leftData = str(leftData)
-                return self.collator.compare(leftData, rightData) < 0
+    def lessThan(self, left, right):
+        leftKey = self.sortKey(left)
+        rightKey = self.sortKey(right)
+
+        leftIsStr = isinstance(leftKey, QCollatorSortKey)
+        rightIsStr = isinstance(rightKey, QCollatorSortKey)
+        if leftIsStr and rightIsStr:
+            return leftKey.compare(rightKey) < 0
+        elif leftIsStr or rightIsStr:
+            # Mixed types in column - compare as strings
+            leftData = str(self.model.dataDisplayRole(left))
+            rightData = str(self.model.dataDisplayRole(right))
+            return self.collator.compare(leftData, rightData) < 0
 
-            return leftData < rightData
+        return leftKey < rightKey
 
     def flags(self, index):
         return super().flags(index) | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled
@@ -690,6 +718,7 @@ class ListView(BaseTableView):
         self.listParam.save_filters()
         self.searchText = ''
         self.model().clearFilters()
+        ColumnFilters.dropUnusedTables(self.model())
 
     def model(self):
         if not super().model():
@@ -703,15 +732,19 @@ class ListView(BaseTableView):
         super().setModel(self.proxyModel)
         model.proxy = self.proxyModel
 
+        self.distinctValues = DistinctValuesCache(model)
+
         self.headerButtons = []
         for param in self.listParam.columns:
             btn = FilterMenuButton(param, self.listParam, self.model(),
+                                   self.distinctValues,
                                    self.horizontalHeader())
             self.headerButtons.append(btn)
 
         filtersSql = FilterMenuButton.filtersToSql(
-                                            self.listParam.filters.values())
+                            self.listParam.filters.values(), model.database())
         self.model().setFilter(filtersSql)
+        ColumnFilters.dropUnusedTables(self.model())
 
         self.horizontalHeader().sectionResized.disconnect(self.columnResized)
         self.horizontalHeader().sortIndicatorChanged.disconnect(
@@ -956,17 +989,6 @@ class ListView(BaseTableView):
         model = self.model()
 
         if text:
-            val = "'%%%s%%'" % text.replace("'", "''")
-            values = []
-            val_lower = val.lower()
-            values.append(val_lower)
-            val_upper = val.upper()
-            if val_lower != val_upper:
-                values.append(val_upper)
-                values.append(val.title())
-            if val not in values:
-                values.append(val)
-
             parts = []
             for param in self.listParam.columns:
                 if not param.enabled:
@@ -978,11 +1000,7 @@ class ListView(BaseTableView):
 
                 parts.append(field.name)
 
-            sql = []
-            for part in parts:
-                for val in values:
-                    sql.append("%s LIKE %s" % (part, val))
-            model.setSearchFilter('(' + ' OR '.join(sql) + ')')
+            model.search(searchFilter(model.database(), text, parts))
         else:
             model.setSearchFilter('')
 
@@ -1006,7 +1024,6 @@ class IconDelegate(QStyledItemDelegate):
         orig_index = index.model().mapToSource(index)
         if orig_index.isValid():
             image_index = model.index(orig_index.row(), model.fields.image.id)
-            image_data = image_index.data()
             title_index = model.index(orig_index.row(), model.fields.title.id)
             title = title_index.data()
 
@@ -1034,19 +1051,14 @@ class IconDelegate(QStyledItemDelegate):
             text_option.setWrapMode(QTextOption.WrapAtWordBoundaryOrAnywhere)
             painter.drawText(QRectF(text_rect), title, text_option)
 
-            image = QImage()
-            image.loadFromData(image_data)
-            if rect.width() - 1 < image.width():
-                scaledImage = image.scaledToWidth(rect.width() - 2,
-                                                  Qt.SmoothTransformation)
-            else:
-                scaledImage = image
-            pixmap = QPixmap.fromImage(scaledImage)
-            # Set rect at center of item
-            rect.translate((rect.width() - pixmap.width()) // 2,
-                           (rect.height() + 35 - pixmap.height()) // 2)
-            rect.setSize(pixmap.size())
-            painter.drawPixmap(rect, pixmap)
+            pixmap = model.getPixmap(image_index,
+                                     QSize(rect.width() - 2, rect.height()))
+            if pixmap:
+                # Set rect at center of item
+                rect.translate((rect.width() - pixmap.width()) // 2,
+                               (rect.height() + 35 - pixmap.height()) // 2)
+                rect.setSize(pixmap.size())
+                painter.drawPixmap(rect, pixmap)
 
 
 class CardDelegate(QStyledItemDelegate):
@@ -1056,9 +1068,7 @@ class CardDelegate(QStyledItemDelegate):
         orig_index = index.model().mapToSource(index)
         if orig_index.isValid():
             obverse_index = model.index(orig_index.row(), model.fields.obverseimg.id)
-            obverse_data = obverse_index.data()
             reverse_index = model.index(orig_index.row(), model.fields.reverseimg.id)
-            reverse_data = reverse_index.data()
             title_index = model.index(orig_index.row(), model.fields.title.id)
             title = title_index.data()
 
@@ -1094,36 +1104,24 @@ class CardDelegate(QStyledItemDelegate):
             maxWidth = obverse_rect.width() - 4
             maxHeight = obverse_rect.height() - 4
 
-            image = QImage()
-            image.loadFromData(obverse_data)
-            if image.width() > maxWidth or image.height() > maxHeight:
-                scaledImage = image.scaled(maxWidth, maxHeight,
-                                Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            else:
-                scaledImage = image
-            pixmap = QPixmap.fromImage(scaledImage)
-            # Set rect at center of item
-            obverse_rect.translate((obverse_rect.width() - pixmap.width()) // 2,
-                                   (obverse_rect.height() - pixmap.height()) // 2)
-            obverse_rect.setSize(pixmap.size())
-            painter.drawPixmap(obverse_rect, pixmap)
+            pixmap = model.getPixmap(obverse_index, QSize(maxWidth, maxHeight))
+            if pixmap:
+                # Set rect at center of item
+                obverse_rect.translate((obverse_rect.width() - pixmap.width()) // 2,
+                                       (obverse_rect.height() - pixmap.height()) // 2)
+                obverse_rect.setSize(pixmap.size())
+                painter.drawPixmap(obverse_rect, pixmap)
 
             reverse_rect = QRect(rect.x(), rect.y() + rect.height() // 2,
                                  rect.width(), rect.height() // 2)
 
-            image = QImage()
-            image.loadFromData(reverse_data)
-            if image.width() > maxWidth or image.height() > maxHeight:
-                scaledImage = image.scaled(maxWidth, maxHeight,
-                                Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            else:
-                scaledImage = image
-            pixmap = QPixmap.fromImage(scaledImage)
-            # Set rect at center of item
-            reverse_rect.translate((reverse_rect.width() - pixmap.width()) // 2,
-                                   (reverse_rect.height() - pixmap.height()) // 2)
-            reverse_rect.setSize(pixmap.size())
-            painter.drawPixmap(reverse_rect, pixmap)
+            pixmap = model.getPixmap(reverse_index, QSize(maxWidth, maxHeight))
+            if pixmap:
+                # Set rect at center of item
+                reverse_rect.translate((reverse_rect.width() - pixmap.width()) // 2,
+                                       (reverse_rect.height() - pixmap.height()) // 2)
+                reverse_rect.setSize(pixmap.size())
+                painter.drawPixmap(reverse_rect, pixmap)
 
 
 class CardModel(QAbstractProxyModel):
@@ -1253,6 +1251,7 @@ class IconView(BaseTableView):
     def clearAllFilters(self):
         self.searchText = ''
         self.model().clearFilters()
+        ColumnFilters.dropUnusedTables(self.model())
 
     def contextMenuEvent(self, pos):
         selected_count = len(self.selectedCoins())
@@ -1358,23 +1357,8 @@ class IconView(BaseTableView):
         model = self.model()
 
         if text:
-            val = "'%%%s%%'" % text.replace("'", "''")
-            values = []
-            val_lower = val.lower()
-            values.append(val_lower)
-            val_upper = val.upper()
-            if val_lower != val_upper:
-                values.append(val_upper)
-                values.append(val.title())
-            if val not in values:
-                values.append(val)
-
             parts = ('title',)
-            sql = []
-            for part in parts:
-                for val in values:
-                    sql.append("%s LIKE %s" % (part, val))
-            model.setSearchFilter('(' + ' OR '.join(sql) + ')')
+            model.search(searchFilter(model.database(), text, parts))
         else:
             model.setSearchFilter('')
 
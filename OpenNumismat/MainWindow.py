@@ -222,6 +222,11 @@ class MainWindow(QMainWindow):
             self.collectionActs.append(importTellicoAct)
             importMenu.addAction(importTellicoAct)
 
+        importJsonAct = QAction(QIcon(':/json.png'), "JSON", self)
+        importJsonAct.triggered.connect(self.importJson)
+        self.collectionActs.append(importJsonAct)
+        importMenu.addAction(importJsonAct)
+
         mergeCollectionAct = QAction(
                                     QIcon(':/refresh.png'),
                                     self.tr("Synchronize..."), self)
@@ -680,6 +685,13 @@ class MainWindow(QMainWindow):
         imp = ImportNumista(self)
         imp.importData('Numista', self.viewTab.currentModel())
 
+    def importJson(self):
+        defaultDir = QFileInfo(self.collection.getFileName()).absolutePath()
+        file, _selectedFilter = QFileDialog.getOpenFileName(
+            self, self.tr("Select file"), defaultDir, "*.json *.ndjson *.zip")
+        if file:
+            self.collection.importFromJson(file)
+
     def exportMobile(self):
         dialog = ExportDialog(self.collection, self)
         res = dialog.exec_()
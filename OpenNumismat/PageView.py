@@ -203,6 +203,8 @@ class TreeView(QTreeWidget):
     FieldsRole = Qt.UserRole + 1
     ParamRole = Qt.UserRole + 2
     SortDataRole = Qt.UserRole + 3
+    ConditionsRole = Qt.UserRole + 4
+    LabelRole = Qt.UserRole + 5
 
     def __init__(self, treeParam, parent=None):
         super().__init__(parent)
@@ -221,11 +223,16 @@ class TreeView(QTreeWidget):
 
         self.treeParam = treeParam
 
+        # Grouped values with coins count by fields and filter of tree level
+        self._cache = {}
+        self._revision = None
+
         # Changing of TreeView is enabled (by signals from model or ListView)
         self.changingEnabled = True
 
         locale = Settings()['locale']
-        self.collator = QCollator(QLocale(locale))
+        self.locale = QLocale(locale)
+        self.collator = QCollator(self.locale)
         self.collator.setNumericMode(True)
 
         self.setItemDelegate(AutoToolTipDelegate())
@@ -243,40 +250,67 @@ class TreeView(QTreeWidget):
         self.addTopLevelItem(rootItem)
 
     def expandedEvent(self, item):
-        for i in range(item.childCount()):
-            child = item.child(i)
-            if child.childCount() == 0:
-                paramIndex = child.data(0, self.ParamRole) + 1
-                filters = child.data(0, self.FiltersRole)
-                self.__updateChilds(child, paramIndex, filters)
+        if item.childCount() == 0:
+            self.__updateChilds(item)
 
         self.resizeColumnToContents(0)
 
     def collapsedEvent(self, _parentItem):
         self.resizeColumnToContents(0)
 
-    def __updateChilds(self, item, paramIndex=0, filters=''):
+    def __childsParam(self, item):
+        if item.parent():
+            paramIndex = item.data(0, self.ParamRole) + 1
+        else:
+            paramIndex = 0
+        filters = item.data(0, self.FiltersRole)
+        conditions = item.data(0, self.ConditionsRole) or []
+
+        return paramIndex, filters, conditions
+
+    def __groups(self, fields, filters, conditions):
+        key = (tuple(fields), filters)
+        if key not in self._cache:
+            sql_fields = ','.join(fields)
+            sql = "SELECT %s, COUNT(*) FROM coins" % sql_fields
+            if filters:
+                sql += " WHERE " + filters
+            sql += " GROUP BY " + sql_fields
+            query = QtSql.QSqlQuery(sql, self.db)
+            rows = []
+            count_column = len(fields)
+            while query.next():
+                record = query.record()
+                values = [None if record.isNull(i) else record.value(i)
+                          for i in range(count_column)]
+                rows.append((values, record.value(count_column)))
+
+            self._cache[key] = (conditions, rows)
+
+        return self._cache[key][1]
+
+    def __createChilds(self, paramIndex, filters, conditions):
         fields = self.treeParam.fieldNames(paramIndex)
         if not fields:
-            return
+            return []
+
+        hasNext = bool(self.treeParam.fieldNames(paramIndex + 1))
 
-        sql = "SELECT DISTINCT %s FROM coins" % ','.join(fields)
-        if filters:
-            sql += " WHERE " + filters
-        query = QtSql.QSqlQuery(sql, self.db)
-        hasEmpty = False
-        while query.next():
-            record = query.record()
+        childs = []
+        emptyCount = 0
+        for row, count in self.__groups(fields, filters, conditions):
+            hasEmpty = False
             data = []
             orig_data = []
             filterSql = []
-            for i in range(record.count()):
-                if record.isNull(i):
+            newConditions = list(conditions)
+            for i, value in enumerate(row):
+                if value is None:
                     hasEmpty = True
                     continue
 
-                orig_data.append(record.value(i))
-                text = str(record.value(i))
+                orig_data.append(value)
+                text = str(value)
                 if text:
                     if fields[i] == 'status':
                         data.append(Statuses[text])
@@ -296,19 +330,23 @@ class TreeView(QTreeWidget):
                         data.append(text)
                     escapedText = text.replace("'", "''")
                     filterSql.append("%s='%s'" % (fields[i], escapedText))
+                    newConditions.append((fields[i], text))
                 else:
                     hasEmpty = True
 
+            if hasEmpty:
+                emptyCount += count
+
             if data:
                 if len(data) > 1:
                     newFilters = ' AND '.join(filterSql)
                     text = ' '.join(data)
-                    child = TreeWidgetItem([text, ])
-                    child.setData(0, self.SortDataRole, orig_data)
                 else:
                     newFilters = filterSql[0]
-                    child = TreeWidgetItem(data)
-                    child.setData(0, self.SortDataRole, orig_data)
+                    text = data[0]
+                child = TreeWidgetItem([self.__countText(text, count), ])
+                child.setData(0, self.SortDataRole, orig_data)
+                child.setData(0, self.LabelRole, text)
 
                 if filters:
                     newFilters = filters + ' AND ' + newFilters
@@ -316,54 +354,158 @@ class TreeView(QTreeWidget):
                 child.setData(0, self.ParamRole, paramIndex)
                 child.setData(0, self.FiltersRole, newFilters)
                 child.setData(0, self.FieldsRole, fields)
+                child.setData(0, self.ConditionsRole, newConditions)
+                if hasNext:
+                    child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
 
                 icon = self.reference.getIcon(fields[0], data[0])
                 if icon:
                     child.setIcon(0, icon)
 
-                item.addChild(child)
-
-                # Restore selection
-                if newFilters == self.model.extFilter:
-                    self.currentItemChanged.disconnect(self.itemActivatedEvent)
-                    self.setCurrentItem(child)
-                    self.currentItemChanged.connect(self.itemActivatedEvent)
+                childs.append(child)
 
-        item.sortChildren(0, Qt.AscendingOrder)
-
-        if hasEmpty and len(fields) == 1 and item.childCount() > 0:
+        if emptyCount and len(fields) == 1 and childs:
             text = self.tr("Other")
             newFilters = "ifnull(%s,'')=''" % fields[0]
             if filters:
                 newFilters = filters + ' AND ' + newFilters
 
-            child = QTreeWidgetItem([text, ])
+            child = QTreeWidgetItem([self.__countText(text, emptyCount), ])
+            child.setData(0, self.LabelRole, text)
             child.setData(0, self.ParamRole, paramIndex)
             child.setData(0, self.FiltersRole, newFilters)
             child.setData(0, self.FieldsRole, fields)
-            item.addChild(child)
+            child.setData(0, self.ConditionsRole,
+                          conditions + [(fields[0], None)])
+            if hasNext:
+                child.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+            childs.append(child)
+
+        # Recursion for next field if nothing selected
+        if not childs:
+            return self.__createChilds(paramIndex + 1, filters, conditions)
+
+        return childs
+
+    def __countText(self, text, count):
+        return "%s (%s)" % (text, self.locale.toString(count))
+
+    def __addChilds(self, item, childs):
+        item.addChildren(childs)
 
-            # Restore selection
-            if newFilters == self.model.extFilter:
+        # Restore selection
+        for child in childs:
+            if child.data(0, self.FiltersRole) == self.model.extFilter:
                 self.currentItemChanged.disconnect(self.itemActivatedEvent)
                 self.setCurrentItem(child)
                 self.currentItemChanged.connect(self.itemActivatedEvent)
 
-        # Recursion for next field if nothing selected
+    def __updateChilds(self, item):
+        childs = self.__createChilds(*self.__childsParam(item))
+        if childs:
+            self.__addChilds(item, childs)
+            item.sortChildren(0, Qt.AscendingOrder)
+        else:
+            item.setChildIndicatorPolicy(
+                QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def __refreshItem(self, item):
         if item.childCount() == 0:
-            self.__updateChilds(item, paramIndex + 1, filters)
+            # Not loaded yet - will be filled on expanding
+            if item.parent():
+                paramIndex = item.data(0, self.ParamRole) + 1
+                if self.treeParam.fieldNames(paramIndex):
+                    item.setChildIndicatorPolicy(
+                        QTreeWidgetItem.ShowIndicator)
+            return
+
+        paramIndex, filters, conditions = self.__childsParam(item)
+        key = (tuple(self.treeParam.fieldNames(paramIndex)), filters)
+        if key not in self._cache:
+            oldChilds = {}
+            for i in range(item.childCount()):
+                child = item.child(i)
+                oldChilds[child.data(0, self.FiltersRole)] = child
+
+            newChilds = []
+            for child in self.__createChilds(paramIndex, filters, conditions):
+                filter_ = child.data(0, self.FiltersRole)
+                oldChild = oldChilds.pop(filter_, None)
+                if oldChild is None:
+                    newChilds.append(child)
+                else:
+                    # Update coins count
+                    oldChild.setText(0, child.text(0))
+
+            for child in oldChilds.values():
+                item.removeChild(child)
+            self.__addChilds(item, newChilds)
+            item.sortChildren(0, Qt.AscendingOrder)
+
+        for i in range(item.childCount()):
+            self.__refreshItem(item.child(i))
+
+    @staticmethod
+    def __isMatched(record, conditions):
+        for field, value in conditions:
+            recordValue = record.value(field)
+            if value is None:
+                if recordValue is not None and str(recordValue):
+                    return False
+            elif recordValue is None or str(recordValue) != value:
+                return False
+
+        return True
+
+    def __refresh(self):
+        self.currentItemChanged.disconnect(self.itemActivatedEvent)
+        self.__refreshItem(self.topLevelItem(0))
+        self.currentItemChanged.connect(self.itemActivatedEvent)
+
+        self._revision = self.model.collection.dataRevision
+        self.resizeColumnToContents(0)
+
+    def __rebuild(self):
+        self._cache = {}
+
+        self.collapseAll()
+        rootItem = self.topLevelItem(0)
+
+        self.currentItemChanged.disconnect(self.itemActivatedEvent)
+        rootItem.takeChildren()  # remove all children
+        self.currentItemChanged.connect(self.itemActivatedEvent)
+
+        self.__updateChilds(rootItem)
+        self.expandItem(rootItem)
+
+        self._revision = self.model.collection.dataRevision
 
     def modelChanged(self):
         if self.changingEnabled:
-            self.collapseAll()
-            rootItem = self.topLevelItem(0)
+            if self._revision is None:
+                self.__rebuild()
+            elif self._revision != self.model.collection.dataRevision:
+                # Collection was changed from another page
+                self._cache = {}
+                self.__refresh()
+
+    def recordsChanged(self, oldRecords, newRecords):
+        if self._revision is None:
+            return
 
-            self.currentItemChanged.disconnect(self.itemActivatedEvent)
-            rootItem.takeChildren()  # remove all children
-            self.currentItemChanged.connect(self.itemActivatedEvent)
+        if (oldRecords is None or
+                self._revision + 1 != self.model.collection.dataRevision):
+            self._cache = {}
+        else:
+            # Drop cached levels that contain changed records only
+            records = oldRecords + newRecords
+            for key, (conditions, _rows) in list(self._cache.items()):
+                for record in records:
+                    if self.__isMatched(record, conditions):
+                        del self._cache[key]
+                        break
 
-            self.__updateChilds(rootItem)
-            self.expandItem(rootItem)
+        self.__refresh()
 
     def rowChangedEvent(self, current):
         if self.changingEnabled:
@@ -375,10 +517,13 @@ class TreeView(QTreeWidget):
         if not parent:
             parent = self.topLevelItem(0)
 
+        if parent.childCount() == 0:
+            self.__updateChilds(parent)
+
         for i in range(parent.childCount()):
             subItem = parent.child(i)
             fields = subItem.data(0, self.FieldsRole)
-            text1 = subItem.text(0)
+            text1 = subItem.data(0, self.LabelRole)
             textPart = []
             for field in fields:
                 index = self.model.index(index.row(),
@@ -436,7 +581,7 @@ class TreeView(QTreeWidget):
         dialog = CustomizeTreeDialog(self.model, self.treeParam, self)
         if dialog.exec_() == QDialog.Accepted:
             self.treeParam.save()
-            self.modelChanged()
+            self.__rebuild()
 
     def _addCoin(self):
         self.changingEnabled = False
@@ -445,16 +590,18 @@ class TreeView(QTreeWidget):
         self.model.setFilter('')
         self.changingEnabled = True
 
-        newRecord = self.model.record()
         # Fill new record with values of first record
-        for j in range(newRecord.count()):
-            newRecord.setValue(j, self.model.record(0).value(j))
+        if self.model.rowCount():
+            newRecord = self.model.record(0)
+        else:
+            newRecord = self.model.record()
 
         for i in range(self.model.rowCount()):
             record = self.model.record(i)
             for j in range(newRecord.count()):
-                value = record.value(j)
-                if newRecord.value(j) != value or not value:
+                # Images are compared without loading
+                value = record.storedValue(j)
+                if newRecord.storedValue(j) != value or not value:
                     newRecord.setNull(j)
 
         self.model.addCoin(newRecord, self)
@@ -473,8 +620,8 @@ class TreeView(QTreeWidget):
         for i in range(self.model.rowCount()):
             record = self.model.record(i)
             for j in range(multiRecord.count()):
-                value = record.value(j)
-                if multiRecord.value(j) != value or not value:
+                value = record.storedValue(j)
+                if multiRecord.storedValue(j) != value or not value:
                     multiRecord.setNull(j)
                     usedFields[j] = Qt.Unchecked
 
@@ -482,25 +629,33 @@ class TreeView(QTreeWidget):
         dialog = EditCoinDialog(self.model, multiRecord, self, usedFields)
         result = dialog.exec_()
         if result == QDialog.Accepted:
-            progressDlg = Gui.ProgressDialog(self.tr("Updating records"),
-                                self.tr("Cancel"), self.model.rowCount(), self)
-
-            # Fill records by used fields in multi record
             multiRecord = dialog.record
             usedFields = dialog.getUsedFields()
-            for i in range(self.model.rowCount()):
-                progressDlg.setValue(i)
-                if progressDlg.wasCanceled():
-                    break
 
-                record = self.model.record(i)
-                for j in range(multiRecord.count()):
-                    if usedFields[j] == Qt.Checked:
-                        record.setValue(j, multiRecord.value(j))
-                self.model.setRecord(i, record)
+            values = self.model.bulkValues(multiRecord, usedFields)
+            if values is not None:
+                ids = [self.model.recordId(i)
+                       for i in range(self.model.rowCount())]
+                self.model.updateRecords(ids, values)
+            else:
+                progressDlg = Gui.ProgressDialog(self.tr("Updating records"),
+                                    self.tr("Cancel"), self.model.rowCount(), self)
+
+                # Fill records by used fields in multi record
+                for i in range(self.model.rowCount()):
+                    progressDlg.setValue(i)
+                    if progressDlg.wasCanceled():
+                        break
+
+                    record = self.model.record(i)
+                    for j in range(multiRecord.count()):
+                        if (usedFields[j] == Qt.Checked and
+                                not multiRecord.isStored(j)):
+                            record.setValue(j, multiRecord.value(j))
+                    self.model.setRecord(i, record)
 
-            self.model.submitAll()
-            progressDlg.reset()
+                self.model.submitAll()
+                progressDlg.reset()
 
         self.model.setFilter(storedFilter)
 
@@ -639,6 +794,7 @@ class PageView(Splitter):
             self.prepareInfo()
 
         self._model.modelChanged.connect(self.modelChanged)
+        self._model.recordsChanged.connect(self.treeView.recordsChanged)
 
     def model(self):
         return self._model
@@ -90,10 +90,52 @@ class BaseReferenceSection(QtCore.QObject):
         self.sort = sort
         self.parent_name = None
 
+        self._icons = None
+
     def reload(self):
         self.getSort()
         self.setSort()
         self.model.select()
+        self.clearIcons()
+
+    def getIcon(self, value):
+        if self._icons is None:
+            self.__loadIcons()
+
+        icon = self._icons.get(value)
+        if isinstance(icon, QIcon):
+            return icon
+
+        if icon:
+            pixmap = QPixmap()
+            if pixmap.loadFromData(icon):
+                icon = QIcon(pixmap)
+            else:
+                icon = None
+            self._icons[value] = icon
+
+        return icon
+
+    def clearIcons(self, *_args):
+        self._icons = None
+
+    def __loadIcons(self):
+        # Load raw icons of whole section by one query, they are decoded
+        # on first request
+        self._icons = {}
+
+        sql = "SELECT value, icon FROM %s WHERE icon IS NOT NULL" % self.table_name
+        query = QSqlQuery(sql, self.db)
+        while query.next():
+            record = query.record()
+            self._icons[record.value(0)] = record.value(1)
+
+    def _connectModel(self):
+        # Any editing of section drops cached icons
+        self.model.dataChanged.connect(self.clearIcons)
+        self.model.rowsInserted.connect(self.clearIcons)
+        self.model.rowsRemoved.connect(self.clearIcons)
+        self.model.modelReset.connect(self.clearIcons)
 
     def button(self, parent=None):
         self.parent = parent
@@ -197,6 +239,7 @@ class ReferenceSection(BaseReferenceSection):
         self.model = SqlTableModel(None, db)
         self.model.setEditStrategy(QtSql.QSqlTableModel.OnFieldChange)
         self.model.setTable(self.table_name)
+        self._connectModel()
 
         self.reload()
 
@@ -249,6 +292,7 @@ class CrossReferenceSection(BaseReferenceSection):
         self.model.parentidIndex = parentidIndex
         self.model.setRelation(
             parentidIndex, QtSql.QSqlRelation(self.parent_table_name, 'id', 'value'))
+        self._connectModel()
 
         self.reload()
 
@@ -423,15 +467,6 @@ class Reference(QtCore.QObject):
         for section in self.sections:
             section.load(self.db)
 
-        self.sections_with_icons = []
-        for section in self.sections:
-            name = section.table_name
-            sql = "SELECT 1 FROM %s WHERE icon IS NOT NULL LIMIT 1" % name
-            query = QtSql.QSqlQuery(sql, self.db)
-            query.exec_()
-            if query.first():
-                self.sections_with_icons.append(name)
-
     def section(self, name):
         # NOTE: payplace and saleplace fields has one reference section =>
         # editing one of it should change another
@@ -463,26 +498,10 @@ class Reference(QtCore.QObject):
         return sectionNames
 
     def getIcon(self, section, value):
-        if section in ('payplace', 'saleplace'):
-            section = 'place'
-        elif section in ('obversecolor', 'reversecolor'):
-            section = 'color'
-        elif section in ('edge', 'signaturetype'):
-            section = 'edge'
-
-        table_name = "ref_%s" % section
-        if table_name in self.sections_with_icons:
-            sql = "SELECT icon FROM %s WHERE value=?" % table_name
-            query = QtSql.QSqlQuery(sql, self.db)
-            query.addBindValue(value)
-            query.exec_()
-            if query.first():
-                data = query.record().value(0)
-                if data:
-                    pixmap = QPixmap()
-                    if pixmap.loadFromData(data):
-                        icon = QIcon(pixmap)
-                        return icon
+        refSection = self.section(section)
+        if refSection:
+            return refSection.getIcon(value)
+
         return None
 
     def backup(self):
@@ -86,7 +86,8 @@ class Settings(BaseSettings):
                'colnect_skip_currency': True,
                'map_type': 0,
                'built_in_viewer': True,
-               'font_size': 0}
+               'font_size': 0,
+               'image_cache_size': 64}
 
     def __init__(self, autoSave=False):
         super().__init__(autoSave)
@@ -104,7 +105,8 @@ class Settings(BaseSettings):
             value = self.settings.value('mainwindow/' + key, self.Default[key],
                                         type=bool)
         elif key in ('images_by_default', 'autobackup_depth',
-                     'speedup', 'map_type', 'font_size'):
+                     'speedup', 'map_type', 'font_size',
+                     'image_cache_size'):
             value = self.settings.value('mainwindow/' + key, self.Default[key],
                                         type=int)
         else:
@@ -9,6 +9,7 @@ from OpenNumismat.Reports import Report
 from OpenNumismat.Tools.DialogDecorators import storeDlgSizeDecorator
 from OpenNumismat.Settings import Settings
 from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.Indexes import updateIndexes, dropIndexes
 from OpenNumismat.Collection.Import.Colnect import ColnectCache
 from OpenNumismat.EditCoinDialog.MapWidget import MapType
 from OpenNumismat.EditCoinDialog.MapWidget.GMapsWidget import gmapsAvailable
@@ -28,6 +29,8 @@ class MainSettingsPage(QWidget):
     def __init__(self, collection, parent=None):
         super().__init__(parent)
 
+        self.collection = collection
+
         settings = Settings()
 
         style = QApplication.style()
@@ -168,6 +171,14 @@ class MainSettingsPage(QWidget):
                                             QSizePolicy.Fixed)
         layout.addRow(self.tr("Font size"), self.fontSizeSelector)
 
+        self.imageCacheSize = QSpinBox(self)
+        self.imageCacheSize.setRange(8, 2048)
+        self.imageCacheSize.setSuffix(" MB")
+        self.imageCacheSize.setValue(settings['image_cache_size'])
+        self.imageCacheSize.setSizePolicy(QSizePolicy.Fixed,
+                                          QSizePolicy.Fixed)
+        layout.addRow(self.tr("Images cache size"), self.imageCacheSize)
+
         self.setLayout(layout)
 
     def backupButtonClicked(self):
@@ -203,17 +214,24 @@ class MainSettingsPage(QWidget):
         settings['map_type'] = self.mapSelector.currentData()
         settings['built_in_viewer'] = self.builtInViewer.isChecked()
         settings['font_size'] = self.fontSizeSelector.currentIndex()
+        settings['image_cache_size'] = self.imageCacheSize.value()
 
         settings.save()
 
+        self.collection.imageCache.setLimit(
+                                settings['image_cache_size'] * 1024 * 1024)
+
 
 class CollectionSettingsPage(QWidget):
 
     def __init__(self, collection, parent=None):
         super().__init__(parent)
 
+        self.collection = collection
         self.settings = collection.settings
         self.model = collection.model()
+        self.db = collection.db
+        self.fields = collection.fields
 
         layout = QFormLayout()
         layout.setRowWrapPolicy(QFormLayout.WrapLongRows)
@@ -255,6 +273,17 @@ class CollectionSettingsPage(QWidget):
         self.richText.setChecked(self.settings['rich_text'])
         layout.addRow(self.richText)
 
+        self.autoIndexes = QCheckBox(
+                    self.tr("Index fields used in tree, filters and lists"),
+                    self)
+        self.autoIndexes.setChecked(self.settings['auto_indexes'])
+        layout.addRow(self.autoIndexes)
+
+        self.externalImages = QCheckBox(
+                    self.tr("Store images in files next to collection"), self)
+        self.externalImages.setChecked(self.settings['external_images'])
+        layout.addRow(self.externalImages)
+
         gLayout = QGridLayout()
         statuses = QGroupBox(self.tr("Used statuses"), self)
         self.statusUsed = {}
@@ -288,12 +317,24 @@ class CollectionSettingsPage(QWidget):
         self.settings['images_at_bottom'] = self.imagesAtBottom.isChecked()
         self.settings['enable_bc'] = self.enableBC.isChecked()
         self.settings['rich_text'] = self.richText.isChecked()
+        old_auto_indexes = self.settings['auto_indexes']
+        self.settings['auto_indexes'] = self.autoIndexes.isChecked()
         self.settings['default_status'] = self.defaultStatus.currentData()
 
         for status in Statuses.Keys:
             self.settings[status + '_status_used'] = self.statusUsed[status].isChecked()
 
         self.settings.save()
+        self.collection.settingsChanged.emit()
+
+        if self.settings['auto_indexes'] != old_auto_indexes:
+            if self.settings['auto_indexes']:
+                updateIndexes(self.db, self.fields)
+            else:
+                dropIndexes(self.db)
+
+        if self.externalImages.isChecked() != self.settings['external_images']:
+            self.collection.setExternalImages(self.externalImages.isChecked())
 
         if self.settings['image_height'] != old_image_height:
             result = QMessageBox.question(self, self.tr("Settings"),
@@ -2,11 +2,11 @@ from textwrap import wrap
 
 from PyQt5.QtCore import Qt, QPoint, QMargins, QSize, QDateTime, QByteArray
 from PyQt5.QtGui import QImage, QIcon
-from PyQt5.QtSql import QSqlQuery
 from PyQt5.QtWidgets import *
 
 import OpenNumismat
 from OpenNumismat.Collection.CollectionFields import Statuses
+from OpenNumismat.Collection.StatisticsCache import StatisticsCache
 from OpenNumismat.Tools.Gui import getSaveFileName, ProgressDialog
 from OpenNumismat.Tools.Converters import numberWithFraction
 from OpenNumismat.Tools.CursorDecorators import waitCursorDecorator
@@ -431,6 +431,8 @@ class StatisticsView(QWidget):
 
     def setModel(self, model):
         self.model = model
+        self.cache = StatisticsCache(model, self)
+        self.cache.computed.connect(self.modelChanged)
 
         default_subfieldid = 0
         for field in self.model.fields.userFields:
@@ -494,23 +496,40 @@ class StatisticsView(QWidget):
     def clear(self):
         pass
 
-    def modelChanged(self):
+    def __setChart(self, chart):
         self.chartLayout.removeWidget(self.chart)
+        self.chart.deleteLater()
+        self.chart = chart
+        self.chartLayout.addWidget(self.chart)
+
+    def __chartRows(self, groups, aggregates, conditions=()):
+        rows = self.cache.cachedRows(groups, aggregates, conditions)
+        if rows is None:
+            # Chart will be redrawn when data is calculated
+            self.cache.compute(groups, aggregates, conditions)
+
+            label = QLabel(self.tr("Computing..."), self)
+            label.setAlignment(Qt.AlignCenter)
+            self.__setChart(label)
+
+        return rows
+
+    def modelChanged(self):
         chart = self.chartSelector.currentData()
         if chart == 'geochart':
-            self.chart = GeoChartCanvas(self)
+            canvas = GeoChartCanvas(self)
         elif chart == 'barh':
-            self.chart = BarHCanvas(self)
+            canvas = BarHCanvas(self)
         elif chart == 'pie':
-            self.chart = PieCanvas(self)
+            canvas = PieCanvas(self)
         elif chart == 'stacked':
-            self.chart = StackedBarCanvas(self)
+            canvas = StackedBarCanvas(self)
         elif chart == 'progress':
-            self.chart = ProgressCanvas(self)
+            canvas = ProgressCanvas(self)
         else:
-            self.chart = BarCanvas(self)
-        self.chart.setMulticolor(self.colorCheck.checkState() == Qt.Checked)
-        self.chartLayout.addWidget(self.chart)
+            canvas = BarCanvas(self)
+        canvas.setMulticolor(self.colorCheck.checkState() == Qt.Checked)
+        self.__setChart(canvas)
 
         fieldId = self.fieldSelector.currentData()
         field = self.model.fields.field(fieldId).name
@@ -518,22 +537,16 @@ class StatisticsView(QWidget):
             field = 'material,fineness'
         elif field == 'unit':
             field = 'value,unit'
-        filter_ = self.model.filter()
-        if filter_:
-            sql_filter = "WHERE %s" % filter_
-        else:
-            sql_filter = ""
+        fields = field.split(',')
 
         if chart == 'geochart':
-            sql = "SELECT count(*), country FROM coins %s GROUP BY country" % sql_filter
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
+            rows = self.__chartRows(['country'], ['count(*)'])
+            if rows is None:
+                return
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
+            for country, count in rows:
+                val = str(country)
                 xx.append(val)
                 yy.append(count)
 
@@ -541,25 +554,24 @@ class StatisticsView(QWidget):
         elif chart == 'stacked':
             subfieldId = self.subfieldSelector.currentData()
             subfield = self.model.fields.field(subfieldId).name
-            sql = "SELECT count(%s), %s, %s FROM coins %s GROUP BY %s, %s" % (
-                subfield, subfield, field, sql_filter, field, subfield)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
+            rows = self.__chartRows(fields + [subfield],
+                                    ['count(%s)' % subfield])
+            if rows is None:
+                return
             xx = []
             yy = []
             zz = []
             vv = {}
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(2))
+            for row in rows:
+                count = row[-1]
+                val = str(row[0])
                 if field == 'status':
                     val = Statuses[val]
                 elif field == 'value,unit':
-                    val = numberWithFraction(val)[0] + ' ' + str(record.value(3))
+                    val = numberWithFraction(val)[0] + ' ' + str(row[1])
                 elif ',' in field:
-                    val += ' ' + str(record.value(3))
-                subval = str(record.value(1))
+                    val += ' ' + str(row[1])
+                subval = str(row[-2])
                 if subfield == 'status':
                     subval = Statuses[subval]
 
@@ -620,60 +632,57 @@ class StatisticsView(QWidget):
                 elif period == 'day':
                     sql_filters.append("paydate > datetime('now', '-1 month')")
 
+            # Periods are grouped with year for chronological order
             if period == 'month':
                 date_format = '%m'
+                order_format = '%Y-%m'
             elif period == 'week':
                 date_format = '%W'
+                order_format = '%Y-%W'
             elif period == 'day':
                 date_format = '%d'
+                order_format = '%Y-%m-%d'
             else:
                 date_format = '%Y'
-
-            if filter_:
-                sql_filters.append(filter_)
+                order_format = '%Y'
 
             if items == 'created':
-                sql = "SELECT %s, strftime('%s', createdat) FROM coins"\
-                      " WHERE %s"\
-                      " GROUP BY strftime('%s', createdat) ORDER BY createdat" % (
-                          sql_field, date_format, ' AND '.join(sql_filters),
-                          date_format)
+                date_field = 'createdat'
             else:
-                sql = "SELECT %s, strftime('%s', paydate) FROM coins"\
-                      " WHERE %s"\
-                      " GROUP BY strftime('%s', paydate) ORDER BY paydate" % (
-                          sql_field, date_format, ' AND '.join(sql_filters),
-                          date_format)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
+                date_field = 'paydate'
+            groups = ["strftime('%s', %s)" % (order_format, date_field),
+                      "strftime('%s', %s)" % (date_format, date_field)]
+            rows = self.__chartRows(groups, [sql_field], sql_filters)
+            if rows is None:
+                return
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
-                xx.append(val)
-                yy.append(count)
+            for _order, val, count in rows:
+                val = str(val)
+                if val in xx:
+                    i = xx.index(val)
+                    yy[i] = (yy[i] or 0) + (count or 0)
+                else:
+                    xx.append(val)
+                    yy.append(count)
 
             self.chart.setData(xx, yy)
             self.chart.setLabelY(self.periodSelector.currentText())
         else:
-            sql = "SELECT count(*), %s FROM coins %s GROUP BY %s" % (
-                field, sql_filter, field)
-            query = QSqlQuery(self.model.database())
-            query.exec_(sql)
+            rows = self.__chartRows(fields, ['count(*)'])
+            if rows is None:
+                return
             xx = []
             yy = []
-            while query.next():
-                record = query.record()
-                count = record.value(0)
-                val = str(record.value(1))
+            for row in rows:
+                count = row[-1]
+                val = str(row[0])
                 if field == 'status':
                     val = Statuses[val]
                 elif field == 'value,unit':
-                    val = numberWithFraction(val)[0] + ' ' + str(record.value(2))
+                    val = numberWithFraction(val)[0] + ' ' + str(row[1])
                 elif ',' in field:
-                    val += ' ' + str(record.value(2))
+                    val += ' ' + str(row[1])
                 xx.append(val)
                 yy.append(count)
 
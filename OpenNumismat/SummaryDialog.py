@@ -11,6 +11,9 @@ from OpenNumismat.Tools.DialogDecorators import storeDlgSizeDecorator
 
 @storeDlgSizeDecorator
 class SummaryDialog(QDialog):
+    # Calculated summaries by collection revision and filter
+    _cache = {}
+    CACHE_SIZE = 32
 
     def __init__(self, model, parent=None):
         super().__init__(parent,
@@ -47,65 +50,138 @@ class SummaryDialog(QDialog):
         return sql
 
     def fillSummary(self, model, filter_=None):
-        lines = []
+        # Revision of collection is changed after each saving of coins and
+        # filter text is changed with content of temporary tables used by it
+        collection = model.collection
+        key = (collection.fileName, collection.dataRevision, filter_)
+        if key in SummaryDialog._cache:
+            return SummaryDialog._cache[key]
 
-        sql = "SELECT count(*) FROM coins"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            totalCount = query.record().value(0)
-            lines.append(self.tr("Total count: %d") % totalCount)
+        lines = self.calculateSummary(model, filter_)
+
+        if len(SummaryDialog._cache) >= self.CACHE_SIZE:
+            SummaryDialog._cache.clear()
+        SummaryDialog._cache[key] = lines
+
+        return lines
 
-        count_owned = 0
-        quantity_owned = 0
-        sql = "SELECT quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate')"
+    @staticmethod
+    def nonZero(column):
+        return "ifnull(%s,'') NOT IN ('', 0)" % column
+
+    def firstPrice(self, *prices):
+        cases = []
+        for column, factor in prices:
+            if factor == 1:
+                cases.append("WHEN %s THEN %s" % (self.nonZero(column), column))
+            else:
+                cases.append("WHEN %s THEN %s * %s" % (self.nonZero(column), column, factor))
+
+        return "(CASE %s ELSE 0 END)" % ' '.join(cases)
+
+    def estimationPrice(self):
+        price_unc = self.firstPrice(('price4', 1), ('price3', 1.6), ('price2', 2.2), ('price1', 5.5))
+        price_xf = self.firstPrice(('price3', 1), ('price4', 0.6), ('price2', 1.4), ('price1', 3.5))
+        price_vf = self.firstPrice(('price2', 1), ('price3', 0.7), ('price4', 0.45), ('price1', 2.5))
+        price_f = self.firstPrice(('price1', 1), ('price2', 0.4), ('price3', 0.3), ('price4', 0.18))
+        price_vg = self.firstPrice(('price1', 0.5), ('price2', 0.2), ('price3', 0.14), ('price4', 0.09))
+        price_any = self.firstPrice(('price4', 1), ('price3', 1), ('price2', 1), ('price1', 1))
+
+        grade = "substr(UPPER(grade), 1, 2)"
+        return """(CASE
+            WHEN %s IN ('UN', 'MS') THEN %s
+            WHEN %s IN ('XF', 'EF') THEN %s
+            WHEN %s IN ('AU') THEN %s + (%s - %s) * 0.6
+            WHEN %s IN ('VF') THEN %s
+            WHEN %s IN ('F', 'FI') THEN %s
+            WHEN %s IN ('VG') THEN %s
+            ELSE %s END)""" % (grade, price_unc, grade, price_xf,
+                               grade, price_xf, price_unc, price_xf,
+                               grade, price_vf, grade, price_f,
+                               grade, price_vg, price_any)
+
+    def calculateSummary(self, model, filter_=None):
+        lines = []
+
+        owned = "status IN ('owned', 'ordered', 'sale', 'duplicate')"
+        paid_status = "status IN ('owned', 'ordered', 'sale', 'sold', 'missing', 'duplicate')"
+        quantity = "CAST(ifnull(nullif(nullif(quantity, ''), 0), 1) AS INTEGER)"
+        gold = "%s AND %s" % (owned, self.materialFilter("Gold", self.tr("Gold"), "Au"))
+        silver = "%s AND %s" % (owned, self.materialFilter("Silver", self.tr("Silver"), "Ag"))
+        with_weight = "ifnull(fineness,'')<>'' AND ifnull(weight,'')<>''"
+        metal_weight = "weight * CAST('0.' || fineness AS REAL) * %s" % quantity
+        estimation = self.estimationPrice()
+        wish_estimation = self.firstPrice(('price4', 1), ('price3', 1), ('price2', 1), ('price1', 1))
+        estimated = "%s AND grade IS NOT NULL AND %s<>0" % (owned, estimation)
+        wish_estimated = "status='wish' AND %s<>0" % wish_estimation
+
+        aggregates = (
+            ('total', "count(*)"),
+            ('count_owned', "SUM(CASE WHEN %s THEN 1 ELSE 0 END)" % owned),
+            ('quantity_owned', "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (owned, quantity)),
+            ('count_gold', "SUM(CASE WHEN %s THEN 1 ELSE 0 END)" % gold),
+            ('quantity_gold', "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (gold, quantity)),
+            ('gold_weight', "SUM(CASE WHEN %s AND %s THEN %s ELSE 0 END)" % (gold, with_weight, metal_weight)),
+            ('gold_weight_count', "SUM(CASE WHEN %s AND %s THEN 1 ELSE 0 END)" % (gold, with_weight)),
+            ('gold_weight_quantity', "SUM(CASE WHEN %s AND %s THEN %s ELSE 0 END)" % (gold, with_weight, quantity)),
+            ('count_silver', "SUM(CASE WHEN %s THEN 1 ELSE 0 END)" % silver),
+            ('quantity_silver', "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (silver, quantity)),
+            ('silver_weight', "SUM(CASE WHEN %s AND %s THEN %s ELSE 0 END)" % (silver, with_weight, metal_weight)),
+            ('silver_weight_count', "SUM(CASE WHEN %s AND %s THEN 1 ELSE 0 END)" % (silver, with_weight)),
+            ('silver_weight_quantity', "SUM(CASE WHEN %s AND %s THEN %s ELSE 0 END)" % (silver, with_weight, quantity)),
+            ('count_wish', "SUM(CASE WHEN status='wish' THEN 1 ELSE 0 END)"),
+            ('count_sold', "SUM(CASE WHEN status='sold' THEN 1 ELSE 0 END)"),
+            ('count_bidding', "SUM(CASE WHEN status='bidding' THEN 1 ELSE 0 END)"),
+            ('count_missing', "SUM(CASE WHEN status='missing' THEN 1 ELSE 0 END)"),
+            ('paid', "SUM(CASE WHEN %s AND totalpayprice<>'' THEN totalpayprice END)" % paid_status),
+            ('paid_without_commission', "SUM(CASE WHEN %s AND payprice<>'' THEN payprice END)" % paid_status),
+            ('earned', "SUM(CASE WHEN status='sold' AND totalsaleprice<>'' THEN totalsaleprice END)"),
+            ('earn_without_commission', "SUM(CASE WHEN status='sold' AND saleprice<>'' THEN saleprice END)"),
+            ('paydate', "MIN(CASE WHEN %s AND paydate<>'' THEN paydate END)" % paid_status),
+            ('est_owned', "SUM(CASE WHEN %s THEN %s * %s ELSE 0 END)" % (estimated, estimation, quantity)),
+            ('est_owned_count', "SUM(CASE WHEN %s THEN 1 ELSE 0 END)" % estimated),
+            ('est_owned_quantity', "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (estimated, quantity)),
+            ('est_wish', "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (wish_estimated, wish_estimation)),
+            ('est_wish_count', "SUM(CASE WHEN %s THEN 1 ELSE 0 END)" % wish_estimated),
+        )
+
+        sql = "SELECT %s FROM coins" % ', '.join(['%s AS %s' % (expr, name) for name, expr in aggregates])
         sql = self.makeSql(sql, filter_)
         query = QSqlQuery(sql, model.database())
-        while query.next():
-            record = query.record()
-            quantity = int(record.value('quantity') or 1)
-            count_owned += 1
-            quantity_owned += quantity
+        if not query.first():
+            return lines
+
+        record = query.record()
+        values = {}
+        for name, _expr in aggregates:
+            values[name] = record.value(name)
+        # Sum by empty set of rows is NULL
+        for name in values:
+            if values[name] is None or values[name] == '':
+                if name not in ('paid', 'paid_without_commission', 'earned',
+                                'earn_without_commission', 'paydate'):
+                    values[name] = 0
+
+        lines.append(self.tr("Total count: %d") % values['total'])
+
+        count_owned = values['count_owned']
+        quantity_owned = values['quantity_owned']
         if count_owned == quantity_owned:
             lines.append(self.tr("Count owned: %d") % count_owned)
         else:
             lines.append(self.tr("Count owned: %d/%d") % (quantity_owned, count_owned))
 
-        count_gold = 0
-        quantity_gold = 0
-        gold_filter = self.materialFilter("Gold", self.tr("Gold"), "Au")
-        sql = "SELECT quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate') AND " \
-                "%s" % gold_filter
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        while query.next():
-            record = query.record()
-            quantity = int(record.value('quantity') or 1)
-            count_gold += 1
-            quantity_gold += quantity
+        count_gold = values['count_gold']
+        quantity_gold = values['quantity_gold']
         if count_gold:
             if count_gold == quantity_gold:
                 lines.append(self.tr("Gold coins: %d") % count_gold)
             else:
                 lines.append(self.tr("Gold coins: %d/%d") % (quantity_gold, count_gold))
-        
-        if count_gold:
-            sql = "SELECT fineness, weight, quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate') AND " \
-                    "%s AND " \
-                    "ifnull(fineness,'')<>'' AND ifnull(weight,'')<>''" % gold_filter
-            sql = self.makeSql(sql, filter_)
-            query = QSqlQuery(sql, model.database())
-            gold_weight = 0
-            gold_count = 0
-            gold_quantity = 0
-            while query.next():
-                record = query.record()
-                fineness = record.value('fineness')
-                weight = record.value('weight')
-                quantity = int(record.value('quantity') or 1)
-                gold_weight += float(weight) * float("0.%s" % fineness) * quantity
-                gold_count += 1
-                gold_quantity += quantity
+
+            gold_weight = values['gold_weight']
+            gold_count = values['gold_weight_count']
+            gold_quantity = values['gold_weight_quantity']
             if gold_weight:
                 if gold_count == gold_quantity:
                     comment = self.tr("(calculated for %d coins)") % gold_quantity
@@ -114,41 +190,17 @@ class SummaryDialog(QDialog):
                 gold_weight_str = locale.format_string("%.2f", gold_weight, grouping=True)
                 lines.append(' '.join((self.tr("Gold weight: %s gramm") % gold_weight_str, comment)))
 
-        count_silver = 0
-        quantity_silver = 0
-        silver_filter = self.materialFilter("Silver", self.tr("Silver"), "Ag")
-        sql = "SELECT quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate') AND " \
-                "%s" % silver_filter
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        while query.next():
-            record = query.record()
-            quantity = int(record.value('quantity') or 1)
-            count_silver += 1
-            quantity_silver += quantity
+        count_silver = values['count_silver']
+        quantity_silver = values['quantity_silver']
         if count_silver:
             if count_silver == quantity_silver:
                 lines.append(self.tr("Silver coins: %d") % count_silver)
             else:
                 lines.append(self.tr("Silver coins: %d/%d") % (quantity_silver, count_silver))
-        
-        if count_silver:
-            sql = "SELECT fineness, weight, quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate') AND " \
-                    "%s AND " \
-                    "ifnull(fineness,'')<>'' AND ifnull(weight,'')<>''" % silver_filter
-            sql = self.makeSql(sql, filter_)
-            query = QSqlQuery(sql, model.database())
-            silver_weight = 0
-            silver_count = 0
-            silver_quantity = 0
-            while query.next():
-                record = query.record()
-                fineness = record.value('fineness')
-                weight = record.value('weight')
-                quantity = int(record.value('quantity') or 1)
-                silver_weight += float(weight) * float("0.%s" % fineness) * quantity
-                silver_count += 1
-                silver_quantity += quantity
+
+            silver_weight = values['silver_weight']
+            silver_count = values['silver_weight_count']
+            silver_quantity = values['silver_weight_quantity']
             if silver_weight:
                 if silver_count == silver_quantity:
                     comment = self.tr("(calculated for %d coins)") % silver_quantity
@@ -157,173 +209,73 @@ class SummaryDialog(QDialog):
                 silver_weight_str = locale.format_string("%.2f", silver_weight, grouping=True)
                 lines.append(' '.join((self.tr("Silver weight: %s gramm") % silver_weight_str, comment)))
 
-        sql = "SELECT count(*) FROM coins WHERE status='wish'"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            lines.append(self.tr("Count wish: %d") % count)
+        lines.append(self.tr("Count wish: %d") % values['count_wish'])
 
-        count_sold = 0
-        sql = "SELECT count(*) FROM coins WHERE status='sold'"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count_sold = query.record().value(0)
-            if count_sold > 0:
-                lines.append(self.tr("Count sales: %d") % count_sold)
+        count_sold = values['count_sold']
+        if count_sold > 0:
+            lines.append(self.tr("Count sales: %d") % count_sold)
 
-        sql = "SELECT count(*) FROM coins WHERE status='bidding'"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            if count > 0:
-                lines.append(self.tr("Count biddings: %d") % count)
+        if values['count_bidding'] > 0:
+            lines.append(self.tr("Count biddings: %d") % values['count_bidding'])
 
-        sql = "SELECT count(*) FROM coins WHERE status='missing'"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            count = query.record().value(0)
-            if count > 0:
-                lines.append(self.tr("Count missing: %d") % count)
+        if values['count_missing'] > 0:
+            lines.append(self.tr("Count missing: %d") % values['count_missing'])
 
-        paid = 0
         commission = ""
-        sql = "SELECT SUM(totalpayprice) FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing', 'duplicate') AND totalpayprice<>'' AND totalpayprice IS NOT NULL"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            paid = query.record().value(0)
-            if paid:
-                sql = "SELECT SUM(payprice) FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing', 'duplicate') AND payprice<>'' AND payprice IS NOT NULL"
-                sql = self.makeSql(sql, filter_)
-                query = QSqlQuery(sql, model.database())
-                if query.first():
-                    paid_without_commission = query.record().value(0)
-                    if paid_without_commission:
-                        commission = self.tr("(commission %d%%)") % ((paid - paid_without_commission) / paid_without_commission * 100)
-                paid_str = locale.currency(paid, grouping=True, symbol=False)
-                lines.append(' '.join((self.tr("Paid: %s") % paid_str, commission)))
-
-                if count_owned:
-                    val = paid / count_owned
-                    val_str = locale.currency(val, grouping=True, symbol=False)
-                    lines.append(self.tr("Average paid per item: %s") % val_str)
-
-        earned = 0
+        paid = values['paid']
+        if paid:
+            paid_without_commission = values['paid_without_commission']
+            if paid_without_commission:
+                commission = self.tr("(commission %d%%)") % ((paid - paid_without_commission) / paid_without_commission * 100)
+            paid_str = locale.currency(paid, grouping=True, symbol=False)
+            lines.append(' '.join((self.tr("Paid: %s") % paid_str, commission)))
+
+            if count_owned:
+                val = paid / count_owned
+                val_str = locale.currency(val, grouping=True, symbol=False)
+                lines.append(self.tr("Average paid per item: %s") % val_str)
+
         commission = ""
-        sql = "SELECT SUM(totalsaleprice) FROM coins WHERE status='sold' AND totalsaleprice<>'' AND totalsaleprice IS NOT NULL"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            earned = query.record().value(0)
-            if earned:
-                sql = "SELECT SUM(saleprice) FROM coins WHERE status='sold' AND saleprice<>'' AND saleprice IS NOT NULL"
-                sql = self.makeSql(sql, filter_)
-                query = QSqlQuery(sql, model.database())
-                if query.first():
-                    earn_without_commission = query.record().value(0)
-                    if earn_without_commission:
-                        commission = self.tr("(commission %d%%)") % ((earn_without_commission - earned) / earn_without_commission * 100)
-                earned_str = locale.currency(earned, grouping=True, symbol=False)
-                lines.append(' '.join((self.tr("Earned: %s") % earned_str, commission)))
-
-                if count_sold:
-                    val = earned / count_sold
-                    val_str = locale.currency(val, grouping=True, symbol=False)
-                    lines.append(self.tr("Average earn per item: %s") % val_str)
+        earned = values['earned']
+        if earned:
+            earn_without_commission = values['earn_without_commission']
+            if earn_without_commission:
+                commission = self.tr("(commission %d%%)") % ((earn_without_commission - earned) / earn_without_commission * 100)
+            earned_str = locale.currency(earned, grouping=True, symbol=False)
+            lines.append(' '.join((self.tr("Earned: %s") % earned_str, commission)))
+
+            if count_sold:
+                val = earned / count_sold
+                val_str = locale.currency(val, grouping=True, symbol=False)
+                lines.append(self.tr("Average earn per item: %s") % val_str)
 
         if paid and earned:
             total = paid - earned
             total_str = locale.currency(total, grouping=True, symbol=False)
             lines.append(self.tr("Total (paid - earned): %s") % total_str)
 
-        sql = "SELECT paydate FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'sold', 'missing', 'duplicate') AND paydate<>'' AND paydate IS NOT NULL ORDER BY paydate LIMIT 1"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        if query.first():
-            date = QDate.fromString(query.record().value(0), Qt.ISODate)
+        if values['paydate']:
+            date = QDate.fromString(values['paydate'], Qt.ISODate)
             paydate = date.toString(Qt.SystemLocaleShortDate)
             lines.append(self.tr("First purchase: %s") % paydate)
 
-        sql = "SELECT UPPER(grade), price1, price2, price3, price4, quantity FROM coins WHERE status IN ('owned', 'ordered', 'sale', 'duplicate') AND (ifnull(price1,'')<>'' OR ifnull(price2,'')<>'' OR ifnull(price3,'')<>'' OR ifnull(price4,'')<>'')"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        est_owned = 0
-        count = 0
-        coins_quantity = 0
         comment = ""
-        while query.next():
-            record = query.record()
-            grade = record.value(0)
-            price1 = record.value(1)
-            price2 = record.value(2)
-            price3 = record.value(3)
-            price4 = record.value(4)
-            quantity = int(record.value(5) or 1)
-
-            try:
-                if grade[:2] in ('UN', 'MS'):
-                    price = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
-                elif grade[:2] in ('XF', 'EF'):
-                    price = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
-                elif grade[:2] in ('AU',):
-                    priceU = price4 if price4 else price3 * 1.6 if price3 else price2 * 2.2 if price2 else price1 * 5.5 if price1 else 0
-                    priceX = price3 if price3 else price4 * 0.6 if price4 else price2 * 1.4 if price2 else price1 * 3.5 if price1 else 0
-                    price = priceX + (priceU - priceX) * 0.6
-                elif grade[:2] in ('VF',):
-                    price = price2 if price2 else price3 * 0.7 if price3 else price4 * 0.45 if price4 else price1 * 2.5 if price1 else 0
-                elif grade[:2] in ('F', 'FI'):
-                    price = price1 if price1 else price2 * 0.4 if price2 else price3 * 0.3 if price3 else price4 * 0.18 if price4 else 0
-                elif grade[:2] in ('VG',):
-                    price = price1 * 0.5 if price1 else price2 * 0.2 if price2 else price3 * 0.14 if price3 else price4 * 0.09 if price4 else 0
-                else:
-                    price = price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
-
-                if price:
-                    est_owned += price * quantity
-                    count += 1
-                    coins_quantity += quantity
-
-            except TypeError:
-                continue
-
+        count = values['est_owned_count']
+        coins_quantity = values['est_owned_quantity']
         if count:
             if count == coins_quantity:
                 comment = self.tr("(calculated for %d coins)") % count
             else:
                 comment = self.tr("(calculated for %d/%d coins)") % (coins_quantity, count)
 
-        lines.append(' '.join((self.tr("Estimation owned: %d") % est_owned, comment)))
+        lines.append(' '.join((self.tr("Estimation owned: %d") % values['est_owned'], comment)))
 
-        sql = "SELECT price1, price2, price3, price4 FROM coins WHERE status='wish' AND (ifnull(price1,'')<>'' OR ifnull(price2,'')<>'' OR ifnull(price3,'')<>'' OR ifnull(price4,'')<>'')"
-        sql = self.makeSql(sql, filter_)
-        query = QSqlQuery(sql, model.database())
-        est_wish = 0
-        count = 0
         comment = ""
-        while query.next():
-            record = query.record()
-            price1 = record.value(0)
-            price2 = record.value(1)
-            price3 = record.value(2)
-            price4 = record.value(3)
-
-            price = price4 if price4 else price3 if price3 else price2 if price2 else price1 if price1 else 0
-
-            try:
-                if price:
-                    est_wish += price
-                    count += 1
-            except TypeError:
-                continue
-
+        count = values['est_wish_count']
         if count:
             comment = self.tr("(calculated for %d coins)") % count
 
-        lines.append(' '.join((self.tr("Estimation wish: %d") % est_wish, comment)))
+        lines.append(' '.join((self.tr("Estimation wish: %d") % values['est_wish'], comment)))
 
         sql = "SELECT count(*) FROM photos"
         sql = self.makeSql(sql, filter_)
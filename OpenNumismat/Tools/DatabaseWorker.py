@@ -0,0 +1,83 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtSql import QSqlDatabase
+
+
+# Thread running queries with own connection to collection file, so GUI
+# isn't blocked by long queries. Result of process() is sent by done signal
+# together with generation of request unless the worker was cancelled.
+# Result is None when database or query isn't available from other
+# connection - caller should do the work in main connection then.
+# Workers are started by submit(): only one worker of an owner runs at once,
+# running one is cancelled by newer request and only the latest request
+# waits for it, so superseded requests don't compete for collection file.
+class DatabaseWorker(QThread):
+    done = pyqtSignal(int, object)
+
+    _workers = set()  # keep running threads alive until they finish
+    _running = {}  # owner key -> running worker
+    _pending = {}  # owner key -> latest request waiting for running worker
+    _counter = 0
+
+    def __init__(self, fileName, generation):
+        super().__init__()
+
+        self.fileName = fileName
+        self.generation = generation
+        self._cancelled = False
+        self._owner = None
+
+        DatabaseWorker._counter += 1
+        self.connectionName = 'worker_%d' % DatabaseWorker._counter
+
+        self.finished.connect(self._release)
+
+    def submit(self, owner):
+        self._submit(id(owner))
+
+    def _submit(self, key):
+        self._owner = key
+
+        running = self._running.get(self._owner)
+        if running:
+            running.cancel()
+            self._pending[self._owner] = self
+        else:
+            self._running[self._owner] = self
+            self._workers.add(self)
+            self.start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def process(self, db):
+        raise NotImplementedError
+
+    def run(self):
+        result = self._run()
+        QSqlDatabase.removeDatabase(self.connectionName)
+
+        if not self._cancelled:
+            self.done.emit(self.generation, result)
+
+    def _run(self):
+        db = QSqlDatabase.addDatabase('QSQLITE', self.connectionName)
+        db.setDatabaseName(self.fileName)
+        if not db.open():
+            return None
+
+        result = self.process(db)
+        db.close()
+
+        return result
+
+    def _release(self):
+        self._workers.discard(self)
+
+        if self._running.get(self._owner) is self:
+            del self._running[self._owner]
+            pending = self._pending.pop(self._owner, None)
+            if pending and not pending.isCancelled():
+                pending._submit(self._owner)
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+
+# LRU cache of decoded pixmaps limited by memory usage. Pixmaps are stored
+# by image key (table name and image id), every key can also hold scaled
+# copies of an image - they are dropped together with it.
+class PixmapCache:
+
+    def __init__(self, limit):
+        self.limit = limit  # in bytes
+
+        self._items = OrderedDict()
+        self._cost = 0
+
+    @staticmethod
+    def pixmapCost(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def setLimit(self, limit):
+        self.limit = limit
+        self._trim()
+
+    def find(self, key, size=None):
+        pixmaps = self._items.get(key)
+        if pixmaps is None:
+            return None
+
+        self._items.move_to_end(key)
+        return pixmaps.get(size)
+
+    def insert(self, key, pixmap, size=None):
+        pixmaps = self._items.setdefault(key, {})
+        old = pixmaps.get(size)
+        if old is not None:
+            self._cost -= self.pixmapCost(old)
+
+        pixmaps[size] = pixmap
+        self._cost += self.pixmapCost(pixmap)
+        self._items.move_to_end(key)
+
+        self._trim()
+
+    def remove(self, key):
+        pixmaps = self._items.pop(key, None)
+        if pixmaps:
+            for pixmap in pixmaps.values():
+                self._cost -= self.pixmapCost(pixmap)
+
+    def clear(self):
+        self._items.clear()
+        self._cost = 0
+
+    def cost(self):
+        return self._cost
+
+    def _trim(self):
+        # Always keep last inserted item
+        while self._cost > self.limit and len(self._items) > 1:
+            _key, pixmaps = self._items.popitem(last=False)
+            for pixmap in pixmaps.values():
+                self._cost -= self.pixmapCost(pixmap)
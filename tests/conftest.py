@@ -0,0 +1,40 @@
+import pytest
+
+try:
+    from PyQt5 import QtSql, QtWidgets
+except ImportError:
+    # Tests require PyQt5 with SQLite driver
+    collect_ignore_glob = ['test_*.py']
+else:
+    from OpenNumismat.Collection.CollectionFields import CollectionFieldsBase
+    from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = QtWidgets.QApplication.instance()
+    if not app:
+        app = QtWidgets.QApplication(['test', '-platform', 'offscreen'])
+    return app
+
+
+@pytest.fixture
+def db(app):
+    # In-memory collection with coins table as created by Collection
+    db = QtSql.QSqlDatabase.addDatabase('QSQLITE', 'test')
+    db.setDatabaseName(':memory:')
+    assert db.open()
+
+    sqlFields = []
+    for field in CollectionFieldsBase():
+        if field.name == 'id':
+            sqlFields.append('id INTEGER PRIMARY KEY')
+        else:
+            sqlFields.append("%s %s" % (field.name, Type.toSql(field.type)))
+    QtSql.QSqlQuery("CREATE TABLE coins (" + ", ".join(sqlFields) + ")", db)
+
+    yield db
+
+    db.close()
+    del db
+    QtSql.QSqlDatabase.removeDatabase('test')
@@ -0,0 +1,41 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.CollectionPages import CollectionPages
+from OpenNumismat.Collection.Indexes import existingIndexes, indexName
+
+
+def test_tree_param_creates_index(db):
+    pages = CollectionPages(db)
+    page = pages.addPage("Coins")
+    fields = pages.fields
+
+    page.treeParam.clear()
+    page.treeParam.append(fields.mint)
+    page.treeParam.append(fields.year)
+    page.treeParam.save()
+
+    assert indexName(('mint', 'year')) in existingIndexes(db)
+
+    page.treeParam.clear()
+    page.treeParam.append(fields.material)
+    page.treeParam.save()
+
+    indexes = existingIndexes(db)
+    assert indexName(('material',)) in indexes
+    assert indexName(('mint', 'year')) not in indexes
+
+
+def test_disabled_auto_indexes(db):
+    QSqlQuery("CREATE TABLE settings (title CHAR NOT NULL UNIQUE,"
+              " value CHAR)", db)
+    QSqlQuery("INSERT INTO settings (title, value)"
+              " VALUES ('auto_indexes', 'False')", db)
+
+    pages = CollectionPages(db)
+    page = pages.addPage("Coins")
+
+    page.treeParam.clear()
+    page.treeParam.append(pages.fields.mint)
+    page.treeParam.save()
+
+    assert existingIndexes(db) == []
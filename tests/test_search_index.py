@@ -0,0 +1,62 @@
+import pytest
+
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection.SearchIndex import createSearchIndex, searchFilter
+from OpenNumismat.Collection.SearchIndex import isSearchIndexAvailable
+from OpenNumismat.Collection.SearchIndex import updateSearchIndex
+
+
+def found(db, text, columns):
+    query = QSqlQuery(db)
+    assert query.exec_("SELECT id FROM coins WHERE " +
+                       searchFilter(db, text, columns))
+    ids = []
+    while query.next():
+        ids.append(query.value(0))
+    return ids
+
+
+@pytest.fixture
+def coins(db):
+    if not createSearchIndex(db):
+        pytest.skip("SQLite without FTS5 trigram tokenizer")
+
+    QSqlQuery("INSERT INTO coins (id, title, catalognum1)"
+              " VALUES (1, 'One Dollar', 'KM# 123a')", db)
+    QSqlQuery("INSERT INTO coins (id, title, catalognum1)"
+              " VALUES (2, 'Ten Cents', 'KM# 45')", db)
+    return db
+
+
+def test_substring_inside_word(coins):
+    assert found(coins, 'llar', ['title']) == [1]
+    assert found(coins, 'DOLL', ['title']) == [1]
+
+
+def test_substring_of_catalog_number(coins):
+    assert found(coins, '23a', ['catalognum1']) == [1]
+    assert found(coins, '23a', ['title']) == []
+
+
+def test_short_text(coins):
+    assert found(coins, 'ce', ['title']) == [2]
+
+
+def test_updated_coin(coins):
+    QSqlQuery("UPDATE coins SET title='Five Cents' WHERE id=1", coins)
+    assert found(coins, 'llar', ['title']) == []
+    assert sorted(found(coins, 'cents', ['title'])) == [1, 2]
+
+
+def test_word_index_replaced(db):
+    QSqlQuery("CREATE VIRTUAL TABLE coins_search USING fts5(title,"
+              " content='coins', content_rowid='id', tokenize='unicode61')",
+              db)
+    QSqlQuery("INSERT INTO coins (id, title) VALUES (1, 'One Dollar')", db)
+
+    updateSearchIndex(db)
+    if not isSearchIndexAvailable(db):
+        pytest.skip("SQLite without FTS5 trigram tokenizer")
+
+    assert found(db, 'llar', ['title']) == [1]
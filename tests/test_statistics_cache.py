@@ -0,0 +1,39 @@
+from PyQt5.QtSql import QSqlQuery
+
+from OpenNumismat.Collection import StatisticsCache
+from OpenNumismat.Collection.StatisticsCache import aggregate
+
+
+class Worker:
+
+    def __init__(self, cancelled=False):
+        self.cancelled = cancelled
+
+    def isCancelled(self):
+        return self.cancelled
+
+
+def fillCoins(db):
+    query = QSqlQuery(db)
+    query.prepare("INSERT INTO coins (id, country, payprice) VALUES (?, ?, ?)")
+    for i in range(1, 101):
+        query.addBindValue(i * 7)
+        query.addBindValue(('Canada', 'Russia', None)[i % 3])
+        query.addBindValue(i if i % 5 else None)
+        query.exec_()
+
+
+def test_worker_aggregates_by_parts(db, monkeypatch):
+    fillCoins(db)
+    args = (db, ['country'], ['SUM(payprice)'], ["status IS NULL"], 'coins')
+
+    expected = aggregate(*args)
+    monkeypatch.setattr(StatisticsCache, 'AGGREGATE_PART', 9)
+
+    assert aggregate(*args, worker=Worker()) == expected
+    assert aggregate(*args, worker=Worker(cancelled=True)) is None
+
+
+def test_worker_aggregates_empty_table(db):
+    assert aggregate(db, ['country'], ['SUM(payprice)'], [], 'coins',
+                     worker=Worker()) == {}
@@ -1,17 +1,15 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import codecs
-import json
 import os
 import sys
 
 from PyQt5.QtCore import QStandardPaths, QTranslator
 from PyQt5.QtWidgets import QApplication, QFileDialog
-from OpenNumismat.Collection.CollectionFields import FieldTypes as Type
 
 sys.path.append('..')
 from OpenNumismat.Collection.Collection import Collection
+from OpenNumismat.Collection.JsonImport import JsonImporter
 
 app = QApplication(sys.argv)
 
@@ -25,14 +23,15 @@ PRJ_PATH = os.path.abspath(os.path.join(
 
 json_file_name, _selectedFilter = QFileDialog.getOpenFileName(None,
                 "Open collection", HOME_PATH,
-                "Collections (*.json)")
+                "Collections (*.json *.ndjson *.zip)")
 if json_file_name:
-    file_name = json_file_name.replace('.json', '.db')
-    json_file = codecs.open(json_file_name, "r", "utf-8")
-    data = json.load(json_file)
+    file_name = os.path.splitext(json_file_name)[0] + '.db'
 
-    if 'lang' in data['description']:
-        lang = data['description']['lang']
+    importer = JsonImporter(json_file_name)
+    description = importer.open()
+
+    if 'lang' in description:
+        lang = description['lang']
         translator = QTranslator()
         translator.load('lang_' + lang, PRJ_PATH)
         app.installTranslator(translator)
@@ -40,31 +39,13 @@ if json_file_name:
     collection = Collection(None)
     collection.create(file_name)
 
-    image_path = file_name.replace('.db', '_images')
-
     desc = collection.getDescription()
-    desc.author = data['description']['author']
-    desc.title = data['description']['title']
-    desc.description = data['description']['description']
+    desc.author = description.get('author', '')
+    desc.title = description.get('title', '')
+    desc.description = description.get('description', '')
     desc.save()
 
-    model = collection.model()
-    for coin_data in data['coins']:
-        coin = model.record()
-        for field, value in coin_data.items():
-            if field in ('obverseimg', 'reverseimg', 'edgeimg',
-                         'photo1', 'photo2', 'photo3', 'photo4'):
-                img_file_name = os.path.join(image_path, value)
-                img_file = open(img_file_name, 'rb')
-                image = img_file.read()
-                img_file.close()
-                coin.setValue(field, image)
-            else:
-                coin.setValue(field, value)
-
-        model.insertRecord(-1, coin)
-
-    print("Saving...")
-    model.submitAll()
+    count = importer.importData(collection.model())
+    importer.close()
 
-    print("Processed %d coins" % model.rowCount())
+    print("Processed %d coins" % count)